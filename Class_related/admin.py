@@ -1,11 +1,23 @@
 from django.contrib import admin
 from django import forms
+from django.db.models import Prefetch
 from django.urls import path
 from django.utils.translation import gettext_lazy as _
-from .models import Grade, Attendance, AttendanceHistory
+from .models import Grade, GradeSchedule, Attendance, AttendanceHistory, AttendanceJob, AttendanceRecord
+from .records import build_records, one_row_per_student
+from .scheduler import notify_schedule_changed
+from .sheets import open_sheet
 from People.models import Student
+from People.pagination import EstimatedCountAdminMixin
+
+class GradeScheduleInline(admin.TabularInline):
+    model = GradeSchedule
+    fields = ('weekday', 'start_time', 'next_occurrence')
+    readonly_fields = ('next_occurrence',)
+    extra = 0
 
 class GradeAdmin(admin.ModelAdmin):
+    inlines = [GradeScheduleInline]
     list_display = ('name', 'reset_time', 'class_time', 'lesson_duration', 'weekdays', 'student_list')
     list_editable = ('reset_time', 'class_time', 'lesson_duration')
     fieldsets = (
@@ -14,13 +26,17 @@ class GradeAdmin(admin.ModelAdmin):
         }),
         (_('Class Schedule'), {
             'fields': ('class_time', 'lesson_duration', 'weekdays'),
-            'description': _('Define the class schedule for automatic attendance generation')
+            'description': _('Define the class schedule for automatic attendance generation. '
+                             'Use the class schedules below for additional sessions.')
         }),
     )
 
+    def get_queryset(self, request):
+        students = Student.objects.only('id', 'first_name', 'last_name', 'grade_id').order_by('last_name', 'first_name')
+        return super().get_queryset(request).prefetch_related(Prefetch('student_set', queryset=students))
+
     def student_list(self, obj):
-        students = Student.objects.filter(grade=obj)
-        return ", ".join([str(student) for student in students])
+        return ", ".join([str(student) for student in obj.student_set.all()])
     student_list.short_description = _('Students')
 
 class AttendanceForm(forms.ModelForm):
@@ -32,25 +48,21 @@ class AttendanceForm(forms.ModelForm):
 
     def save(self, commit=True):
         instance = super().save(commit=False)
-        selected_grade = self.cleaned_data['grade']
-        students = Student.objects.filter(grade=selected_grade, active=True)
-        
-        attendance_records = [
-            Attendance(student=student, grade=selected_grade, present=False)
-            for student in students
-        ]
-        Attendance.objects.bulk_create(attendance_records)
+        open_sheet(self.cleaned_data['grade'])
+        notify_schedule_changed()
         return instance
 
-class AttendanceAdmin(admin.ModelAdmin):
+class AttendanceAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     form = AttendanceForm
     list_display = ('student', 'grade', 'present', 'timestamp')
     list_filter = ('grade', 'present')
+    list_select_related = ('student', 'grade')
 
     def save_attendance_list(self, request, queryset):
         attendance_records = []
         grade = None
-        for obj in queryset:
+        rows = one_row_per_student(queryset.select_related('student').order_by('id'))
+        for obj in rows:
             attendance_records.append({
                 'first_name': obj.student.first_name,
                 'last_name': obj.student.last_name,
@@ -59,7 +71,8 @@ class AttendanceAdmin(admin.ModelAdmin):
             grade = obj.grade
         
         if grade:
-            AttendanceHistory.objects.create(attendance_records=attendance_records, grade=grade)
+            history = AttendanceHistory.objects.create(attendance_records=attendance_records, grade=grade)
+            AttendanceRecord.objects.bulk_create(build_records(history, rows, AttendanceRecord))
             self.message_user(request, _("Attendance list saved successfully."))
         else:
             self.message_user(request, _("No grade found to save."), level="error")
@@ -72,17 +85,47 @@ class AttendanceAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         pass
 
-class AttendanceHistoryAdmin(admin.ModelAdmin):
+class AttendanceHistoryAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ('attendance_date', 'grade', 'present_students_list', 'absent_students_list')
+    list_select_related = ('grade',)
+
+    def get_queryset(self, request):
+        # The names come from the records, so the JSON blob isn't loaded.
+        records = AttendanceRecord.objects.only('history_id', 'first_name', 'last_name', 'present').order_by('id')
+        return (
+            super().get_queryset(request)
+            .defer('attendance_records')
+            .prefetch_related(Prefetch('records', queryset=records))
+        )
+
+    def _student_names(self, obj, present):
+        return ", ".join(record.student_name for record in obj.records.all() if record.present == present)
 
     def present_students_list(self, obj):
-        return ", ".join(obj.present_students)
+        return self._student_names(obj, True)
     present_students_list.short_description = _('Present Students')
 
     def absent_students_list(self, obj):
-        return ", ".join(obj.absent_students)
+        return self._student_names(obj, False)
     absent_students_list.short_description = _('Absent Students')
 
+class AttendanceRecordAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+    list_display = ('date', 'grade', 'student_name', 'present')
+    list_filter = ('present', 'grade')
+    list_select_related = ('grade',)
+    date_hierarchy = 'date'
+    raw_id_fields = ('history', 'student')
+
+class AttendanceJobAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+    list_display = ('created_at', 'kind', 'state', 'duration', 'idempotency_key')
+    list_filter = ('kind', 'state')
+    readonly_fields = ('id', 'kind', 'idempotency_key', 'state', 'created_at', 'started_at', 'finished_at', 'results', 'output', 'error')
+
+    def has_add_permission(self, request):
+        return False
+
 admin.site.register(Grade, GradeAdmin)
 admin.site.register(Attendance, AttendanceAdmin)
 admin.site.register(AttendanceHistory, AttendanceHistoryAdmin)
+admin.site.register(AttendanceRecord, AttendanceRecordAdmin)
+admin.site.register(AttendanceJob, AttendanceJobAdmin)
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class ClassRelatedConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Class_related'
+
+    def ready(self):
+        from .scheduler import schedule_changed
+
+        for model_name in ('Grade', 'GradeSchedule'):
+            model = self.get_model(model_name)
+            post_save.connect(schedule_changed, sender=model, dispatch_uid=f'schedule_changed_save_{model_name}')
+            post_delete.connect(schedule_changed, sender=model, dispatch_uid=f'schedule_changed_delete_{model_name}')
@@ -0,0 +1,199 @@
+"""
+Scanner check-in service.
+
+A scan carries a student UUID. The service resolves it against a cached map
+of open attendance rows (``student uuid -> (attendance id, student name)``)
+and marks the row present with a single conditional UPDATE, so the common
+case costs one query. The map is rebuilt from the database when it is
+missing or when a scan hits a stale entry, so the result is correct even
+when another process opened or closed a sheet without invalidating this
+process's cache.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.functions import Now
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .live import publish_attendance_changes
+from .models import Attendance
+
+OPEN_ATTENDANCE_CACHE_KEY = 'class_related:open_attendance_map'
+OPEN_ATTENDANCE_CACHE_TIMEOUT = 60  # seconds
+MAX_BATCH_SIZE = 500
+
+# Check-in outcomes
+MARKED_PRESENT = 'present'
+ALREADY_PRESENT = 'already_present'
+NO_OPEN_SHEET = 'no_open_sheet'
+UNKNOWN_STUDENT = 'unknown'
+
+
+class CheckInResult:
+    """Outcome of a single scan."""
+
+    def __init__(self, status, attendance_id=None, student_name=''):
+        self.status = status
+        self.attendance_id = attendance_id
+        self.student_name = student_name
+
+    @property
+    def match(self):
+        return self.status in (MARKED_PRESENT, ALREADY_PRESENT)
+
+    def as_dict(self):
+        return {
+            'status': self.status,
+            'match': self.match,
+            'attendance_id': self.attendance_id,
+            'student_name': self.student_name,
+        }
+
+
+def _load_open_attendance_map():
+    rows = Attendance.objects.filter(student__isnull=False).values_list(
+        'student__uuid', 'id', 'student__first_name', 'student__last_name'
+    )
+    open_map = {
+        str(student_uuid): (attendance_id, f'{first_name} {last_name}')
+        for student_uuid, attendance_id, first_name, last_name in rows
+    }
+    cache.set(OPEN_ATTENDANCE_CACHE_KEY, open_map, OPEN_ATTENDANCE_CACHE_TIMEOUT)
+    return open_map
+
+
+def get_open_attendance_map(refresh=False):
+    """Return the cached uuid -> (attendance id, name) map of open rows."""
+    open_map = None if refresh else cache.get(OPEN_ATTENDANCE_CACHE_KEY)
+    if open_map is None:
+        open_map = _load_open_attendance_map()
+    return open_map
+
+
+def invalidate_open_attendance_cache():
+    """Call whenever attendance sheets are opened or closed."""
+    cache.delete(OPEN_ATTENDANCE_CACHE_KEY)
+
+
+def normalize_uuid(text):
+    """Return the canonical string form of ``text`` or None if it is not a UUID."""
+    try:
+        return str(uuid.UUID(str(text).strip()))
+    except ValueError:
+        return None
+
+
+def _unmatched(student_uuid):
+    from People.models import Student
+
+    if Student.objects.filter(uuid=student_uuid).exists():
+        return CheckInResult(NO_OPEN_SHEET)
+    return CheckInResult(UNKNOWN_STUDENT)
+
+
+def check_in(text):
+    """
+    Mark the student identified by the scanned ``text`` as present on their
+    open attendance sheet and return a CheckInResult.
+    """
+    student_uuid = normalize_uuid(text)
+    if student_uuid is None:
+        return CheckInResult(UNKNOWN_STUDENT)
+
+    for refresh in (False, True):
+        entry = get_open_attendance_map(refresh=refresh).get(student_uuid)
+        if entry is None:
+            if refresh:
+                return _unmatched(student_uuid)
+            # The cached map may predate the sheet; reload it once.
+            continue
+
+        attendance_id, student_name = entry
+        if Attendance.objects.filter(id=attendance_id, present=False).update(present=True, checked_in_at=Now()):
+            publish_attendance_changes([attendance_id], True)
+            return CheckInResult(MARKED_PRESENT, attendance_id, student_name)
+        if Attendance.objects.filter(id=attendance_id).exists():
+            return CheckInResult(ALREADY_PRESENT, attendance_id, student_name)
+        # The row was closed since the map was cached; reload and retry.
+
+    return _unmatched(student_uuid)
+
+
+def _parse_scanned_at(value):
+    try:
+        scanned_at = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        # Well formed but impossible, e.g. 2024-02-30T10:00:00
+        scanned_at = None
+    if scanned_at is None:
+        return timezone.now()
+    if timezone.is_naive(scanned_at):
+        scanned_at = timezone.make_aware(scanned_at)
+    return scanned_at
+
+
+def check_in_batch(events):
+    """
+    Apply a batch of scan events, each a dict with ``uuid``, ``scanned_at``
+    (ISO 8601, optional) and ``device_id`` (optional).
+
+    All rows are marked present in one transaction with a single bulk UPDATE.
+    Returns one result dict per event, in order. A UUID repeated within the
+    batch is marked by its first occurrence and reported as already present
+    afterwards.
+    """
+    results = [None] * len(events)
+    pending = {}  # index -> normalized uuid
+    for index, event in enumerate(events):
+        student_uuid = normalize_uuid(event.get('uuid', ''))
+        if student_uuid is None:
+            results[index] = CheckInResult(UNKNOWN_STUDENT)
+        else:
+            pending[index] = student_uuid
+
+    open_map = get_open_attendance_map()
+    if any(student_uuid not in open_map for student_uuid in pending.values()):
+        open_map = get_open_attendance_map(refresh=True)
+
+    with transaction.atomic():
+        attendance_ids = {open_map[u][0] for u in pending.values() if u in open_map}
+        rows = Attendance.objects.select_for_update().in_bulk(attendance_ids)
+        if len(rows) < len(attendance_ids):
+            # Some cached rows were closed meanwhile; reload and lock the current ones.
+            open_map = get_open_attendance_map(refresh=True)
+            attendance_ids = {open_map[u][0] for u in pending.values() if u in open_map}
+            rows = Attendance.objects.select_for_update().in_bulk(attendance_ids)
+
+        to_update = {}
+        for index, student_uuid in pending.items():
+            entry = open_map.get(student_uuid)
+            attendance = rows.get(entry[0]) if entry else None
+            if attendance is None:
+                continue
+            if attendance.present:
+                results[index] = CheckInResult(ALREADY_PRESENT, attendance.id, entry[1])
+            else:
+                attendance.present = True
+                attendance.checked_in_at = _parse_scanned_at(events[index].get('scanned_at'))
+                to_update[attendance.id] = attendance
+                results[index] = CheckInResult(MARKED_PRESENT, attendance.id, entry[1])
+
+        if to_update:
+            Attendance.objects.bulk_update(to_update.values(), ['present', 'checked_in_at'])
+            publish_attendance_changes(to_update, True)
+
+    unmatched = {u for i, u in pending.items() if results[i] is None}
+    if unmatched:
+        from People.models import Student
+
+        known = {str(u) for u in Student.objects.filter(uuid__in=unmatched).values_list('uuid', flat=True)}
+        for index, student_uuid in pending.items():
+            if results[index] is None:
+                results[index] = CheckInResult(NO_OPEN_SHEET if student_uuid in known else UNKNOWN_STUDENT)
+
+    return [
+        dict(result.as_dict(), uuid=event.get('uuid'), device_id=event.get('device_id'))
+        for event, result in zip(events, results)
+    ]
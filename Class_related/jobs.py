@@ -0,0 +1,138 @@
+"""
+Attendance job queue.
+
+The trigger API used to run ``generate_attendance``/``autosave_attendance``
+inside the request, tying up a gunicorn worker for the whole run. Requests
+now only record an ``AttendanceJob`` and return; the command runs on a small
+thread pool in the web process once the job row is committed. Job state is
+kept in the database, so any web worker can report it.
+
+An optional idempotency key makes retried submissions return the original
+job instead of running the command again.
+
+A restarted web worker loses the jobs its pool had not finished. Jobs still
+queued or running after ``ATTENDANCE_JOB_TIMEOUT`` seconds are therefore
+marked failed and release their idempotency key, so a retry starts a new
+run instead of returning the abandoned job forever.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core import management
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AttendanceJob
+
+logger = logging.getLogger(__name__)
+
+JOB_COMMANDS = {
+    AttendanceJob.GENERATE: 'generate_attendance',
+    AttendanceJob.AUTOSAVE: 'autosave_attendance',
+}
+
+ABANDONED_ERROR = 'The worker running this job stopped before it finished.'
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'ATTENDANCE_JOB_WORKERS', 2),
+            thread_name_prefix='attendance-job',
+        )
+    return _executor
+
+
+def fail_stale_jobs(now=None):
+    """
+    Mark jobs queued or running for longer than ``ATTENDANCE_JOB_TIMEOUT``
+    as failed and clear their idempotency key. Returns the number of jobs.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, 'ATTENDANCE_JOB_TIMEOUT', 1800))
+    return AttendanceJob.objects.filter(
+        Q(state=AttendanceJob.QUEUED, created_at__lt=cutoff)
+        | Q(state=AttendanceJob.RUNNING, started_at__lt=cutoff)
+    ).update(state=AttendanceJob.FAILED, error=ABANDONED_ERROR, finished_at=now, idempotency_key=None)
+
+
+def submit_job(kind, idempotency_key=None):
+    """
+    Queue a job of ``kind``. Returns ``(job, created)``; ``created`` is False
+    when a job with the same idempotency key already exists.
+    """
+    fail_stale_jobs()
+    if idempotency_key:
+        existing = AttendanceJob.objects.filter(kind=kind, idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+
+    try:
+        with transaction.atomic():
+            job = AttendanceJob.objects.create(kind=kind, idempotency_key=idempotency_key or None)
+    except IntegrityError:
+        # A concurrent retry created the job first
+        return AttendanceJob.objects.get(kind=kind, idempotency_key=idempotency_key), False
+
+    if getattr(settings, 'ATTENDANCE_JOBS_EAGER', False):
+        transaction.on_commit(lambda: run_job(job.id))
+    else:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.id))
+    return job, True
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # Pool threads hold their own connection; don't leave it open idle.
+        connection.close()
+
+
+def run_job(job_id):
+    """Run a queued job and record its outcome."""
+    claimed = AttendanceJob.objects.filter(id=job_id, state=AttendanceJob.QUEUED).update(
+        state=AttendanceJob.RUNNING, started_at=timezone.now(),
+    )
+    if not claimed:
+        return
+    job = AttendanceJob.objects.get(id=job_id)
+
+    command = management.load_command_class('Class_related', JOB_COMMANDS[job.kind])
+    output = StringIO()
+    try:
+        management.call_command(command, stdout=output)
+    except Exception as e:
+        logger.error(f'Attendance job {job.id} ({job.kind}) failed: {e}', exc_info=True)
+        job.state = AttendanceJob.FAILED
+        job.error = str(e)
+    else:
+        job.state = AttendanceJob.SUCCEEDED
+    job.results = getattr(command, 'results', [])
+    job.output = output.getvalue()
+    job.finished_at = timezone.now()
+    # Leave the outcome alone if the job was given up on meanwhile
+    AttendanceJob.objects.filter(id=job.id, state=AttendanceJob.RUNNING).update(
+        state=job.state, error=job.error, results=job.results, output=job.output, finished_at=job.finished_at,
+    )
+
+
+def job_as_dict(job):
+    return {
+        'job_id': str(job.id),
+        'kind': job.kind,
+        'state': job.state,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'duration': job.duration,
+        'results': job.results,
+        'error': job.error or None,
+    }
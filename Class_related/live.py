@@ -0,0 +1,172 @@
+"""
+Live attendance updates.
+
+Attendance changes (scans, manual marking, sheets opened or closed) are
+published to a broker once their transaction commits, and the attendance
+page follows them through a server-sent events stream (``attendance_stream``)
+served by the ASGI application.
+
+The broker is pluggable through the ``ATTENDANCE_LIVE_BROKER`` setting:
+
+- ``InProcessBroker`` (default) fans messages out to the streams of the
+  current process. Enough for a single ASGI process.
+- ``PostgresBroker`` sends messages with ``NOTIFY`` and every process
+  relays the ones it ``LISTEN``s to its own streams, so check-ins handled
+  by any worker, the scheduler or the job queue reach every board.
+
+Messages are small JSON-serializable dicts:
+``{'type': 'attendance', 'ids': [...], 'present': ...}`` for row changes
+(``grade_id`` instead of ``ids`` when a whole sheet changed) and
+``{'type': 'sheet', 'grade_id': ..., 'action': 'opened'|'closed'}``.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+ATTENDANCE_CHANNEL = 'attendance_live'
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Seconds to wait before reconnecting a dropped LISTEN connection
+LISTEN_RETRY_DELAY = 5
+
+
+class InProcessBroker:
+    """Publish/subscribe between threads and event loops of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> set of (loop, queue)
+
+    def subscribe(self, channel):
+        """Register a subscriber on the running event loop and return its queue."""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(SUBSCRIBER_QUEUE_SIZE))
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        with self._lock:
+            self._subscribers.get(channel, set()).discard(subscriber)
+
+    def publish(self, channel, message):
+        """Deliver ``message`` to every subscriber of ``channel``. Thread-safe."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, message)
+            except RuntimeError:
+                # The subscriber's loop is closed; it will unsubscribe itself.
+                pass
+
+    @staticmethod
+    def _deliver(queue, message):
+        if queue.full():
+            # A stalled client loses its oldest update rather than blocking others.
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Relays messages between processes through PostgreSQL NOTIFY. A listener
+    thread with its own connection is started on the first subscription and
+    reconnects whenever that connection drops.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, channel, message):
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [channel, json.dumps(message)])
+
+    def subscribe(self, channel):
+        self._ensure_listener(channel)
+        return super().subscribe(channel)
+
+    def _ensure_listener(self, channel):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, args=(channel,), daemon=True)
+                self._listener.start()
+
+    def _listen(self, channel):
+        while True:
+            try:
+                self._listen_once(channel)
+            except Exception:
+                logger.exception('Live attendance listener lost its connection, reconnecting')
+            time.sleep(LISTEN_RETRY_DELAY)
+
+    def _listen_once(self, channel):
+        from django.db import connection
+
+        raw = connection.get_new_connection(connection.get_connection_params())
+        try:
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {channel}')
+            while True:
+                if not select.select([raw], [], [], 60)[0]:
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    notify = raw.notifies.pop(0)
+                    InProcessBroker.publish(self, notify.channel, json.loads(notify.payload))
+        finally:
+            raw.close()
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        path = getattr(settings, 'ATTENDANCE_LIVE_BROKER', 'Class_related.live.InProcessBroker')
+        _broker = import_string(path)()
+    return _broker
+
+
+def _publish_on_commit(message):
+    def send():
+        try:
+            get_broker().publish(ATTENDANCE_CHANNEL, message)
+        except Exception:
+            logger.exception('Could not publish live attendance update')
+
+    transaction.on_commit(send)
+
+
+def publish_attendance_changes(attendance_ids, present, grade_id=None):
+    """
+    Announce that the given attendance rows (or the whole sheet of
+    ``grade_id``) were marked present/absent.
+    """
+    attendance_ids = list(attendance_ids)
+    if grade_id is not None:
+        _publish_on_commit({'type': 'attendance', 'grade_id': grade_id, 'present': present})
+    elif attendance_ids:
+        _publish_on_commit({'type': 'attendance', 'ids': attendance_ids, 'present': present})
+
+
+def publish_sheet_change(grade_id, action):
+    """Announce that the sheet of ``grade_id`` was opened or closed."""
+    _publish_on_commit({'type': 'sheet', 'grade_id': grade_id, 'action': action})
+
+
+def format_event(message):
+    """Encode ``message`` as a server-sent event."""
+    return f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
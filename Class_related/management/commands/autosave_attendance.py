@@ -1,7 +1,8 @@
+import time
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from Class_related.models import Grade, Attendance, AttendanceHistory
-from datetime import datetime, timedelta
+from Class_related.sheets import close_sheet, due_sheets
 
 
 class Command(BaseCommand):
@@ -13,67 +14,53 @@ class Command(BaseCommand):
             action='store_true',
             help='Force save all existing attendance sheets',
         )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list the sheets that would be saved',
+        )
 
     def handle(self, *args, **options):
         """
         Save and clear attendance sheets for grades whose lesson duration has elapsed
         """
         force = options.get('force', False)
+        dry_run = options.get('dry_run', False)
         now = timezone.now()
-        
-        # Get all grades
-        grades = Grade.objects.all()
-        
+        started = time.monotonic()
+        # Per-grade outcome, read by the attendance job runner
+        self.results = []
+
+        # One aggregate query finds every due sheet
+        grades = due_sheets(now, force=force)
+        lookup_ms = (time.monotonic() - started) * 1000
+
+        total = 0
         for grade in grades:
-            # Check if there are any attendance records for this grade
-            attendances = Attendance.objects.filter(grade=grade)
-            
-            if not attendances.exists():
-                continue
-            
-            # Get the oldest attendance timestamp for this grade
-            oldest_attendance = attendances.order_by('timestamp').first()
-            
-            if not oldest_attendance or not oldest_attendance.timestamp:
-                continue
-            
-            # Calculate elapsed time since attendance was created
-            elapsed_time = now - oldest_attendance.timestamp
-            lesson_duration_hours = grade.lesson_duration
-            
-            # Check if lesson duration has passed (or force save)
-            if elapsed_time >= timedelta(hours=lesson_duration_hours) or force:
-                # Prepare attendance records for history
-                attendance_records = []
-                for record in attendances:
-                    if record.student:
-                        attendance_records.append({
-                            'first_name': record.student.first_name,
-                            'last_name': record.student.last_name,
-                            'present': record.present,
-                        })
-                        # Update student presence/absence counts
-                        if record.present:
-                            record.student.presences += 1
-                        else:
-                            record.student.absences += 1
-                        record.student.save()
-                
-                # Create history record
-                if attendance_records:
-                    AttendanceHistory.objects.create(
-                        attendance_records=attendance_records,
-                        grade=grade,
-                        attendance_date=oldest_attendance.timestamp.date()
-                    )
-                
-                # Delete current attendance records
-                attendances.delete()
-                
+            elapsed_hours = (now - grade.opened_at).total_seconds() / 3600
+            if dry_run:
+                self.results.append({'grade_id': grade.id, 'grade': grade.name, 'status': 'due', 'records': grade.row_count})
                 self.stdout.write(
-                    self.style.SUCCESS(
-                        f'Successfully saved and cleared attendance for {grade.name}. '
-                        f'Elapsed time: {elapsed_time.total_seconds() / 3600:.1f} hours. '
-                        f'Saved {len(attendance_records)} records to history.'
-                    )
+                    f'Would save {grade.row_count} records for {grade.name}. '
+                    f'Elapsed time: {elapsed_hours:.1f} hours.'
+                )
+                continue
+
+            # Save history, update student counters and clear the sheet in one transaction
+            grade_started = time.monotonic()
+            saved = close_sheet(grade, attendance_date=grade.opened_at.date())
+            total += saved
+            self.results.append({'grade_id': grade.id, 'grade': grade.name, 'status': 'saved', 'records': saved})
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Successfully saved and cleared attendance for {grade.name}. '
+                    f'Elapsed time: {elapsed_hours:.1f} hours. '
+                    f'Saved {saved} records to history '
+                    f'in {(time.monotonic() - grade_started) * 1000:.0f} ms.'
                 )
+            )
+
+        self.stdout.write(
+            f'{"Dry run: " if dry_run else ""}{len(grades)} due sheets, {total} records saved. '
+            f'Lookup {lookup_ms:.0f} ms, total {(time.monotonic() - started) * 1000:.0f} ms.'
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from Class_related.models import AttendanceHistory, AttendanceRecord
+from Class_related.records import BACKFILL_CHUNK_SIZE, backfill_attendance_records
+from People.models import Student
+
+
+class Command(BaseCommand):
+    help = 'Create normalized attendance records for history entries that have none'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=BACKFILL_CHUNK_SIZE,
+            help='Number of history entries converted per transaction',
+        )
+
+    def handle(self, *args, **options):
+        def progress(sessions, records):
+            self.stdout.write(f'{sessions} sessions, {records} records...')
+
+        sessions, records = backfill_attendance_records(
+            AttendanceHistory, AttendanceRecord, Student,
+            chunk_size=options['chunk_size'], progress=progress,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Created {records} records for {sessions} sessions.')
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from background_task.models import Task
+from Class_related.scheduler import AttendanceScheduler
+
+
+class Command(BaseCommand):
+    help = (
+        'Open and close attendance sheets exactly at their scheduled times. '
+        'Replaces the polling setup_attendance_tasks/process_tasks worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the events that are due now and exit',
+        )
+
+    def handle(self, *args, **options):
+        # The repeating tasks of setup_attendance_tasks would open and close
+        # the same sheets again when process_tasks runs next to the scheduler.
+        removed, _ = Task.objects.filter(task_name__startswith='Class_related.tasks.').delete()
+        if removed:
+            self.stdout.write(f'Removed {removed} polling attendance tasks; the scheduler replaces them.')
+
+        scheduler = AttendanceScheduler(stdout=self.stdout)
+        if options.get('once'):
+            scheduler.reload()
+            scheduler.run_due()
+            return
+        self.stdout.write(self.style.SUCCESS('Attendance scheduler started.'))
+        scheduler.run_forever()
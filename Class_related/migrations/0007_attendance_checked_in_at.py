@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Class_related', '0006_grade_class_time_grade_weekdays'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='checked_in_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Checked In At'),
+        ),
+    ]
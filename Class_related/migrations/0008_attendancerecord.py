@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from Class_related.records import backfill_attendance_records
+
+
+def backfill_records(apps, schema_editor):
+    """Create AttendanceRecord rows for the existing JSON history."""
+    backfill_attendance_records(
+        apps.get_model('Class_related', 'AttendanceHistory'),
+        apps.get_model('Class_related', 'AttendanceRecord'),
+        apps.get_model('People', 'Student'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Class_related', '0007_attendance_checked_in_at'),
+        ('People', '0018_student_photo_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('present', models.BooleanField(default=False, verbose_name='Present')),
+                ('first_name', models.CharField(blank=True, max_length=20, verbose_name='First Name')),
+                ('last_name', models.CharField(blank=True, max_length=20, verbose_name='Last Name')),
+                ('grade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='attendance_records', to='Class_related.grade', verbose_name='Grade')),
+                ('history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='records', to='Class_related.attendancehistory', verbose_name='Attendance History')),
+                ('student', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attendance_records', to='People.student', verbose_name='Student')),
+            ],
+            options={
+                'verbose_name': 'Attendance Record',
+                'verbose_name_plural': 'Attendance Records',
+                'indexes': [models.Index(fields=['student', 'date'], name='attendance_record_student'), models.Index(fields=['grade', 'date'], name='attendance_record_grade')],
+                'constraints': [models.UniqueConstraint(fields=('history', 'student'), name='unique_attendance_record_per_session')],
+            },
+        ),
+        migrations.RunPython(backfill_records, migrations.RunPython.noop),
+    ]
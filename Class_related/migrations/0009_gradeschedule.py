@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+from Class_related.schedule import GENERATION_WINDOW, legacy_sessions, next_occurrence
+
+
+def populate_schedules(apps, schema_editor):
+    """Create schedule rows from the existing weekdays/class_time fields."""
+    Grade = apps.get_model('Class_related', 'Grade')
+    GradeSchedule = apps.get_model('Class_related', 'GradeSchedule')
+    after = timezone.now() - GENERATION_WINDOW
+    GradeSchedule.objects.bulk_create([
+        GradeSchedule(
+            grade_id=grade.id,
+            weekday=weekday,
+            start_time=start_time,
+            next_occurrence=next_occurrence(weekday, start_time, after),
+        )
+        for grade in Grade.objects.exclude(weekdays='').exclude(class_time=None)
+        for weekday, start_time in legacy_sessions(grade.weekdays, grade.class_time)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Class_related', '0008_attendancerecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradeSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')], verbose_name='Weekday')),
+                ('start_time', models.TimeField(verbose_name='Start Time')),
+                ('next_occurrence', models.DateTimeField(db_index=True, editable=False, verbose_name='Next Occurrence')),
+                ('grade', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='Class_related.grade', verbose_name='Grade')),
+            ],
+            options={
+                'verbose_name': 'Class Schedule',
+                'verbose_name_plural': 'Class Schedules',
+                'ordering': ['weekday', 'start_time'],
+                'constraints': [models.UniqueConstraint(fields=('grade', 'weekday', 'start_time'), name='unique_grade_session')],
+            },
+        ),
+        migrations.RunPython(populate_schedules, migrations.RunPython.noop),
+    ]
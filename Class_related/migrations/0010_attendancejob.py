@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:41
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Class_related', '0009_gradeschedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('generate', 'Generate attendance'), ('autosave', 'Autosave attendance')], max_length=20, verbose_name='Kind')),
+                ('idempotency_key', models.CharField(blank=True, max_length=100, null=True, verbose_name='Idempotency Key')),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=20, verbose_name='State')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started At')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished At')),
+                ('results', models.JSONField(blank=True, default=list, verbose_name='Results')),
+                ('output', models.TextField(blank=True, verbose_name='Output')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+            ],
+            options={
+                'verbose_name': 'Attendance Job',
+                'verbose_name_plural': 'Attendance Jobs',
+                'ordering': ['-created_at'],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'idempotency_key'), name='unique_attendance_job_key')],
+            },
+        ),
+    ]
@@ -1,7 +1,10 @@
+import uuid
+
 from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from People.models import Student
+from .schedule import GENERATION_WINDOW, legacy_sessions, next_occurrence
 
 class Grade(models.Model):
     """
@@ -23,8 +26,30 @@ class Grade(models.Model):
     weekdays = models.CharField(max_length=100, blank=True, verbose_name=_("Weekdays"), help_text=_("Comma-separated weekdays (e.g., MONDAY,WEDNESDAY,FRIDAY)"))
     class_time = models.TimeField(null=True, blank=True, verbose_name=_("Class Time"), help_text=_("Time when the class starts"))
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._saved_sessions = legacy_sessions(self.__dict__.get('weekdays'), self.__dict__.get('class_time')) if self.pk else set()
+
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        sessions = legacy_sessions(self.weekdays, self.class_time)
+        if sessions != self._saved_sessions:
+            self.sync_schedules(self._saved_sessions, sessions)
+            self._saved_sessions = sessions
+
+    def sync_schedules(self, old_sessions, new_sessions):
+        """
+        Mirror a change of ``weekdays``/``class_time`` into the schedule
+        table. Sessions added separately in the schedule are kept.
+        """
+        for weekday, start_time in old_sessions - new_sessions:
+            self.schedules.filter(weekday=weekday, start_time=start_time).delete()
+        existing = set(self.schedules.values_list('weekday', 'start_time'))
+        for weekday, start_time in new_sessions - existing:
+            GradeSchedule(grade=self, weekday=weekday, start_time=start_time).save()
     
     def get_weekdays_list(self):
         """Return a list of weekdays for this class."""
@@ -42,6 +67,43 @@ class Grade(models.Model):
         verbose_name = _('Grade')
         verbose_name_plural = _('Grades')
 
+class GradeSchedule(models.Model):
+    """
+    One weekly session of a grade. ``next_occurrence`` is kept up to date by
+    the attendance generator and indexed so due sessions are one query.
+    """
+    WEEKDAY_CHOICES = [(index, label) for index, (_name, label) in enumerate(Grade.WEEKDAY_CHOICES)]
+
+    grade = models.ForeignKey(Grade, on_delete=models.CASCADE, related_name='schedules', verbose_name=_("Grade"))
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES, verbose_name=_("Weekday"))
+    start_time = models.TimeField(verbose_name=_("Start Time"))
+    next_occurrence = models.DateTimeField(db_index=True, editable=False, verbose_name=_("Next Occurrence"))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._saved_session = (self.__dict__.get('weekday'), self.__dict__.get('start_time')) if self.pk else None
+
+    def __str__(self):
+        return f'{self.grade} - {self.get_weekday_display()} {self.start_time:%H:%M}'
+
+    def save(self, *args, **kwargs):
+        # Only a new or moved session is re-armed; otherwise re-saving right
+        # after the generator claimed a session would make it due again.
+        session = (self.weekday, self.start_time)
+        if self.next_occurrence is None or session != self._saved_session:
+            # A session starting within the current window still counts as due.
+            self.next_occurrence = next_occurrence(self.weekday, self.start_time, timezone.now() - GENERATION_WINDOW)
+        super().save(*args, **kwargs)
+        self._saved_session = session
+
+    class Meta:
+        verbose_name = _('Class Schedule')
+        verbose_name_plural = _('Class Schedules')
+        ordering = ['weekday', 'start_time']
+        constraints = [
+            models.UniqueConstraint(fields=['grade', 'weekday', 'start_time'], name='unique_grade_session'),
+        ]
+
 class Attendance(models.Model):
     """
     Represents a student's attendance record for a specific grade.
@@ -50,22 +112,15 @@ class Attendance(models.Model):
     grade = models.ForeignKey(Grade, on_delete=models.PROTECT, verbose_name=_("Grade"), related_name='attendances', null=True, blank=True)
     present = models.BooleanField(default=False, verbose_name=_("Present"))
     timestamp = models.DateTimeField(auto_now_add=True, verbose_name=_("Timestamp"), null=True)
+    checked_in_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Checked In At"))
 
     def __str__(self):
         if self.student:
             return f'{self.student} - {self.grade}'
         return f'Unknown Student - {self.grade}'
 
-
-    def save(self, *args, **kwargs):
-        if not self.pk:
-            if self.student:
-                if self.present:
-                    self.student.presences += 1
-                else:
-                    self.student.absences += 1
-                self.student.save()
-        super().save(*args, **kwargs)
+    # Student presence/absence counters are updated when the sheet is
+    # closed, see Class_related.sheets.close_sheet.
 
     class Meta:
         verbose_name = _('Attendance')
@@ -82,15 +137,138 @@ class AttendanceHistory(models.Model):
     def __str__(self):
         return self.attendance_date.strftime('%Y-%m-%d')
 
+    def _student_names(self, present):
+        """
+        Names of the present (or absent) students, read from the normalized
+        records (prefetched when available) and falling back to the JSON
+        blob for sessions that have not been backfilled.
+        """
+        records = self.records.all()
+        if records:
+            return [record.student_name for record in records if record.present == present]
+        return [f"{record['first_name']} {record['last_name']}" for record in self.attendance_records if record['present'] == present]
+
     @property
     def present_students(self):
-        return [f"{record['first_name']} {record['last_name']}" for record in self.attendance_records if record['present']]
+        return self._student_names(True)
 
     @property
     def absent_students(self):
-        return [f"{record['first_name']} {record['last_name']}" for record in self.attendance_records if not record['present']]
+        return self._student_names(False)
 
     class Meta:
         verbose_name = _("Attendance History")
         verbose_name_plural = _("Attendance History")
         ordering = ['-attendance_date']
+
+
+class AttendanceRecordQuerySet(models.QuerySet):
+    def between(self, start=None, end=None):
+        queryset = self
+        if start:
+            queryset = queryset.filter(date__gte=start)
+        if end:
+            queryset = queryset.filter(date__lte=end)
+        return queryset
+
+    def for_student(self, student, start=None, end=None):
+        """Timeline of one student, oldest first (uses the student/date index)."""
+        return self.filter(student=student).between(start, end).order_by('date', 'id')
+
+    def for_grade(self, grade, start=None, end=None):
+        """Timeline of one grade, oldest first (uses the grade/date index)."""
+        return self.filter(grade=grade).between(start, end).order_by('date', 'id')
+
+    def presences(self):
+        return self.filter(present=True)
+
+    def absences(self):
+        return self.filter(present=False)
+
+
+class AttendanceRecord(models.Model):
+    """
+    One student's attendance in one closed session. The name fields are a
+    snapshot taken when the session was saved, used when the student has
+    since been deleted.
+    """
+    history = models.ForeignKey(AttendanceHistory, on_delete=models.CASCADE, related_name='records', verbose_name=_("Attendance History"))
+    student = models.ForeignKey(Student, on_delete=models.SET_NULL, null=True, blank=True, related_name='attendance_records', verbose_name=_("Student"))
+    grade = models.ForeignKey(Grade, on_delete=models.PROTECT, null=True, blank=True, related_name='attendance_records', verbose_name=_("Grade"))
+    date = models.DateField(verbose_name=_("Date"))
+    present = models.BooleanField(default=False, verbose_name=_("Present"))
+    first_name = models.CharField(max_length=20, blank=True, verbose_name=_("First Name"))
+    last_name = models.CharField(max_length=20, blank=True, verbose_name=_("Last Name"))
+
+    objects = AttendanceRecordQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.student_name} - {self.date} - {_("Present") if self.present else _("Absent")}'
+
+    @property
+    def student_name(self):
+        return f'{self.first_name} {self.last_name}'
+
+    class Meta:
+        verbose_name = _("Attendance Record")
+        verbose_name_plural = _("Attendance Records")
+        indexes = [
+            models.Index(fields=['student', 'date'], name='attendance_record_student'),
+            models.Index(fields=['grade', 'date'], name='attendance_record_grade'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['history', 'student'], name='unique_attendance_record_per_session'),
+        ]
+
+
+class AttendanceJob(models.Model):
+    """
+    A run of an attendance management command submitted through the API.
+    Retried submissions with the same idempotency key return the same job.
+    """
+    GENERATE = 'generate'
+    AUTOSAVE = 'autosave'
+    KIND_CHOICES = [
+        (GENERATE, _('Generate attendance')),
+        (AUTOSAVE, _('Autosave attendance')),
+    ]
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (QUEUED, _('Queued')),
+        (RUNNING, _('Running')),
+        (SUCCEEDED, _('Succeeded')),
+        (FAILED, _('Failed')),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name=_("Kind"))
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True, verbose_name=_("Idempotency Key"))
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=QUEUED, verbose_name=_("State"))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Started At"))
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Finished At"))
+    results = models.JSONField(default=list, blank=True, verbose_name=_("Results"))
+    output = models.TextField(blank=True, verbose_name=_("Output"))
+    error = models.TextField(blank=True, verbose_name=_("Error"))
+
+    def __str__(self):
+        return f'{self.get_kind_display()} ({self.get_state_display()})'
+
+    @property
+    def duration(self):
+        """Run time in seconds, or None if the job has not finished."""
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+    class Meta:
+        verbose_name = _('Attendance Job')
+        verbose_name_plural = _('Attendance Jobs')
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'idempotency_key'], name='unique_attendance_job_key'),
+        ]
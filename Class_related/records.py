@@ -0,0 +1,120 @@
+"""
+Normalized attendance records.
+
+``AttendanceHistory.attendance_records`` stores each closed session as a JSON
+list of ``{first_name, last_name, present}`` without student IDs. Every
+session also gets one ``AttendanceRecord`` row per student, so per-student
+and per-grade timelines are indexed queries.
+
+``backfill_attendance_records`` converts existing JSON sessions in chunks.
+JSON entries are matched to students by name, preferring students of the
+session's grade; entries with no unique match keep only the name snapshot.
+It takes the model classes as arguments so the data migration can run it
+with historical models.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+BACKFILL_CHUNK_SIZE = 500
+
+
+def one_row_per_student(rows):
+    """
+    The Attendance ``rows`` with a student, one per student: the first row
+    marked present, otherwise the first row. A sheet opened twice has two
+    rows for some students, which must only count once.
+    """
+    kept = {}
+    for row in rows:
+        if row.student_id is None:
+            continue
+        if row.student_id not in kept or (row.present and not kept[row.student_id].present):
+            kept[row.student_id] = row
+    return list(kept.values())
+
+
+def build_records(history, rows, record_model):
+    """
+    Return unsaved records for ``history`` from closed Attendance ``rows``
+    (with ``student`` loaded), one per student.
+    """
+    return [
+        record_model(
+            history=history,
+            student_id=row.student_id,
+            grade_id=history.grade_id,
+            date=history.attendance_date,
+            present=row.present,
+            first_name=row.student.first_name,
+            last_name=row.student.last_name,
+        )
+        for row in one_row_per_student(rows)
+    ]
+
+
+def _name_index(student_model):
+    """Map (first_name, last_name) -> list of (student id, grade id)."""
+    index = defaultdict(list)
+    rows = student_model.objects.values_list('id', 'first_name', 'last_name', 'grade_id')
+    for student_id, first_name, last_name, grade_id in rows.iterator(chunk_size=2000):
+        index[(first_name, last_name)].append((student_id, grade_id))
+    return index
+
+
+def _match_student(index, first_name, last_name, grade_id):
+    candidates = index.get((first_name, last_name), [])
+    in_grade = [student_id for student_id, student_grade in candidates if student_grade == grade_id]
+    if len(in_grade) == 1:
+        return in_grade[0]
+    if len(candidates) == 1:
+        return candidates[0][0]
+    return None
+
+
+def backfill_attendance_records(history_model, record_model, student_model,
+                                chunk_size=BACKFILL_CHUNK_SIZE, progress=None):
+    """
+    Create records for every history entry that has none yet. Safe to run
+    repeatedly. Returns ``(sessions, records)`` created.
+    """
+    index = _name_index(student_model)
+    pending = history_model.objects.filter(records__isnull=True).order_by('id')
+    sessions = created = 0
+    last_id = 0
+
+    while True:
+        chunk = list(pending.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+
+        records = []
+        for history in chunk:
+            seen = set()
+            for entry in history.attendance_records or []:
+                first_name = entry.get('first_name', '')
+                last_name = entry.get('last_name', '')
+                student_id = _match_student(index, first_name, last_name, history.grade_id)
+                if student_id is not None:
+                    if student_id in seen:
+                        student_id = None
+                    seen.add(student_id)
+                records.append(record_model(
+                    history_id=history.id,
+                    student_id=student_id,
+                    grade_id=history.grade_id,
+                    date=history.attendance_date,
+                    present=bool(entry.get('present')),
+                    first_name=first_name[:20],
+                    last_name=last_name[:20],
+                ))
+
+        with transaction.atomic():
+            record_model.objects.bulk_create(records, batch_size=1000)
+        sessions += len(chunk)
+        created += len(records)
+        if progress:
+            progress(sessions, created)
+
+    return sessions, created
@@ -0,0 +1,44 @@
+"""
+Class schedule arithmetic.
+
+Each ``GradeSchedule`` row is one weekly session (weekday and start time)
+and stores the timestamp of its next occurrence, so the attendance
+generator can select the sessions starting in the current window with one
+indexed query instead of parsing every grade's ``weekdays`` string.
+Times are interpreted in the current time zone.
+"""
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_time
+
+# Sheets open for sessions starting within this window of the current tick.
+GENERATION_WINDOW = timedelta(minutes=5)
+
+WEEKDAY_NAMES = ('MONDAY', 'TUESDAY', 'WEDNESDAY', 'THURSDAY', 'FRIDAY', 'SATURDAY', 'SUNDAY')
+
+
+def next_occurrence(weekday, start_time, after):
+    """
+    Return the first datetime at or after ``after`` that falls on
+    ``weekday`` (0 = Monday) at ``start_time``.
+    """
+    local = timezone.localtime(after)
+    day = local.date() + timedelta(days=(weekday - local.weekday()) % 7)
+    candidate = timezone.make_aware(datetime.combine(day, start_time))
+    if candidate < after:
+        candidate = timezone.make_aware(datetime.combine(day + timedelta(days=7), start_time))
+    return candidate
+
+
+def legacy_sessions(weekdays, class_time):
+    """
+    Sessions described by the ``Grade.weekdays``/``class_time`` fields, as a
+    set of ``(weekday, start_time)``.
+    """
+    if isinstance(class_time, str):
+        class_time = parse_time(class_time)
+    if not weekdays or not class_time:
+        return set()
+    days = {day.strip().upper() for day in weekdays.split(',')}
+    return {(WEEKDAY_NAMES.index(day), class_time) for day in days if day in WEEKDAY_NAMES}
@@ -0,0 +1,189 @@
+"""
+Timer-driven attendance scheduler.
+
+Instead of running ``generate_attendance`` and ``autosave_attendance`` on a
+fixed polling interval, the scheduler computes when the next sheet should
+open (``GradeSchedule.next_occurrence`` or a grade's ``reset_time``) and
+when each open sheet should close (oldest timestamp plus
+``lesson_duration``), keeps those fire times in a heap and sleeps until the
+earliest one. The commands themselves still decide what is due, so the
+scheduler only changes *when* they run.
+
+Changes to grades and schedules wake the scheduler through
+``notify_schedule_changed``: in-process through an event, and across
+processes through PostgreSQL ``LISTEN``/``NOTIFY`` on a dedicated
+connection, which is reopened if it drops. As a safety net the schedule is
+re-read at least every ``RESYNC_INTERVAL``.
+"""
+import heapq
+import itertools
+import logging
+import select
+import threading
+from datetime import datetime, timedelta
+
+from django.core import management
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_CHANNEL = 'attendance_schedule'
+RESYNC_INTERVAL = timedelta(minutes=5)
+ERROR_BACKOFF = timedelta(seconds=30)
+
+OPEN = 'open'
+CLOSE = 'close'
+
+_wakeup = threading.Event()
+
+
+def notify_schedule_changed():
+    """Wake running schedulers once the current transaction commits."""
+    def send():
+        _wakeup.set()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'NOTIFY {SCHEDULE_CHANNEL}')
+
+    transaction.on_commit(send)
+
+
+def _next_reset(grade, now):
+    local = timezone.localtime(now)
+    fire_at = timezone.make_aware(datetime.combine(local.date(), grade.reset_time))
+    return fire_at if fire_at >= now else fire_at + timedelta(days=1)
+
+
+def upcoming_events(now=None):
+    """
+    Return the ``(fire_at, action, grade_id)`` events after ``now``: the next
+    opening of every scheduled session and unscheduled grade, and the
+    closing time of every open sheet.
+    """
+    from .models import Grade, GradeSchedule
+    from .sheets import open_sheets
+
+    now = now or timezone.now()
+    events = [
+        (session.next_occurrence, OPEN, session.grade_id)
+        for session in GradeSchedule.objects.only('grade_id', 'next_occurrence')
+    ]
+    events += [
+        (_next_reset(grade, now), OPEN, grade.id)
+        for grade in Grade.objects.filter(schedules__isnull=True).only('id', 'reset_time')
+    ]
+    events += [
+        (grade.opened_at + timedelta(hours=grade.lesson_duration), CLOSE, grade.id)
+        for grade in open_sheets() if grade.opened_at
+    ]
+    return events
+
+
+class AttendanceScheduler:
+    """Sleeps on a heap of fire times and runs the attendance commands."""
+
+    def __init__(self, stdout=None):
+        self.stdout = stdout
+        self.heap = []
+        self._counter = itertools.count()
+        self._listener = None
+
+    def log(self, message):
+        logger.info(message)
+        if self.stdout:
+            self.stdout.write(message)
+
+    def reload(self, now=None):
+        """Rebuild the heap from the database."""
+        self.heap = []
+        for fire_at, action, grade_id in upcoming_events(now):
+            heapq.heappush(self.heap, (fire_at, next(self._counter), action, grade_id))
+        if self.heap:
+            fire_at, _, action, grade_id = self.heap[0]
+            self.log(f'{len(self.heap)} events scheduled; next: {action} grade {grade_id} at {fire_at:%Y-%m-%d %H:%M:%S}')
+
+    def run_due(self, now=None):
+        """Run the commands for every event due at ``now``. Returns the actions run."""
+        now = now or timezone.now()
+        actions = set()
+        while self.heap and self.heap[0][0] <= now:
+            actions.add(heapq.heappop(self.heap)[2])
+
+        # One command run handles every sheet due at this moment.
+        if OPEN in actions:
+            management.call_command('generate_attendance', stdout=self.stdout)
+        if CLOSE in actions:
+            management.call_command('autosave_attendance', stdout=self.stdout)
+        return actions
+
+    def seconds_until_next(self, now=None):
+        now = now or timezone.now()
+        timeout = RESYNC_INTERVAL.total_seconds()
+        if self.heap:
+            timeout = min(timeout, max((self.heap[0][0] - now).total_seconds(), 0))
+        return timeout
+
+    def _listen(self):
+        """
+        Open the ``LISTEN`` connection, separate from Django's so its
+        transactions are untouched, as ``live.PostgresBroker`` does.
+        """
+        if connection.vendor != 'postgresql' or self._listener is not None:
+            return
+        try:
+            raw = connection.get_new_connection(connection.get_connection_params())
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {SCHEDULE_CHANNEL}')
+        except Exception:
+            logger.exception('Attendance scheduler could not listen for schedule changes')
+            return
+        self._listener = raw
+
+    def _close_listener(self):
+        try:
+            self._listener.close()
+        except Exception:
+            pass
+        self._listener = None
+
+    def wait(self, timeout):
+        """
+        Sleep for ``timeout`` seconds or until the schedule changes. A dropped
+        ``LISTEN`` connection is reopened on the next call; meanwhile only
+        in-process changes and the resync interval wake the scheduler.
+        """
+        self._listen()
+        if self._listener is not None:
+            raw = self._listener
+            try:
+                if select.select([raw], [], [], timeout)[0]:
+                    raw.poll()
+                    raw.notifies.clear()
+                    return True
+                return False
+            except Exception:
+                logger.exception('Attendance scheduler lost its LISTEN connection, reconnecting')
+                self._close_listener()
+        woken = _wakeup.wait(timeout)
+        _wakeup.clear()
+        return woken
+
+    def run_forever(self):
+        self._listen()
+        self.reload()
+        while True:
+            if self.wait(self.seconds_until_next()):
+                self.log('Schedule changed, reloading.')
+            try:
+                self.run_due()
+                self.reload()
+            except Exception:
+                logger.exception('Attendance scheduler tick failed')
+                self.wait(ERROR_BACKOFF.total_seconds())
+
+
+def schedule_changed(sender, **kwargs):
+    """Signal receiver for saves and deletes of grades and schedules."""
+    notify_schedule_changed()
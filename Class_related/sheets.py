@@ -0,0 +1,213 @@
+"""
+Opening and closing attendance sheets.
+
+A sheet is the set of open ``Attendance`` rows of one grade. Closing it
+records an ``AttendanceHistory`` entry with its ``AttendanceRecord`` rows,
+adds every row to its student's presence/absence counters and deletes the
+rows, all in one transaction.
+Counters are only ever touched here, so each attendance is counted exactly
+once.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Min, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+from django.db.models.functions import Coalesce, Now
+
+from People.models import Student
+from .checkin import invalidate_open_attendance_cache
+from .live import publish_attendance_changes, publish_sheet_change
+from .models import Attendance, AttendanceHistory, AttendanceRecord, Grade, GradeSchedule
+from .records import build_records, one_row_per_student
+from .schedule import GENERATION_WINDOW, next_occurrence
+
+
+def _count_subquery(rows, present):
+    counted = (
+        rows.filter(student=OuterRef('pk'), present=present)
+        .order_by()
+        .values('student')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def apply_attendance_counts(attendance_ids):
+    """
+    Add the given attendance rows to their students' ``presences`` and
+    ``absences`` with a single UPDATE. Returns the number of students updated.
+    """
+    rows = Attendance.objects.filter(id__in=list(attendance_ids))
+    return Student.objects.filter(
+        id__in=rows.filter(student__isnull=False).values('student_id')
+    ).update(
+        presences=F('presences') + _count_subquery(rows, True),
+        absences=F('absences') + _count_subquery(rows, False),
+    )
+
+
+def close_sheet(grade, attendance_date=None):
+    """
+    Close the open attendance sheet of ``grade``. Returns the number of
+    attendance rows closed (0 if there was no open sheet).
+    """
+    with transaction.atomic():
+        rows = list(
+            Attendance.objects.select_for_update(of=('self',))
+            .filter(grade=grade)
+            .select_related('student')
+            .order_by('id')
+        )
+        if not rows:
+            return 0
+
+        counted = one_row_per_student(rows)
+        attendance_records = [
+            {
+                'first_name': row.student.first_name,
+                'last_name': row.student.last_name,
+                'present': row.present,
+            }
+            for row in counted
+        ]
+        if attendance_records:
+            history = AttendanceHistory(attendance_records=attendance_records, grade=grade)
+            if attendance_date:
+                history.attendance_date = attendance_date
+            history.save()
+            AttendanceRecord.objects.bulk_create(build_records(history, counted, AttendanceRecord))
+
+        apply_attendance_counts([row.id for row in counted])
+        Attendance.objects.filter(id__in=[row.id for row in rows]).delete()
+        publish_sheet_change(grade.id, 'closed')
+
+    invalidate_open_attendance_cache()
+    return len(rows)
+
+
+def open_sheets():
+    """
+    Grades with an open sheet, annotated with ``opened_at`` (the oldest
+    attendance timestamp) and ``row_count``, in one aggregate query.
+    """
+    return (
+        Grade.objects.annotate(opened_at=Min('attendances__timestamp'), row_count=Count('attendances'))
+        .filter(row_count__gt=0)
+        .order_by('opened_at')
+    )
+
+
+def due_sheets(now=None, force=False):
+    """
+    Open sheets whose lesson duration has elapsed (all open sheets with
+    ``force``), oldest first.
+    """
+    now = now or timezone.now()
+    return [
+        grade for grade in open_sheets()
+        if force or (grade.opened_at and now - grade.opened_at >= timedelta(hours=grade.lesson_duration))
+    ]
+
+
+def open_sheet(grade):
+    """
+    Open a sheet for ``grade`` with every active student marked absent.
+    Students already on the grade's open sheet are skipped, so opening it
+    twice (a double click, a forced run, the scheduler racing a job) doesn't
+    add a second row per student. Returns the number of rows created.
+    """
+    with transaction.atomic():
+        # Serializes concurrent opens of the same grade
+        Grade.objects.select_for_update().filter(pk=grade.pk).first()
+        student_ids = (
+            Student.objects.filter(grade=grade, active=True)
+            .exclude(attendance__grade=grade)
+            .values_list('id', flat=True)
+        )
+        rows = Attendance.objects.bulk_create(
+            [Attendance(student_id=student_id, grade=grade, present=False) for student_id in student_ids]
+        )
+    if rows:
+        invalidate_open_attendance_cache()
+        publish_sheet_change(grade.id, 'opened')
+    return len(rows)
+
+
+def claim_due_sessions(now=None, window=GENERATION_WINDOW):
+    """
+    Return the scheduled sessions starting within ``window`` of ``now`` and
+    move every passed session (due or missed) to its next occurrence, so
+    concurrent or later ticks do not pick it up again.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = list(
+            GradeSchedule.objects.select_for_update(of=('self',))
+            .filter(next_occurrence__lte=now + window)
+            .select_related('grade')
+        )
+        due = [row for row in rows if row.next_occurrence >= now - window]
+        after = now + window + timedelta(microseconds=1)
+        for row in rows:
+            row.next_occurrence = next_occurrence(row.weekday, row.start_time, after)
+        GradeSchedule.objects.bulk_update(rows, ['next_occurrence'])
+    return due
+
+
+def reset_time_grades(now=None, window=GENERATION_WINDOW):
+    """Grades without a schedule whose ``reset_time`` is within ``window`` of ``now``."""
+    local = timezone.localtime(now or timezone.now())
+    start, end = (local - window).time(), (local + window).time()
+    if start <= end:
+        in_window = Q(reset_time__gte=start, reset_time__lte=end)
+    else:
+        in_window = Q(reset_time__gte=start) | Q(reset_time__lte=end)
+    return Grade.objects.filter(in_window, schedules__isnull=True)
+
+
+def sheet_counts(grade_ids):
+    """Present/absent/total counts of the open sheets of ``grade_ids``, in one query."""
+    rows = (
+        Attendance.objects.filter(grade_id__in=grade_ids)
+        .values('grade_id')
+        .annotate(
+            present_count=Count('id', filter=Q(present=True)),
+            absent_count=Count('id', filter=Q(present=False)),
+            total=Count('id'),
+        )
+        .order_by()
+    )
+    return {
+        row['grade_id']: {'present': row['present_count'], 'absent': row['absent_count'], 'total': row['total']}
+        for row in rows
+    }
+
+
+def mark_attendance(present, attendance_ids=None, grade=None):
+    """
+    Set ``present`` on the given open attendance rows, or on every row of
+    ``grade``'s sheet, with a single UPDATE. Rows marked present keep their
+    original check-in time; rows marked absent lose it.
+    Returns ``(rows updated, sheet_counts of the affected grades)``.
+    """
+    if grade is not None:
+        rows = Attendance.objects.filter(grade=grade)
+        grade_ids = [grade.id]
+    else:
+        rows = Attendance.objects.filter(id__in=list(attendance_ids))
+        grade_ids = list(rows.values_list('grade_id', flat=True).distinct())
+
+    if present:
+        checked_in_at = Case(When(present=False, then=Now()), default=F('checked_in_at'))
+    else:
+        checked_in_at = Value(None)
+    updated = rows.update(present=present, checked_in_at=checked_in_at)
+
+    if updated:
+        if grade is not None:
+            publish_attendance_changes([], present, grade_id=grade.id)
+        else:
+            publish_attendance_changes(attendance_ids, present)
+    return updated, sheet_counts(grade_ids)
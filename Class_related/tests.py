@@ -1,10 +1,31 @@
-from django.test import TestCase, Client
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.urls import reverse
-from .models import Grade, Attendance
+from django.core.cache import cache
+from django.core import management
+from django.utils import timezone
+from background_task.models import Task
+from .models import Grade, GradeSchedule, Attendance, AttendanceHistory, AttendanceJob, AttendanceRecord
+from .jobs import ABANDONED_ERROR, run_job, submit_job
+from . import checkin, live, scheduler
+from .records import backfill_attendance_records
+from .schedule import next_occurrence
+from .scheduler import AttendanceScheduler, upcoming_events
+from .sheets import (
+    apply_attendance_counts, claim_due_sessions, close_sheet, due_sheets, mark_attendance, open_sheet,
+    reset_time_grades,
+)
 from People.models import Student
+from io import StringIO
+from unittest import mock
+import asyncio
+import datetime
+import threading
 import json
 import os
+import uuid
 
 
 class ServerTimeAPITestCase(TestCase):
@@ -45,6 +66,7 @@ class ServerTimeAPITestCase(TestCase):
         self.assertIn('UTC', full_display)
 
 
+@override_settings(ATTENDANCE_JOBS_EAGER=True)
 class AttendanceAPITestCase(TestCase):
     """Test the attendance automation API endpoints"""
     
@@ -115,15 +137,17 @@ class AttendanceAPITestCase(TestCase):
         os.environ['ATTENDANCE_API_TOKEN'] = self.test_token
     
     def test_trigger_attendance_generation_success(self):
-        """Test that endpoint successfully triggers attendance generation"""
+        """Test that endpoint queues attendance generation"""
         response = self.client.post(
             reverse('class_related:trigger_attendance_generation'),
             HTTP_AUTHORIZATION=f'Bearer {self.test_token}'
         )
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 202)
         data = json.loads(response.content)
-        self.assertEqual(data['status'], 'success')
-        self.assertIn('message', data)
+        self.assertEqual(data['status'], 'accepted')
+        self.assertEqual(data['state'], 'queued')
+        self.assertIn('job_id', data)
+        self.assertIn('status_url', data)
     
     def test_trigger_attendance_autosave_unauthorized_no_token(self):
         """Test that autosave endpoint returns 401 without authorization token"""
@@ -146,15 +170,15 @@ class AttendanceAPITestCase(TestCase):
         self.assertEqual(data['error'], 'Unauthorized')
     
     def test_trigger_attendance_autosave_success(self):
-        """Test that autosave endpoint successfully triggers attendance autosave"""
+        """Test that autosave endpoint queues attendance autosave"""
         response = self.client.post(
             reverse('class_related:trigger_attendance_autosave'),
             HTTP_AUTHORIZATION=f'Bearer {self.test_token}'
         )
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 202)
         data = json.loads(response.content)
-        self.assertEqual(data['status'], 'success')
-        self.assertIn('message', data)
+        self.assertEqual(data['status'], 'accepted')
+        self.assertIn('job_id', data)
     
     def test_trigger_attendance_generation_only_post(self):
         """Test that attendance generation endpoint only accepts POST"""
@@ -180,9 +204,9 @@ class AttendanceAPITestCase(TestCase):
             '/api/trigger-attendance-generation/',
             HTTP_AUTHORIZATION=f'Bearer {self.test_token}'
         )
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 202)
         data = json.loads(response.content)
-        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['status'], 'accepted')
     
     def test_trigger_attendance_autosave_direct_api_url(self):
         """Test that attendance autosave is accessible via direct /api/ URL"""
@@ -190,9 +214,89 @@ class AttendanceAPITestCase(TestCase):
             '/api/trigger-attendance-autosave/',
             HTTP_AUTHORIZATION=f'Bearer {self.test_token}'
         )
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 202)
         data = json.loads(response.content)
-        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['status'], 'accepted')
+
+    def test_job_runs_and_reports_results(self):
+        """Test that a queued job runs after commit and reports per-grade results"""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('class_related:trigger_attendance_generation'),
+                {'idempotency_key': 'run-1'},
+                HTTP_AUTHORIZATION=f'Bearer {self.test_token}',
+            )
+        job_id = response.json()['job_id']
+
+        response = self.client.get(
+            reverse('class_related:attendance_job_status', args=[job_id]),
+            HTTP_AUTHORIZATION=f'Bearer {self.test_token}',
+        )
+        data = response.json()
+        self.assertEqual(data['state'], 'succeeded')
+        self.assertIsNotNone(data['duration'])
+        self.assertIsInstance(data['results'], list)
+        self.assertEqual(AttendanceJob.objects.get(id=job_id).state, AttendanceJob.SUCCEEDED)
+
+    def test_job_results_per_grade(self):
+        """Test that a job records the outcome for each grade"""
+        attendance = Attendance.objects.create(student=self.student, grade=self.grade, present=True)
+        Attendance.objects.filter(id=attendance.id).update(timestamp=timezone.now() - datetime.timedelta(hours=3))
+        job = AttendanceJob.objects.create(kind=AttendanceJob.AUTOSAVE)
+
+        run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.state, AttendanceJob.SUCCEEDED)
+        self.assertEqual(job.results, [
+            {'grade_id': self.grade.id, 'grade': 'Test Grade', 'status': 'saved', 'records': 1},
+        ])
+        self.assertIn('Saved 1 records', job.output)
+
+        # A job only runs once
+        run_job(job.id)
+        self.assertEqual(AttendanceHistory.objects.count(), 1)
+
+    def test_idempotency_key(self):
+        """Test that retried submissions with the same key return the same job"""
+        url = reverse('class_related:trigger_attendance_autosave')
+        first = self.client.post(url, HTTP_AUTHORIZATION=f'Bearer {self.test_token}', HTTP_IDEMPOTENCY_KEY='cron-42')
+        second = self.client.post(url, HTTP_AUTHORIZATION=f'Bearer {self.test_token}', HTTP_IDEMPOTENCY_KEY='cron-42')
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['status'], 'duplicate')
+        self.assertEqual(first.json()['job_id'], second.json()['job_id'])
+        self.assertEqual(AttendanceJob.objects.count(), 1)
+
+    def test_abandoned_job_releases_idempotency_key(self):
+        """Test that a job left queued by a stopped worker fails and lets a retry run"""
+        job, _created = submit_job(AttendanceJob.AUTOSAVE, 'cron-7')
+        AttendanceJob.objects.filter(id=job.id).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+
+        retry, created = submit_job(AttendanceJob.AUTOSAVE, 'cron-7')
+        self.assertTrue(created)
+        self.assertNotEqual(retry.id, job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.error, job.idempotency_key), (AttendanceJob.FAILED, ABANDONED_ERROR, None))
+
+        # A late thread doesn't run it any more
+        run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.state, AttendanceJob.FAILED)
+
+    def test_idempotency_key_too_long(self):
+        """Test that an over-long idempotency key is a 400, not a database error"""
+        response = self.client.post(
+            reverse('class_related:trigger_attendance_autosave'),
+            HTTP_AUTHORIZATION=f'Bearer {self.test_token}', HTTP_IDEMPOTENCY_KEY='k' * 101,
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(AttendanceJob.objects.exists())
+
+    def test_job_status_requires_token(self):
+        """Test that the job status endpoint requires the API token"""
+        job, _created = submit_job(AttendanceJob.AUTOSAVE)
+        response = self.client.get(reverse('class_related:attendance_job_status', args=[job.id]))
+        self.assertEqual(response.status_code, 401)
 
 
 class DeleteGradeTestCase(TestCase):
@@ -272,3 +376,820 @@ class DeleteGradeTestCase(TestCase):
         self.assertFalse(Grade.objects.filter(id=empty_grade.id).exists())
 
 
+class CheckInTestCase(TestCase):
+    """Test the scanner check-in service and the check_attendance view"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        self.grade = Grade.objects.create(name='Test Grade', reset_time='10:00:00')
+        self.student = Student.objects.create(
+            first_name='John', last_name='Doe', address='123 Test St', grade=self.grade
+        )
+        self.attendance = Attendance.objects.create(student=self.student, grade=self.grade)
+
+    def test_marks_present_with_single_update_when_cached(self):
+        """Test that a warm-cache scan costs exactly one query"""
+        checkin.get_open_attendance_map()
+        with self.assertNumQueries(1):
+            result = checkin.check_in(str(self.student.uuid))
+        self.assertEqual(result.status, checkin.MARKED_PRESENT)
+        self.assertEqual(result.student_name, 'John Doe')
+        self.attendance.refresh_from_db()
+        self.assertTrue(self.attendance.present)
+
+    def test_already_present(self):
+        """Test that a second scan is reported as already present"""
+        checkin.check_in(str(self.student.uuid))
+        result = checkin.check_in(str(self.student.uuid))
+        self.assertEqual(result.status, checkin.ALREADY_PRESENT)
+        self.assertTrue(result.match)
+
+    def test_unknown_and_invalid_codes(self):
+        """Test that unknown UUIDs and garbage are reported as unknown"""
+        self.assertEqual(checkin.check_in(str(uuid.uuid4())).status, checkin.UNKNOWN_STUDENT)
+        with self.assertNumQueries(0):
+            self.assertEqual(checkin.check_in('not-a-uuid').status, checkin.UNKNOWN_STUDENT)
+
+    def test_no_open_sheet_does_not_create_rows(self):
+        """Test that scanning a student without an open sheet creates nothing"""
+        self.attendance.delete()
+        result = checkin.check_in(str(self.student.uuid))
+        self.assertEqual(result.status, checkin.NO_OPEN_SHEET)
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_stale_cache_is_refreshed(self):
+        """Test that sheets opened or reopened behind the cache are found"""
+        checkin.get_open_attendance_map()
+        self.attendance.delete()
+        reopened = Attendance.objects.create(student=self.student, grade=self.grade)
+        result = checkin.check_in(str(self.student.uuid))
+        self.assertEqual(result.status, checkin.MARKED_PRESENT)
+        self.assertEqual(result.attendance_id, reopened.id)
+
+    def test_check_attendance_view(self):
+        """Test the JSON response of the check_attendance view"""
+        response = self.client.post(reverse('people:check_attendance'), {'text_input': str(self.student.uuid)})
+        data = json.loads(response.content)
+        self.assertTrue(data['match'])
+        self.assertEqual(data['status'], checkin.MARKED_PRESENT)
+        self.assertEqual(data['student_name'], 'John Doe')
+        self.assertIn('message', data)
+
+
+class CheckInBatchTestCase(TestCase):
+    """Test the batch scan ingestion endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        self.grade = Grade.objects.create(name='Test Grade', reset_time='10:00:00')
+        self.students = [
+            Student.objects.create(first_name=f'Student{i}', last_name='Test', address='x', grade=self.grade)
+            for i in range(3)
+        ]
+        for student in self.students:
+            Attendance.objects.create(student=student, grade=self.grade)
+        self.without_sheet = Student.objects.create(first_name='No', last_name='Sheet', address='x')
+
+    def _post(self, events):
+        return self.client.post(
+            reverse('people:check_attendance_batch'),
+            data=json.dumps({'events': events}),
+            content_type='application/json'
+        )
+
+    def test_batch_reports_each_event(self):
+        """Test per-event results for present, repeated, unknown and sheetless scans"""
+        events = [
+            {'uuid': str(self.students[0].uuid), 'scanned_at': '2024-05-06T14:03:00Z', 'device_id': 'door-1'},
+            {'uuid': str(self.students[1].uuid), 'device_id': 'door-1'},
+            {'uuid': str(self.students[0].uuid), 'device_id': 'door-2'},
+            {'uuid': str(uuid.uuid4()), 'device_id': 'door-1'},
+            {'uuid': 'garbage', 'device_id': 'door-1'},
+            {'uuid': str(self.without_sheet.uuid), 'device_id': 'door-1'},
+        ]
+        response = self._post(events)
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)['results']
+        self.assertEqual(
+            [r['status'] for r in results],
+            [checkin.MARKED_PRESENT, checkin.MARKED_PRESENT, checkin.ALREADY_PRESENT,
+             checkin.UNKNOWN_STUDENT, checkin.UNKNOWN_STUDENT, checkin.NO_OPEN_SHEET]
+        )
+        self.assertEqual(results[2]['device_id'], 'door-2')
+
+        first = Attendance.objects.get(student=self.students[0])
+        self.assertTrue(first.present)
+        self.assertEqual(first.checked_in_at.isoformat(), '2024-05-06T14:03:00+00:00')
+        self.assertFalse(Attendance.objects.get(student=self.students[2]).present)
+
+    def test_batch_uses_one_update(self):
+        """Test that a warm batch marks all rows with a single UPDATE"""
+        checkin.get_open_attendance_map()
+        events = [{'uuid': str(s.uuid)} for s in self.students]
+        with self.assertNumQueries(4):  # savepoint, locking SELECT, UPDATE, release
+            self.assertEqual(len(checkin.check_in_batch(events)), 3)
+        self.assertEqual(Attendance.objects.filter(present=True).count(), 3)
+
+    def test_impossible_scan_time(self):
+        """Test that a well-formed but impossible timestamp falls back to the current time"""
+        response = self._post([{'uuid': str(self.students[0].uuid), 'scanned_at': '2024-02-30T10:00:00'}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['results'][0]['status'], checkin.MARKED_PRESENT)
+        checked_in_at = Attendance.objects.get(student=self.students[0]).checked_in_at
+        self.assertLess(abs(timezone.now() - checked_in_at), datetime.timedelta(minutes=1))
+
+    def test_malformed_payload(self):
+        """Test that malformed payloads are rejected"""
+        response = self.client.post(
+            reverse('people:check_attendance_batch'), data='nope', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._post(['x']).status_code, 400)
+
+    def test_only_post(self):
+        """Test that the batch endpoint only accepts POST"""
+        response = self.client.get(reverse('people:check_attendance_batch'))
+        self.assertEqual(response.status_code, 405)
+
+
+class AttendanceCountersTestCase(TestCase):
+    """Test that closing a sheet counts each attendance exactly once"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        self.grade = Grade.objects.create(name='Test Grade', reset_time='10:00:00')
+        self.present = Student.objects.create(first_name='Here', last_name='One', address='x', grade=self.grade)
+        self.absent = Student.objects.create(first_name='Away', last_name='Two', address='x', grade=self.grade)
+        Attendance.objects.create(student=self.present, grade=self.grade, present=True)
+        Attendance.objects.create(student=self.absent, grade=self.grade, present=False)
+
+    def _counts(self, student):
+        student.refresh_from_db()
+        return student.presences, student.absences
+
+    def test_creating_rows_does_not_count(self):
+        """Test that opening a sheet leaves the counters alone"""
+        self.assertEqual(self._counts(self.present), (0, 0))
+        self.assertEqual(self._counts(self.absent), (0, 0))
+
+    def test_counters_use_single_update(self):
+        """Test that all students of a sheet are updated with one UPDATE"""
+        ids = list(Attendance.objects.values_list('id', flat=True))
+        with self.assertNumQueries(1):
+            self.assertEqual(apply_attendance_counts(ids), 2)
+        self.assertEqual(self._counts(self.present), (1, 0))
+        self.assertEqual(self._counts(self.absent), (0, 1))
+
+    def test_delete_attendance_counts_once(self):
+        """Test that closing a sheet from the view counts each row once"""
+        self.client.post(reverse('class_related:delete_attendance', args=[self.grade.id]))
+        self.assertEqual(self._counts(self.present), (1, 0))
+        self.assertEqual(self._counts(self.absent), (0, 1))
+        self.assertFalse(Attendance.objects.exists())
+        self.assertEqual(AttendanceHistory.objects.get().present_students, ['Here One'])
+
+        # Closing again is a no-op
+        self.assertEqual(close_sheet(self.grade), 0)
+        self.assertEqual(self._counts(self.present), (1, 0))
+
+    def test_autosave_counts_once(self):
+        """Test that the autosave command counts each row once"""
+        management.call_command('autosave_attendance', force=True, stdout=StringIO())
+        self.assertEqual(self._counts(self.present), (1, 0))
+        self.assertEqual(self._counts(self.absent), (0, 1))
+
+
+class AttendanceRecordTestCase(TestCase):
+    """Test the normalized attendance records and their timelines"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        self.grade = Grade.objects.create(name='Grade A', reset_time='10:00:00')
+        self.other_grade = Grade.objects.create(name='Grade B', reset_time='10:00:00')
+        self.alice = Student.objects.create(first_name='Alice', last_name='Smith', address='x', grade=self.grade)
+        self.bob = Student.objects.create(first_name='Bob', last_name='Jones', address='x', grade=self.grade)
+
+    def _history(self, grade, date, entries):
+        return AttendanceHistory.objects.create(
+            grade=grade,
+            attendance_date=date,
+            attendance_records=[
+                {'first_name': first, 'last_name': last, 'present': present}
+                for first, last, present in entries
+            ],
+        )
+
+    def _backfill(self):
+        return backfill_attendance_records(AttendanceHistory, AttendanceRecord, Student)
+
+    def test_close_sheet_creates_records(self):
+        """Test that closing a sheet writes one record per student"""
+        Attendance.objects.create(student=self.alice, grade=self.grade, present=True)
+        Attendance.objects.create(student=self.bob, grade=self.grade, present=False)
+        close_sheet(self.grade, attendance_date=datetime.date(2024, 3, 1))
+
+        history = AttendanceHistory.objects.get()
+        records = history.records.order_by('last_name')
+        self.assertEqual(
+            [(r.student_id, r.present, r.date) for r in records],
+            [(self.bob.id, False, datetime.date(2024, 3, 1)), (self.alice.id, True, datetime.date(2024, 3, 1))],
+        )
+        self.assertEqual(history.present_students, ['Alice Smith'])
+        self.assertEqual(history.absent_students, ['Bob Jones'])
+
+    def test_close_sheet_with_duplicate_rows(self):
+        """Test that a sheet opened twice closes with one record and one count per student"""
+        Attendance.objects.create(student=self.alice, grade=self.grade, present=False)
+        Attendance.objects.create(student=self.alice, grade=self.grade, present=True)
+        Attendance.objects.create(student=self.bob, grade=self.grade, present=False)
+        Attendance.objects.create(student=self.bob, grade=self.grade, present=False)
+        self.assertEqual(close_sheet(self.grade), 4)
+
+        history = AttendanceHistory.objects.get()
+        self.assertEqual(sorted((r.student_id, r.present) for r in history.records.all()),
+                         sorted([(self.alice.id, True), (self.bob.id, False)]))
+        self.assertEqual(len(history.attendance_records), 2)
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual((self.alice.presences, self.alice.absences), (1, 0))
+        self.assertEqual((self.bob.presences, self.bob.absences), (0, 1))
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_open_sheet_twice(self):
+        """Test that opening an open sheet again only adds the missing students"""
+        self.assertEqual(open_sheet(self.grade), 2)
+        self.assertEqual(open_sheet(self.grade), 0)
+        Student.objects.create(first_name='Carol', last_name='New', address='x', grade=self.grade)
+        self.assertEqual(open_sheet(self.grade), 1)
+        self.assertEqual(Attendance.objects.filter(grade=self.grade).count(), 3)
+
+    def test_backfill_matches_students_by_name(self):
+        """Test that the backfill links JSON entries to students and is idempotent"""
+        history = self._history(self.grade, '2024-01-10', [('Alice', 'Smith', True), ('Gone', 'Student', False)])
+        self.assertEqual(self._backfill(), (1, 2))
+        self.assertEqual(self._backfill(), (0, 0))
+
+        records = {r.first_name: r for r in history.records.all()}
+        self.assertEqual(records['Alice'].student_id, self.alice.id)
+        self.assertTrue(records['Alice'].present)
+        self.assertIsNone(records['Gone'].student_id)
+        self.assertEqual(history.absent_students, ['Gone Student'])
+
+    def test_backfill_prefers_students_of_the_same_grade(self):
+        """Test that ambiguous names are resolved by grade or left unlinked"""
+        other_alice = Student.objects.create(first_name='Alice', last_name='Smith', address='x', grade=self.other_grade)
+        in_grade = self._history(self.other_grade, '2024-01-10', [('Alice', 'Smith', True)])
+        no_grade = self._history(None, '2024-01-11', [('Alice', 'Smith', True)])
+        self._backfill()
+
+        self.assertEqual(in_grade.records.get().student_id, other_alice.id)
+        self.assertIsNone(no_grade.records.get().student_id)
+
+    def test_history_without_records_uses_json(self):
+        """Test that sessions that were not backfilled still list names"""
+        history = self._history(self.grade, '2024-01-10', [('Alice', 'Smith', True), ('Bob', 'Jones', False)])
+        self.assertEqual(history.present_students, ['Alice Smith'])
+        self.assertEqual(history.absent_students, ['Bob Jones'])
+
+    def test_student_timeline(self):
+        """Test the per-student timeline endpoint with a date range"""
+        self._history(self.grade, '2024-01-10', [('Alice', 'Smith', True)])
+        self._history(self.grade, '2024-02-10', [('Alice', 'Smith', False)])
+        self._history(self.grade, '2024-03-10', [('Alice', 'Smith', True)])
+        self._backfill()
+
+        url = reverse('class_related:student_attendance_timeline', args=[self.alice.id])
+        data = self.client.get(url, {'start': '2024-02-01'}).json()
+        self.assertEqual([r['date'] for r in data['records']], ['2024-02-10', '2024-03-10'])
+        self.assertEqual(data['totals'], {'presences': 1, 'absences': 1})
+
+        response = self.client.get(url, {'end': 'not-a-date'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_grade_timeline(self):
+        """Test the per-grade timeline endpoint"""
+        self._history(self.grade, '2024-01-10', [('Alice', 'Smith', True), ('Bob', 'Jones', False)])
+        self._history(self.other_grade, '2024-01-10', [('Alice', 'Smith', True)])
+        self._backfill()
+
+        url = reverse('class_related:grade_attendance_timeline', args=[self.grade.id])
+        data = self.client.get(url, {'start': '2024-01-10', 'end': '2024-01-10'}).json()
+        self.assertEqual(len(data['records']), 2)
+        self.assertEqual(data['totals'], {'presences': 1, 'absences': 1})
+
+    def test_backfill_command(self):
+        """Test the backfill management command"""
+        self._history(self.grade, '2024-01-10', [('Alice', 'Smith', True)])
+        out = StringIO()
+        management.call_command('backfill_attendance_records', '--chunk-size', '1', stdout=out)
+        self.assertIn('Created 1 records for 1 sessions.', out.getvalue())
+        self.assertEqual(AttendanceRecord.objects.count(), 1)
+
+
+class AttendanceHistoryViewTestCase(TestCase):
+    """Test the paginated attendance history and its detail endpoint"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        self.grade = Grade.objects.create(name='Grade A', reset_time='10:00:00')
+        self.student = Student.objects.create(first_name='Alice', last_name='Smith', address='x', grade=self.grade)
+        start = datetime.date(2024, 1, 1)
+        for day in range(30):
+            Attendance.objects.create(student=self.student, grade=self.grade, present=day % 2 == 0)
+            close_sheet(self.grade, attendance_date=start + datetime.timedelta(days=day))
+
+    def test_history_is_paginated(self):
+        """Test that only one page of sessions is rendered"""
+        url = reverse('class_related:attendance_history')
+        response = self.client.get(url, {'grade': self.grade.id})
+        page = response.context['page_obj']
+        self.assertEqual(page.paginator.count, 30)
+        self.assertEqual(len(page.object_list), 25)
+        self.assertEqual(page.object_list[0].attendance_date, datetime.date(2024, 1, 30))
+        self.assertEqual(page.object_list[0].absent_count, 1)
+
+        response = self.client.get(url, {'grade': self.grade.id, 'page': 2})
+        self.assertEqual(len(response.context['page_obj'].object_list), 5)
+
+    def test_history_date_range(self):
+        """Test filtering sessions by date range"""
+        response = self.client.get(reverse('class_related:attendance_history'), {
+            'grade': self.grade.id, 'start': '2024-01-10', 'end': '2024-01-12',
+        })
+        dates = [h.attendance_date.day for h in response.context['page_obj'].object_list]
+        self.assertEqual(dates, [12, 11, 10])
+
+    def test_history_detail(self):
+        """Test the per-session JSON endpoint"""
+        history = AttendanceHistory.objects.get(attendance_date=datetime.date(2024, 1, 1))
+        response = self.client.get(reverse('class_related:attendance_history_detail', args=[history.id]))
+        self.assertEqual(response.json(), {
+            'id': history.id,
+            'date': '2024-01-01',
+            'grade': 'Grade A',
+            'present': ['Alice Smith'],
+            'absent': [],
+        })
+
+
+class AutosaveAttendanceTestCase(TestCase):
+    """Test the set-based autosave_attendance command"""
+
+    def setUp(self):
+        self.due = Grade.objects.create(name='Due Grade', reset_time='10:00:00', lesson_duration=2)
+        self.running = Grade.objects.create(name='Running Grade', reset_time='10:00:00', lesson_duration=2)
+        Grade.objects.create(name='Empty Grade', reset_time='10:00:00')
+        self.student = Student.objects.create(first_name='Alice', last_name='Smith', address='x', grade=self.due)
+
+        now = timezone.now()
+        for grade, opened in ((self.due, now - datetime.timedelta(hours=3)), (self.running, now - datetime.timedelta(minutes=30))):
+            attendance = Attendance.objects.create(student=self.student, grade=grade, present=True)
+            Attendance.objects.filter(id=attendance.id).update(timestamp=opened)
+
+    def _run(self, *args):
+        out = StringIO()
+        management.call_command('autosave_attendance', *args, stdout=out)
+        return out.getvalue()
+
+    def test_due_sheets_single_query(self):
+        """Test that due sheets are found with one query"""
+        with self.assertNumQueries(1):
+            grades = due_sheets()
+        self.assertEqual([g.name for g in grades], ['Due Grade'])
+        self.assertEqual(grades[0].row_count, 1)
+
+    def test_closes_only_due_sheets(self):
+        """Test that only sheets past the lesson duration are saved"""
+        output = self._run()
+        self.assertIn('Successfully saved and cleared attendance for Due Grade', output)
+        self.assertIn('1 due sheets, 1 records saved.', output)
+        self.assertFalse(Attendance.objects.filter(grade=self.due).exists())
+        self.assertTrue(Attendance.objects.filter(grade=self.running).exists())
+        self.assertEqual(AttendanceHistory.objects.get().grade, self.due)
+
+    def test_dry_run(self):
+        """Test that a dry run reports without saving"""
+        output = self._run('--dry-run', '--force')
+        self.assertIn('Would save 1 records for Due Grade', output)
+        self.assertIn('Would save 1 records for Running Grade', output)
+        self.assertEqual(Attendance.objects.count(), 2)
+        self.assertFalse(AttendanceHistory.objects.exists())
+
+
+class GradeScheduleTestCase(TestCase):
+    """Test the class schedule table and schedule-driven sheet generation"""
+
+    def setUp(self):
+        self.grade = Grade.objects.create(
+            name='Robotics', reset_time='03:00:00', weekdays='MONDAY,WEDNESDAY', class_time='17:00:00',
+        )
+        self.student = Student.objects.create(first_name='Alice', last_name='Smith', address='x', grade=self.grade)
+        # Monday 2024-01-01 16:58 UTC
+        self.monday = timezone.make_aware(datetime.datetime(2024, 1, 1, 16, 58))
+
+    def test_next_occurrence(self):
+        """Test computing the next occurrence of a weekly session"""
+        five_pm = datetime.time(17, 0)
+        self.assertEqual(next_occurrence(0, five_pm, self.monday), self.monday.replace(minute=0, hour=17))
+        self.assertEqual(next_occurrence(2, five_pm, self.monday).date(), datetime.date(2024, 1, 3))
+        later = self.monday.replace(hour=18)
+        self.assertEqual(next_occurrence(0, five_pm, later).date(), datetime.date(2024, 1, 8))
+
+    def test_weekdays_are_mirrored_into_schedule(self):
+        """Test that weekdays/class_time changes update the schedule rows"""
+        self.assertEqual(
+            list(self.grade.schedules.values_list('weekday', 'start_time')),
+            [(0, datetime.time(17, 0)), (2, datetime.time(17, 0))],
+        )
+        extra = GradeSchedule.objects.create(grade=self.grade, weekday=0, start_time=datetime.time(19, 0))
+
+        grade = Grade.objects.get(id=self.grade.id)
+        grade.weekdays = 'FRIDAY'
+        grade.save()
+        self.assertEqual(
+            list(grade.schedules.values_list('weekday', 'start_time')),
+            [(0, datetime.time(19, 0)), (4, datetime.time(17, 0))],
+        )
+        self.assertTrue(GradeSchedule.objects.filter(id=extra.id).exists())
+
+    def test_claim_due_sessions(self):
+        """Test that due sessions are claimed once and missed ones skipped"""
+        GradeSchedule.objects.update(next_occurrence=self.monday.replace(minute=0, hour=17))
+        GradeSchedule.objects.filter(weekday=2).update(next_occurrence=self.monday - datetime.timedelta(days=5))
+
+        with self.assertNumQueries(4):
+            due = claim_due_sessions(self.monday)
+        self.assertEqual([(s.grade, s.weekday) for s in due], [(self.grade, 0)])
+        self.assertEqual(claim_due_sessions(self.monday), [])
+        self.assertEqual(
+            dict(GradeSchedule.objects.values_list('weekday', 'next_occurrence')),
+            {
+                0: timezone.make_aware(datetime.datetime(2024, 1, 8, 17, 0)),
+                2: timezone.make_aware(datetime.datetime(2024, 1, 3, 17, 0)),
+            },
+        )
+
+    def test_resave_keeps_claimed_session(self):
+        """Test that re-saving a schedule doesn't re-arm a session the generator claimed"""
+        schedule = self.grade.schedules.get(weekday=0)
+        claimed = timezone.now() + datetime.timedelta(days=6)
+        GradeSchedule.objects.filter(id=schedule.id).update(next_occurrence=claimed)
+
+        schedule = GradeSchedule.objects.get(id=schedule.id)
+        schedule.save()
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.next_occurrence, claimed)
+
+        schedule.start_time = datetime.time(18, 0)
+        schedule.save()
+        schedule.refresh_from_db()
+        self.assertNotEqual(schedule.next_occurrence, claimed)
+        self.assertEqual(timezone.localtime(schedule.next_occurrence).time(), datetime.time(18, 0))
+
+    def test_generate_two_sessions_per_day(self):
+        """Test that a grade can have more than one session per day"""
+        now = timezone.localtime()
+        grade = Grade.objects.create(name='Twice', reset_time='03:00:00')
+        Student.objects.create(first_name='Bob', last_name='Jones', address='x', grade=grade)
+        GradeSchedule.objects.create(grade=grade, weekday=now.weekday(), start_time=now.time())
+        three_hours_later = now + datetime.timedelta(hours=3)
+        later = GradeSchedule.objects.create(
+            grade=grade, weekday=three_hours_later.weekday(), start_time=three_hours_later.time(),
+        )
+
+        out = StringIO()
+        management.call_command('generate_attendance', stdout=out)
+        self.assertIn('Successfully generated attendance sheet for Twice', out.getvalue())
+        self.assertEqual(Attendance.objects.filter(grade=grade).count(), 1)
+
+        # The later session is still pending
+        later.refresh_from_db()
+        self.assertLess(later.next_occurrence - now, datetime.timedelta(hours=4))
+
+    def test_reset_time_fallback_for_unscheduled_grades(self):
+        """Test that grades without a schedule still open at their reset time"""
+        now = timezone.localtime()
+        grade = Grade.objects.create(name='Unscheduled', reset_time=now.time())
+        Student.objects.create(first_name='Bob', last_name='Jones', address='x', grade=grade)
+
+        self.assertEqual(list(reset_time_grades(now)), [grade])
+        out = StringIO()
+        management.call_command('generate_attendance', stdout=out)
+        self.assertIn('triggered by reset time', out.getvalue())
+        self.assertEqual(Attendance.objects.filter(grade=grade).count(), 1)
+
+        # A second trigger (the API, a forced run) doesn't open it again
+        management.call_command('generate_attendance', force=True, stdout=StringIO())
+        self.assertEqual(Attendance.objects.filter(grade=grade).count(), 1)
+
+
+class AttendanceSchedulerTestCase(TestCase):
+    """Test the timer-driven attendance scheduler"""
+
+    def setUp(self):
+        self.scheduled = Grade.objects.create(name='Scheduled', reset_time='03:00:00', lesson_duration=2)
+        self.unscheduled = Grade.objects.create(name='Unscheduled', reset_time='03:00:00', lesson_duration=1)
+        self.now = timezone.now()
+        in_three_days = timezone.localtime(self.now) + datetime.timedelta(days=3)
+        self.session = GradeSchedule.objects.create(grade=self.scheduled, weekday=in_three_days.weekday(), start_time=datetime.time(17, 0))
+        self.student = Student.objects.create(first_name='Alice', last_name='Smith', address='x', grade=self.unscheduled)
+
+        attendance = Attendance.objects.create(student=self.student, grade=self.unscheduled)
+        Attendance.objects.filter(id=attendance.id).update(timestamp=self.now - datetime.timedelta(hours=2))
+
+    def test_upcoming_events(self):
+        """Test that opening and closing times are computed from the schedules"""
+        events = {(action, grade_id): fire_at for fire_at, action, grade_id in upcoming_events(self.now)}
+        self.session.refresh_from_db()
+        self.assertEqual(events[(scheduler.OPEN, self.scheduled.id)], self.session.next_occurrence)
+        self.assertEqual(events[(scheduler.CLOSE, self.unscheduled.id)], self.now - datetime.timedelta(hours=1))
+
+        reset_at = events[(scheduler.OPEN, self.unscheduled.id)]
+        self.assertEqual(timezone.localtime(reset_at).time(), datetime.time(3, 0))
+        self.assertTrue(self.now <= reset_at < self.now + datetime.timedelta(days=1))
+
+    def test_run_due_closes_overdue_sheet(self):
+        """Test that due events run the matching command"""
+        runner = AttendanceScheduler(stdout=StringIO())
+        runner.reload(self.now)
+        self.assertEqual(runner.run_due(self.now), {scheduler.CLOSE})
+        self.assertFalse(Attendance.objects.exists())
+        self.assertEqual(AttendanceHistory.objects.get().grade, self.unscheduled)
+
+        runner.reload(self.now)
+        self.assertEqual(runner.run_due(self.now), set())
+        self.assertLessEqual(runner.seconds_until_next(self.now), scheduler.RESYNC_INTERVAL.total_seconds())
+
+    def test_grade_changes_wake_the_scheduler(self):
+        """Test that saving a grade or schedule notifies the scheduler"""
+        scheduler._wakeup.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.scheduled.lesson_duration = 3
+            self.scheduled.save()
+        self.assertTrue(AttendanceScheduler().wait(0))
+        self.assertFalse(AttendanceScheduler().wait(0))
+
+    def test_listener_reconnects(self):
+        """Test that a dropped LISTEN connection is replaced by a new one"""
+        scheduler._wakeup.clear()
+        first, second = mock.MagicMock(notifies=[]), mock.MagicMock(notifies=['changed'])
+        with mock.patch.object(scheduler, 'connection') as conn, \
+                mock.patch.object(scheduler.select, 'select', side_effect=[OSError('dropped'), ([second], [], [])]):
+            conn.vendor = 'postgresql'
+            conn.get_new_connection.side_effect = [first, second]
+            runner = AttendanceScheduler()
+            with self.assertLogs('Class_related.scheduler', 'ERROR'):
+                self.assertFalse(runner.wait(0))
+            first.close.assert_called_once_with()
+            self.assertTrue(runner.wait(0))
+        self.assertEqual(conn.get_new_connection.call_count, 2)
+        second.cursor.return_value.__enter__.return_value.execute.assert_called_once_with(
+            f'LISTEN {scheduler.SCHEDULE_CHANNEL}'
+        )
+        self.assertEqual(second.notifies, [])
+
+    def test_scheduler_replaces_polling_tasks(self):
+        """Test that the scheduler removes the polling tasks but keeps other queued tasks"""
+        management.call_command('setup_attendance_tasks', stdout=StringIO())
+        Task.objects.create(task_name='People.tasks.generate_student_thumbnails', task_params='[[1], {}]', run_at=self.now)
+        out = StringIO()
+        management.call_command('run_attendance_scheduler', '--once', stdout=out)
+        self.assertIn('Removed 2 polling attendance tasks', out.getvalue())
+        self.assertEqual(list(Task.objects.values_list('task_name', flat=True)), ['People.tasks.generate_student_thumbnails'])
+
+
+class RecordingBroker(live.InProcessBroker):
+    def __init__(self):
+        super().__init__()
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+        super().publish(channel, message)
+
+
+class LiveAttendanceTestCase(TestCase):
+    """Test live attendance updates and the server-sent events stream"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.grade = Grade.objects.create(name='Live Grade', reset_time='10:00:00')
+        self.student = Student.objects.create(first_name='Alice', last_name='Smith', address='x', grade=self.grade)
+        self.attendance = Attendance.objects.create(student=self.student, grade=self.grade)
+        cache.clear()
+
+        self.broker = RecordingBroker()
+        self._previous_broker, live._broker = live._broker, self.broker
+
+    def tearDown(self):
+        live._broker = self._previous_broker
+
+    def test_check_in_publishes_after_commit(self):
+        """Test that a scan is announced once its transaction commits"""
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            checkin.check_in(str(self.student.uuid))
+        self.assertEqual(self.broker.published, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.broker.published, [
+            (live.ATTENDANCE_CHANNEL, {'type': 'attendance', 'ids': [self.attendance.id], 'present': True}),
+        ])
+
+    def test_closing_sheet_publishes(self):
+        """Test that closing a sheet is announced"""
+        with self.captureOnCommitCallbacks(execute=True):
+            close_sheet(self.grade)
+        self.assertEqual(self.broker.published[-1][1], {'type': 'sheet', 'grade_id': self.grade.id, 'action': 'closed'})
+
+    def test_broker_delivers_across_threads(self):
+        """Test that a message published from another thread reaches a subscriber"""
+        async def receive():
+            subscriber = self.broker.subscribe('test')
+            threading.Thread(target=self.broker.publish, args=('test', {'type': 'ping'})).start()
+            try:
+                return await asyncio.wait_for(subscriber[1].get(), 5)
+            finally:
+                self.broker.unsubscribe('test', subscriber)
+
+        self.assertEqual(asyncio.run(receive()), {'type': 'ping'})
+
+    def test_stream_requires_asgi(self):
+        """Test that the stream is not served by WSGI workers"""
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('class_related:attendance_stream'))
+        self.assertEqual(response.status_code, 204)
+
+    async def test_stream_sends_events(self):
+        """Test that the stream forwards published messages as events"""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('class_related:attendance_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        content = aiter(response.streaming_content)
+        self.assertEqual(await anext(content), b'retry: 3000\n\n')
+        pending = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        self.broker.publish(live.ATTENDANCE_CHANNEL, {'type': 'attendance', 'ids': [1], 'present': False})
+        chunk = await asyncio.wait_for(pending, 5)
+        self.assertEqual(chunk, b'event: attendance\ndata: {"type": "attendance", "ids": [1], "present": false}\n\n')
+        await content.aclose()
+
+
+    def test_postgres_listener_reconnects(self):
+        """Test that the LISTEN thread reconnects after its connection drops"""
+        class Stop(BaseException):
+            pass
+
+        attempts = []
+
+        def listen_once(channel):
+            attempts.append(channel)
+            if len(attempts) < 3:
+                raise OSError('connection lost')
+            raise Stop
+
+        broker = live.PostgresBroker()
+        with mock.patch.object(broker, '_listen_once', side_effect=listen_once), \
+                mock.patch.object(live.time, 'sleep') as sleep, \
+                self.assertLogs('Class_related.live', 'ERROR'):
+            with self.assertRaises(Stop):
+                broker._listen(live.ATTENDANCE_CHANNEL)
+        self.assertEqual(attempts, [live.ATTENDANCE_CHANNEL] * 3)
+        self.assertEqual(sleep.call_count, 2)
+
+class BulkMarkAttendanceTestCase(TestCase):
+    """Test marking and un-marking attendance rows in bulk"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        self.grade = Grade.objects.create(name='Bulk Grade', reset_time='10:00:00')
+        self.other_grade = Grade.objects.create(name='Other Grade', reset_time='10:00:00')
+        self.rows = [
+            Attendance.objects.create(
+                student=Student.objects.create(first_name=f'S{i}', last_name='Test', address='x', grade=self.grade),
+                grade=self.grade,
+            )
+            for i in range(30)
+        ]
+        self.other = Attendance.objects.create(
+            student=Student.objects.create(first_name='Other', last_name='Test', address='x', grade=self.other_grade),
+            grade=self.other_grade,
+        )
+        self.url = reverse('class_related:bulk_mark_attendance')
+
+    def _post(self, payload):
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+
+    def test_mark_whole_sheet_single_update(self):
+        """Test that a whole sheet is marked with one UPDATE"""
+        with self.assertNumQueries(2):
+            updated, counts = mark_attendance(True, grade=self.grade)
+        self.assertEqual(updated, 30)
+        self.assertEqual(counts, {self.grade.id: {'present': 30, 'absent': 0, 'total': 30}})
+        self.assertFalse(Attendance.objects.get(id=self.other.id).present)
+        self.assertFalse(Attendance.objects.filter(grade=self.grade, checked_in_at__isnull=True).exists())
+
+    def test_mark_ids_endpoint(self):
+        """Test marking a list of rows and returning the new counts"""
+        ids = [row.id for row in self.rows[:5]]
+        response = self._post({'present': True, 'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['updated'], 5)
+        self.assertEqual(data['grades'], {str(self.grade.id): {'present': 5, 'absent': 25, 'total': 30}})
+
+    def test_unmark_clears_check_in_time(self):
+        """Test that un-marking a row makes it absent again"""
+        checkin.check_in(str(self.rows[0].student.uuid))
+        response = self._post({'present': False, 'ids': [self.rows[0].id]})
+        self.assertEqual(response.json()['grades'][str(self.grade.id)]['present'], 0)
+        row = Attendance.objects.get(id=self.rows[0].id)
+        self.assertFalse(row.present)
+        self.assertIsNone(row.checked_in_at)
+
+    def test_keeps_original_check_in_time(self):
+        """Test that marking an already present row keeps its check-in time"""
+        checkin.check_in(str(self.rows[0].student.uuid))
+        checked_in_at = Attendance.objects.get(id=self.rows[0].id).checked_in_at
+        self._post({'present': True, 'grade': self.grade.id})
+        self.assertEqual(Attendance.objects.get(id=self.rows[0].id).checked_in_at, checked_in_at)
+
+    def test_invalid_requests(self):
+        """Test that malformed requests are rejected"""
+        self.assertEqual(self._post({'ids': [self.rows[0].id]}).status_code, 400)
+        self.assertEqual(self._post({'present': True}).status_code, 400)
+        self.assertEqual(self._post({'present': True, 'ids': ['x']}).status_code, 400)
+        self.assertEqual(self._post({'present': True, 'grade': 9999}).status_code, 404)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+
+class AttendanceAdminQueryTestCase(TestCase):
+    """Test that the admin changelists run a fixed number of queries"""
+
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_superuser(username='classadmin', password='adminpass')
+        self.client.login(username='classadmin', password='adminpass')
+        self.batch = 0
+
+    def _add_rows(self):
+        self.batch += 1
+        for i in range(3):
+            grade = Grade.objects.create(name=f'Grade {self.batch}-{i}', reset_time='10:00:00')
+            students = [
+                Student.objects.create(first_name=f'S{j}', last_name=f'B{self.batch}', address='x', grade=grade)
+                for j in range(3)
+            ]
+            rows = [Attendance.objects.create(student=student, grade=grade, present=j % 2 == 0) for j, student in enumerate(students)]
+            history = AttendanceHistory.objects.create(grade=grade, attendance_records=[])
+            AttendanceRecord.objects.bulk_create(
+                AttendanceRecord(history=history, student=row.student, grade=grade, date=history.attendance_date,
+                                 present=row.present, first_name=row.student.first_name, last_name=row.student.last_name)
+                for row in rows
+            )
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_are_bounded(self):
+        urls = [
+            reverse('admin:Class_related_grade_changelist'),
+            reverse('admin:Class_related_attendance_changelist'),
+            reverse('admin:Class_related_attendancehistory_changelist'),
+            reverse('admin:Class_related_attendancerecord_changelist'),
+        ]
+        self._add_rows()
+        before = [self._queries(url) for url in urls]
+        self._add_rows()
+        self._add_rows()
+        self.assertEqual([self._queries(url) for url in urls], before)
+
+    def test_history_names_from_records(self):
+        self._add_rows()
+        response = self.client.get(reverse('admin:Class_related_attendancehistory_changelist'))
+        self.assertContains(response, 'S0 B1, S2 B1')
+        self.assertContains(response, 'S1 B1')
+
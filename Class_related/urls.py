@@ -7,10 +7,16 @@ urlpatterns = [
     path('api/server-time/', views.server_time, name='server_time'),
     path('api/trigger-attendance-generation/', views.trigger_attendance_generation, name='trigger_attendance_generation'),
     path('api/trigger-attendance-autosave/', views.trigger_attendance_autosave, name='trigger_attendance_autosave'),
+    path('api/attendance-jobs/<uuid:job_id>/', views.attendance_job_status, name='attendance_job_status'),
     path('attendances/', views.attendance_list, name='attendance_list'),
+    path('attendances/stream/', views.attendance_stream, name='attendance_stream'),
+    path('attendances/mark/', views.bulk_mark_attendance, name='bulk_mark_attendance'),
     path('attendances/add/', views.add_attendance, name='add_attendance'),
     path('attendances/delete/<int:grade_id>/', views.delete_attendance, name='delete_attendance'),
     path('attendances/history/', views.attendance_history, name='attendance_history'),
+    path('attendances/history/<int:history_id>/', views.attendance_history_detail, name='attendance_history_detail'),
+    path('api/students/<int:student_id>/attendance-timeline/', views.student_attendance_timeline, name='student_attendance_timeline'),
+    path('api/grades/<int:grade_id>/attendance-timeline/', views.grade_attendance_timeline, name='grade_attendance_timeline'),
     path('grades/', views.grade_list, name='grade_list'),
     path('grades/create/', views.create_grade, name='create_grade'),
     path('grades/<int:grade_id>/delete/', views.delete_grade, name='delete_grade'),
@@ -1,18 +1,29 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
 from django.utils.translation import gettext_lazy as _, ngettext
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
-from django.core import management
 from datetime import datetime
+import asyncio
+import json
 from functools import wraps
 import os
 import logging
-from .models import Grade, Attendance, AttendanceHistory
+from django.utils.dateparse import parse_date
+from django.core.paginator import Paginator
+from django.db.models import Count, Q
+from .models import Grade, Attendance, AttendanceHistory, AttendanceJob, AttendanceRecord
+from .jobs import fail_stale_jobs, job_as_dict, submit_job
+from .live import ATTENDANCE_CHANNEL, format_event, get_broker
+from .scheduler import notify_schedule_changed
+from .checkin import MAX_BATCH_SIZE
+from .sheets import close_sheet, mark_attendance, open_sheet
 from People.models import Student
 
 logger = logging.getLogger(__name__)
@@ -33,23 +44,142 @@ def require_api_token(view_func):
         return view_func(request, *args, **kwargs)
     return wrapper
 
+def _date_param(params, name):
+    """Parse an optional YYYY-MM-DD query parameter; raises ValueError if malformed."""
+    value = params.get(name)
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+def _timeline_response(request, records):
+    """JSON timeline of ``records`` filtered by the ``start``/``end`` dates."""
+    try:
+        start = _date_param(request.GET, 'start')
+        end = _date_param(request.GET, 'end')
+    except ValueError:
+        return JsonResponse({'error': str(_('Dates must be in YYYY-MM-DD format.'))}, status=400)
+
+    records = records.between(start, end)
+    totals = records.aggregate(presences=Count('id', filter=Q(present=True)), absences=Count('id', filter=Q(present=False)))
+    timeline = [
+        {
+            'date': record['date'].isoformat(),
+            'history_id': record['history_id'],
+            'student_id': record['student_id'],
+            'grade_id': record['grade_id'],
+            'name': f"{record['first_name']} {record['last_name']}",
+            'present': record['present'],
+        }
+        for record in records.values('date', 'history_id', 'student_id', 'grade_id', 'first_name', 'last_name', 'present')
+    ]
+    return JsonResponse({'totals': totals, 'records': timeline})
+
+@login_required
+def student_attendance_timeline(request, student_id):
+    """API endpoint with the attendance timeline of one student"""
+    student = get_object_or_404(Student, id=student_id)
+    return _timeline_response(request, AttendanceRecord.objects.for_student(student))
+
+@login_required
+def grade_attendance_timeline(request, grade_id):
+    """API endpoint with the attendance timeline of one grade"""
+    grade = get_object_or_404(Grade, id=grade_id)
+    return _timeline_response(request, AttendanceRecord.objects.for_grade(grade))
+
+HISTORY_PAGE_SIZE = 25
+
 @login_required
 def attendance_history(request):
     grades = Grade.objects.all()
     selected_grade_id = request.GET.get('grade')
-    
+    try:
+        start = _date_param(request.GET, 'start')
+        end = _date_param(request.GET, 'end')
+    except ValueError:
+        start = end = None
+        messages.error(request, _('Dates must be in YYYY-MM-DD format.'))
+
     if selected_grade_id:
-        history = AttendanceHistory.objects.filter(grade_id=selected_grade_id)
+        # Only the session headers are listed; the student lists are loaded
+        # per session from attendance_history_detail when expanded.
+        history = (
+            AttendanceHistory.objects.filter(grade_id=selected_grade_id)
+            .defer('attendance_records')
+            .annotate(
+                present_count=Count('records', filter=Q(records__present=True)),
+                absent_count=Count('records', filter=Q(records__present=False)),
+            )
+            .order_by('-attendance_date', '-id')
+        )
+        if start:
+            history = history.filter(attendance_date__gte=start)
+        if end:
+            history = history.filter(attendance_date__lte=end)
     else:
         history = AttendanceHistory.objects.none()
 
+    page = Paginator(history, HISTORY_PAGE_SIZE).get_page(request.GET.get('page'))
+    params = request.GET.copy()
+    params.pop('page', None)
+
     context = {
         'grades': grades,
-        'history': history,
+        'history': page.object_list,
+        'page_obj': page,
+        'selected_grade': next((g for g in grades if str(g.id) == selected_grade_id), None),
         'selected_grade_id': selected_grade_id,
+        'start': start,
+        'end': end,
+        'query_string': params.urlencode(),
     }
     return render(request, 'attendance_history.html', context)
 
+@login_required
+def attendance_history_detail(request, history_id):
+    """API endpoint with the present and absent students of one session"""
+    history = get_object_or_404(AttendanceHistory.objects.select_related('grade'), id=history_id)
+    return JsonResponse({
+        'id': history.id,
+        'date': history.attendance_date.isoformat(),
+        'grade': history.grade.name if history.grade else None,
+        'present': history.present_students,
+        'absent': history.absent_students,
+    })
+
+LIVE_HEARTBEAT_SECONDS = 15
+
+@login_required
+async def attendance_stream(request):
+    """Server-sent events with live attendance changes (ASGI only)"""
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be tied up for the lifetime of the stream;
+        # 204 tells EventSource not to reconnect.
+        return HttpResponse(status=204)
+
+    async def events():
+        broker = get_broker()
+        subscriber = broker.subscribe(ATTENDANCE_CHANNEL)
+        queue = subscriber[1]
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_event(message)
+        finally:
+            broker.unsubscribe(ATTENDANCE_CHANNEL, subscriber)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
 def attendance_list(request):
     attendances = Attendance.objects.select_related('grade', 'student').order_by('grade')
@@ -74,18 +204,45 @@ def attendance_list(request):
     }
     return render(request, 'attendances.html', context)
 
+@login_required
+@require_POST
+def bulk_mark_attendance(request):
+    """
+    Set presence for several rows at once. JSON body:
+    {"present": true|false, "ids": [attendance ids]} or {"present": ..., "grade": grade id}.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or not isinstance(data.get('present'), bool):
+        return JsonResponse({'error': str(_('Expected a JSON object with a boolean "present".'))}, status=400)
+
+    ids = data.get('ids')
+    if isinstance(data.get('grade'), int):
+        grade = get_object_or_404(Grade, id=data['grade'])
+        updated, counts = mark_attendance(data['present'], grade=grade)
+    elif isinstance(ids, list) and ids and all(isinstance(i, int) for i in ids):
+        if len(ids) > MAX_BATCH_SIZE:
+            return JsonResponse({'error': str(_('Too many attendance ids in one request.'))}, status=400)
+        updated, counts = mark_attendance(data['present'], attendance_ids=ids)
+    else:
+        return JsonResponse({'error': str(_('Provide a "grade" or a list of attendance "ids".'))}, status=400)
+
+    return JsonResponse({
+        'updated': updated,
+        'present': data['present'],
+        'grades': {str(grade_id): grade_counts for grade_id, grade_counts in counts.items()},
+    })
+
 @login_required
 def add_attendance(request):
     if request.method == 'POST':
         grade_id = request.POST.get('grade')
         grade = get_object_or_404(Grade, id=grade_id)
-        students = Student.objects.filter(grade=grade, active=True)
-        
-        attendance_records = [
-            Attendance(student=student, grade=grade, present=False)
-            for student in students
-        ]
-        Attendance.objects.bulk_create(attendance_records)
+        open_sheet(grade)
+        # Let the scheduler pick up the closing time of the new sheet
+        notify_schedule_changed()
         return redirect('class_related:attendance_list')
     return redirect('class_related:attendance_list')
 
@@ -93,32 +250,13 @@ def add_attendance(request):
 def delete_attendance(request, grade_id):
     if request.method == 'POST':
         grade = get_object_or_404(Grade, id=grade_id)
-        attendances = Attendance.objects.filter(grade=grade)
-
-        attendance_records = []
-        for record in attendances:
-            attendance_records.append({
-                'first_name': record.student.first_name,
-                'last_name': record.student.last_name,
-                'present': record.present,
-            })
-            if record.present:
-                record.student.presences += 1
-            else:
-                record.student.absences += 1
-            record.student.save()
-
-        AttendanceHistory.objects.create(
-            attendance_records=attendance_records,
-            grade=grade
-        )
-        attendances.delete()
+        close_sheet(grade)
         return redirect('class_related:attendance_list')
     return redirect('class_related:attendance_list')
 
 @login_required
 def grade_list(request):
-    grades = Grade.objects.all()
+    grades = Grade.objects.prefetch_related('student_set', 'schedules')
     unassigned_students = Student.objects.filter(grade__isnull=True)
     context = {
         'grades': grades,
@@ -195,26 +333,36 @@ def server_time(request):
         'full_display': f"{weekday_name}, {now.strftime('%d %b %Y')} - {now.strftime('%H:%M:%S')} UTC"
     })
 
+def _submit_job_response(request, kind):
+    idempotency_key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+    max_length = AttendanceJob._meta.get_field('idempotency_key').max_length
+    if idempotency_key and len(idempotency_key) > max_length:
+        return JsonResponse({'error': str(_('Idempotency key must be at most %(max_length)s characters.') % {'max_length': max_length})}, status=400)
+    job, created = submit_job(kind, idempotency_key)
+    data = job_as_dict(job)
+    data.update({
+        'status': 'accepted' if created else 'duplicate',
+        'status_url': reverse('class_related:attendance_job_status', args=[job.id]),
+    })
+    return JsonResponse(data, status=202 if created else 200)
+
 @csrf_exempt
 @require_POST
 @require_api_token
 def trigger_attendance_generation(request):
-    """API endpoint to trigger attendance generation"""
-    try:
-        management.call_command('generate_attendance')
-        return JsonResponse({'status': 'success', 'message': 'Attendance generation triggered'})
-    except Exception as e:
-        logger.error(f'Error triggering attendance generation: {e}', exc_info=True)
-        return JsonResponse({'error': 'Failed to trigger attendance generation'}, status=500)
+    """API endpoint to queue attendance generation"""
+    return _submit_job_response(request, AttendanceJob.GENERATE)
 
 @csrf_exempt
 @require_POST
 @require_api_token
 def trigger_attendance_autosave(request):
-    """API endpoint to trigger attendance autosave"""
-    try:
-        management.call_command('autosave_attendance')
-        return JsonResponse({'status': 'success', 'message': 'Attendance autosave triggered'})
-    except Exception as e:
-        logger.error(f'Error triggering attendance autosave: {e}', exc_info=True)
-        return JsonResponse({'error': 'Failed to trigger attendance autosave'}, status=500)
+    """API endpoint to queue attendance autosave"""
+    return _submit_job_response(request, AttendanceJob.AUTOSAVE)
+
+@require_api_token
+def attendance_job_status(request, job_id):
+    """API endpoint with the state and results of a queued job"""
+    fail_stale_jobs()
+    job = get_object_or_404(AttendanceJob, id=job_id)
+    return JsonResponse(job_as_dict(job))
@@ -1,11 +1,18 @@
 from django.contrib import admin
-from django import forms
 from django.utils.translation import gettext_lazy as _
-from .models import PaymentPlan, Month, Payment, Receipt
+from People.pagination import EstimatedCountAdminMixin
+from .ledger import deferred_totals
+from .models import PaymentPlan, Month, Payment, Receipt, ReceiptSequence
 
 class ReceiptInline(admin.TabularInline):
     model = Receipt
     extra = 1
+    # Numbers are allocated on save (Payments.numbering)
+    readonly_fields = ('receipt_number',)
+
+    def get_queryset(self, request):
+        # Receipt.__str__ shows the payment's student
+        return super().get_queryset(request).select_related('payment__student')
 
 class PaymentPlanAdmin(admin.ModelAdmin):
     list_display = ('name', 'one_time_fee', 'monthly_fee')
@@ -24,56 +31,82 @@ class PaymentPlanAdmin(admin.ModelAdmin):
         }),
     )
 
-class PaymentForm(forms.ModelForm):
-    class Meta:
-        model = Payment
-        fields = '__all__'
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        if 'payment_plan' in self.data:
-            try:
-                payment_plan_id = int(self.data.get('payment_plan'))
-                self.fields['months_paid'].queryset = Month.objects.filter(payment_plans__id=payment_plan_id)
-            except (ValueError, TypeError):
-                pass
-        elif self.instance.pk:
-            self.fields['months_paid'].queryset = self.instance.payment_plan.months.all()
-
-class PaymentAdmin(admin.ModelAdmin):
-    form = PaymentForm
+class PaymentAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     inlines = [ReceiptInline]
 
+    def get_queryset(self, request):
+        return (
+            super().get_queryset(request)
+            .select_related('student', 'payment_plan', 'paid_through')
+            .prefetch_related('months_paid', 'payment_plan__months')
+        )
+
     def display_months_paid(self, obj):
         return ", ".join([month.name for month in obj.months_paid.all()])
     display_months_paid.short_description = _('Paid Months')
 
     def total_amount_paid(self, obj):
-        return sum(receipt.amount_paid for receipt in obj.receipts.all())
+        return obj.total_paid
     total_amount_paid.short_description = _('Total Amount Paid')
+    total_amount_paid.admin_order_field = 'total_paid'
 
     def display_months_unpaid(self, obj):
-        months_from_plan = set(obj.payment_plan.months.values_list('id', flat=True))
-        months_paid_ids = set(obj.months_paid.values_list('id', flat=True))
-        unpaid_months_ids = months_from_plan - months_paid_ids
-        unpaid_months = Month.objects.filter(id__in=unpaid_months_ids)
-        return ", ".join([month.name for month in unpaid_months])
+        paid_ids = {month.id for month in obj.months_paid.all()}
+        return ", ".join([month.name for month in obj.payment_plan.months.all() if month.id not in paid_ids])
     display_months_unpaid.short_description = _('Unpaid Months')
 
     list_display = ('student', 'payment_plan', 'academic_year', 'one_time_fee_paid', 'display_months_paid', 'display_months_unpaid', 'total_amount_paid')
     search_fields = ('student__first_name', 'student__last_name', 'payment_plan__name')
     autocomplete_fields = ['student', 'payment_plan']
-    readonly_fields = ('display_months_paid', 'display_months_unpaid')
+    # Recomputed from the receipts (Payments.ledger), so edits would be lost
+    readonly_fields = ('display_months_paid', 'display_months_unpaid', 'months_paid', 'total_paid', 'paid_through')
 
     fieldsets = (
         (None, {
             'fields': ('student', 'payment_plan', 'one_time_fee_paid')
         }),
         (_('Months Management'), {
-            'fields': ('months_paid',),
+            'fields': ('months_paid', 'paid_through', 'total_paid'),
         }),
     )
 
+    def save_related(self, request, form, formsets, change):
+        # Receipts saved through the inline update the payment's totals once
+        with deferred_totals():
+            super().save_related(request, form, formsets, change)
+
+class ReceiptAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+    list_display = ('receipt_number', 'received_on', 'student', 'payment_plan', 'academic_year', 'amount_paid', 'description')
+    list_filter = ('received_on',)
+    list_select_related = ('payment__student', 'payment__payment_plan')
+    search_fields = ('receipt_number', 'payment__student__first_name', 'payment__student__last_name')
+    raw_id_fields = ('payment',)
+    # Numbers are allocated on save (Payments.numbering)
+    readonly_fields = ('receipt_number',)
+
+    def student(self, obj):
+        return obj.payment.student
+    student.short_description = _('Student')
+    student.admin_order_field = 'payment__student__last_name'
+
+    def payment_plan(self, obj):
+        return obj.payment.payment_plan
+    payment_plan.short_description = _('Payment Plan')
+
+    def academic_year(self, obj):
+        return obj.payment.academic_year
+    academic_year.short_description = _('Academic Year')
+    academic_year.admin_order_field = 'payment__academic_year'
+
+class ReceiptSequenceAdmin(admin.ModelAdmin):
+    list_display = ('academic_year', 'last_number')
+    readonly_fields = ('academic_year', 'last_number')
+
+    def has_add_permission(self, request):
+        return False
+
 admin.site.register(Payment, PaymentAdmin)
 admin.site.register(PaymentPlan, PaymentPlanAdmin)
 admin.site.register(Month)
+admin.site.register(Receipt, ReceiptAdmin)
+admin.site.register(ReceiptSequence, ReceiptSequenceAdmin)
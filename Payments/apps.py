@@ -1,11 +1,27 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class PaymentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Payments'
-    
 
-    
-    
-    
\ No newline at end of file
+    def ready(self):
+        from .arrears import arrears_changed
+        from .dashboard import dashboard_changed
+
+        # Receipts reach the arrears report through Payment.total_paid, saved by
+        # the ledger; the dashboard's revenue is read from the receipts themselves.
+        receivers = {
+            'arrears_changed': (arrears_changed, ('Payment', 'PaymentPlan')),
+            'dashboard_changed': (dashboard_changed, ('Receipt', 'Payment', 'PaymentPlan')),
+        }
+        for name, (receiver, model_names) in receivers.items():
+            for model_name in model_names:
+                model = self.get_model(model_name)
+                post_save.connect(receiver, sender=model, dispatch_uid=f'{name}_save_{model_name}')
+                post_delete.connect(receiver, sender=model, dispatch_uid=f'{name}_delete_{model_name}')
+            m2m_changed.connect(
+                receiver, sender=self.get_model('PaymentPlan').months.through,
+                dispatch_uid=f'{name}_plan_months',
+            )
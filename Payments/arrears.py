@@ -0,0 +1,178 @@
+"""
+Arrears report.
+
+For every payment the plan's one-time fee and monthly fees are expected, and
+the payment's ``total_paid`` (its receipts, see ``Payments.ledger``) is
+allocated to them by due date: the one-time fee first, then the plan months
+from September on, so a September–June plan is paid through December before
+January. A fee is overdue once its due date has passed: the start of the
+academic year for the one-time fee and the first day of the month for
+monthly fees.
+
+The per-fee rows are built from two queries and cached until a payment,
+plan or receipt changes; due dates are compared at read time, so the cache
+doesn't go stale overnight. Totals per academic year and plan are summed by
+the database (``arrears_totals``).
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Payment, PaymentPlan
+
+ARREARS_CACHE_KEY = 'payments:arrears_rows'
+# Safety net for processes whose cache was not invalidated (e.g. local memory)
+ARREARS_CACHE_TIMEOUT = 300  # seconds
+ACADEMIC_YEAR_START_MONTH = 9  # September
+ONE_TIME_FEE = 'One-time fee'
+
+
+def _start_year(academic_year):
+    try:
+        return int(academic_year.split('-')[0])
+    except (AttributeError, ValueError):
+        return None
+
+
+def _academic_position(month_order):
+    """0 for the first month of the academic year, 11 for the last."""
+    return (month_order - ACADEMIC_YEAR_START_MONTH) % 12
+
+
+def _due_date(start_year, month_order):
+    """First day of the month in the academic year starting in ``start_year``."""
+    if start_year is None:
+        return None
+    year = start_year if month_order >= ACADEMIC_YEAR_START_MONTH else start_year + 1
+    return date(year, month_order, 1)
+
+
+def _load_rows():
+    plan_months = {}
+    for plan_id, name, order in PaymentPlan.months.through.objects.values_list(
+        'paymentplan_id', 'month__name', 'month__order',
+    ):
+        plan_months.setdefault(plan_id, []).append((name, order))
+    for months in plan_months.values():
+        months.sort(key=lambda month: _academic_position(month[1]))
+
+    payments = Payment.objects.filter(student__isnull=False).values(
+        'id', 'academic_year', 'total_paid', 'payment_plan_id', 'payment_plan__name',
+        'payment_plan__one_time_fee', 'payment_plan__monthly_fee',
+        'student_id', 'student__student_id', 'student__first_name', 'student__last_name',
+    ).order_by('student__last_name', 'student__first_name', 'academic_year', 'id')
+
+    rows = []
+    for payment in payments:
+        start_year = _start_year(payment['academic_year'])
+        fees = []
+        if payment['payment_plan__one_time_fee'] > 0:
+            fees.append((ONE_TIME_FEE, payment['payment_plan__one_time_fee'], _due_date(start_year, ACADEMIC_YEAR_START_MONTH)))
+        if payment['payment_plan__monthly_fee'] > 0:
+            fees += [
+                (name, payment['payment_plan__monthly_fee'], _due_date(start_year, order))
+                for name, order in plan_months.get(payment['payment_plan_id'], [])
+            ]
+
+        remaining = payment['total_paid']
+        for item, expected, due_date in fees:
+            paid = min(max(remaining, Decimal(0)), expected)
+            remaining -= paid
+            rows.append({
+                'payment_id': payment['id'],
+                'student_id': payment['student_id'],
+                'student_code': payment['student__student_id'],
+                'student': f"{payment['student__first_name']} {payment['student__last_name']}",
+                'academic_year': payment['academic_year'],
+                'plan': payment['payment_plan__name'],
+                'item': item,
+                'due_date': due_date,
+                'expected': expected,
+                'paid': paid,
+                'outstanding': expected - paid,
+            })
+    return rows
+
+
+def arrears_rows(refresh=False):
+    """Cached list of expected/paid/outstanding rows, one per fee of every payment."""
+    rows = None if refresh else cache.get(ARREARS_CACHE_KEY)
+    if rows is None:
+        rows = _load_rows()
+        cache.set(ARREARS_CACHE_KEY, rows, ARREARS_CACHE_TIMEOUT)
+    return rows
+
+
+def invalidate_arrears_cache():
+    """Call whenever payments, plans or receipts change."""
+    cache.delete(ARREARS_CACHE_KEY)
+    # Again once committed, in case a reader cached the old rows meanwhile.
+    transaction.on_commit(lambda: cache.delete(ARREARS_CACHE_KEY))
+
+
+def arrears_totals(academic_year=None):
+    """
+    Expected, paid and outstanding amounts per academic year and plan, one
+    GROUP BY over the payments ledger. Overpayments don't offset other
+    payments' balances, as in the per-fee rows.
+    """
+    payments = Payment.objects.with_ledger().filter(student__isnull=False)
+    if academic_year:
+        payments = payments.filter(academic_year=academic_year)
+    return list(
+        payments.values('academic_year', plan=F('payment_plan__name'))
+        .annotate(
+            payments=Count('id'),
+            expected=Sum('amount_due'),
+            paid=Sum('total_paid'),
+            balance=Sum(Greatest('balance', Value(Decimal(0)))),
+        )
+        .order_by('-academic_year', 'plan')
+    )
+
+
+def is_overdue(row, today):
+    return row['outstanding'] > 0 and (row['due_date'] is None or row['due_date'] <= today)
+
+
+def filter_rows(rows, academic_year=None, overdue_only=False, today=None):
+    today = today or timezone.localdate()
+    return [
+        row for row in rows
+        if (not academic_year or row['academic_year'] == academic_year)
+        and (not overdue_only or is_overdue(row, today))
+    ]
+
+
+def arrears_summary(rows, today=None):
+    """
+    Totals per payment (student and academic year): ``expected``, ``paid``,
+    ``balance``, ``overdue`` and the ``overdue_items`` names, largest
+    overdue amount first.
+    """
+    today = today or timezone.localdate()
+    summary = {}
+    for row in rows:
+        entry = summary.get(row['payment_id'])
+        if entry is None:
+            entry = summary[row['payment_id']] = {
+                key: row[key] for key in ('payment_id', 'student_id', 'student_code', 'student', 'academic_year', 'plan')
+            }
+            entry.update(expected=Decimal(0), paid=Decimal(0), balance=Decimal(0), overdue=Decimal(0), overdue_items=[])
+        entry['expected'] += row['expected']
+        entry['paid'] += row['paid']
+        entry['balance'] += row['outstanding']
+        if is_overdue(row, today):
+            entry['overdue'] += row['outstanding']
+            entry['overdue_items'].append(row['item'])
+    return sorted(summary.values(), key=lambda entry: (-entry['overdue'], -entry['balance'], entry['student']))
+
+
+def arrears_changed(sender, **kwargs):
+    """Signal receiver for changes to payments, plans and plan months."""
+    invalidate_arrears_cache()
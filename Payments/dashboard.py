@@ -0,0 +1,91 @@
+"""
+Finance dashboard.
+
+Revenue per month and per plan, collected versus expected per academic year
+and the top debtors, each computed with one GROUP BY query over receipts or
+payments. The result is cached until a receipt, payment or plan changes, so
+page loads don't aggregate the receipts table again.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Payment, Receipt
+
+DASHBOARD_CACHE_KEY = 'payments:finance_dashboard'
+# Safety net for processes whose cache was not invalidated (e.g. local memory)
+DASHBOARD_CACHE_TIMEOUT = 300  # seconds
+TOP_DEBTORS = 10
+
+
+def _revenue_by_month():
+    return list(
+        Receipt.objects.annotate(month=TruncMonth('received_on'))
+        .values('month')
+        .annotate(total=Sum('amount_paid'), receipts=Count('id'))
+        .order_by('-month')
+    )
+
+
+def _revenue_by_plan():
+    return list(
+        Receipt.objects.values(plan=F('payment__payment_plan__name'))
+        .annotate(total=Sum('amount_paid'), receipts=Count('id'))
+        .order_by('-total', 'plan')
+    )
+
+
+def _academic_years():
+    years = list(
+        Payment.objects.with_ledger()
+        .values('academic_year')
+        .annotate(payments=Count('id'), expected=Sum('amount_due'), collected=Sum('total_paid'))
+        .order_by('-academic_year')
+    )
+    for year in years:
+        year['outstanding'] = year['expected'] - year['collected']
+    return years
+
+
+def _top_debtors(limit):
+    return list(
+        Payment.objects.with_ledger().outstanding()
+        .filter(student__isnull=False)
+        .values('student_id', 'student__student_id', 'student__first_name', 'student__last_name')
+        .annotate(owed=Sum('balance'), payments=Count('id'))
+        .order_by('-owed', 'student__last_name', 'student__first_name')[:limit]
+    )
+
+
+def _load_dashboard():
+    years = _academic_years()
+    return {
+        'revenue_by_month': _revenue_by_month(),
+        'revenue_by_plan': _revenue_by_plan(),
+        'academic_years': years,
+        'top_debtors': _top_debtors(TOP_DEBTORS),
+        'expected': sum(year['expected'] for year in years),
+        'collected': sum(year['collected'] for year in years),
+    }
+
+
+def dashboard_data(refresh=False):
+    """Cached dashboard figures; see the module docstring."""
+    data = None if refresh else cache.get(DASHBOARD_CACHE_KEY)
+    if data is None:
+        data = _load_dashboard()
+        cache.set(DASHBOARD_CACHE_KEY, data, DASHBOARD_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_dashboard_cache():
+    """Call whenever receipts, payments or plans change."""
+    cache.delete(DASHBOARD_CACHE_KEY)
+    # Again once committed, in case a reader cached the old figures meanwhile.
+    transaction.on_commit(lambda: cache.delete(DASHBOARD_CACHE_KEY))
+
+
+def dashboard_changed(sender, **kwargs):
+    """Signal receiver for changes to receipts, payments, plans and plan months."""
+    invalidate_dashboard_cache()
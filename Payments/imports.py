@@ -0,0 +1,202 @@
+"""
+Bulk receipt import from bank statement CSVs.
+
+The file is read as a stream and handled ``chunk_size`` rows at a time: each
+chunk is matched to payments and checked against existing receipt numbers
+with one query each, and its valid rows are inserted with ``bulk_create``.
+``bulk_create`` sends no signals, so the payment totals are updated once per
+affected payment at the end of the import (see ``Payments.ledger``).
+
+Expected columns: ``student_id``, ``plan`` (plan name), ``academic_year``,
+``amount`` and optionally ``receipt_number``, ``description`` and
+``received_on`` (in one of ``DATE_INPUT_FORMATS``). Rows without a receipt
+number are numbered from a block reserved per academic year (see
+``Payments.numbering``); rows without a date are imported undated rather
+than dated the day of the import, which would skew the revenue per month.
+Values are checked against the model fields' limits, and rows that can't
+be imported are skipped and listed in the report.
+"""
+import csv
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .ledger import apply_paid_amount
+from .models import Payment, Receipt
+from .numbering import reserve_receipt_numbers
+
+IMPORT_CHUNK_SIZE = 500
+REQUIRED_COLUMNS = ('student_id', 'plan', 'academic_year', 'amount')
+
+
+class ReceiptImportError(ValueError):
+    """The file can't be imported at all, e.g. because columns are missing."""
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _value(row, column):
+    return (row.get(column) or '').strip()
+
+
+def _payment_key(student_id, plan, academic_year):
+    return (student_id, plan.lower(), academic_year)
+
+
+def _match_payments(chunk):
+    """Payment ids by (student ID, plan name, academic year) for the chunk's students."""
+    student_ids = {_value(row, 'student_id') for _, row in chunk}
+    payments = defaultdict(list)
+    for payment in Payment.objects.filter(student__student_id__in=student_ids).values(
+        'id', 'student__student_id', 'payment_plan__name', 'academic_year',
+    ):
+        key = _payment_key(payment['student__student_id'], payment['payment_plan__name'], payment['academic_year'])
+        payments[key].append(payment['id'])
+    return payments
+
+
+def _clean(field, value, *args):
+    """``(value, None)`` cleaned by the model or form ``field``, or ``(None, message)``."""
+    try:
+        return field.clean(value, *args), None
+    except ValidationError as e:
+        return None, ' '.join(e.messages)
+
+
+def _row_error(line, row, message):
+    return {
+        'line': line,
+        'student_id': _value(row, 'student_id'),
+        'receipt_number': _value(row, 'receipt_number'),
+        'error': message,
+    }
+
+
+def _validate_chunk(chunk, seen_numbers):
+    """
+    Split a chunk of ``(line, row)`` pairs into unsaved receipts, the
+    receipts without a number by academic year, and row errors.
+    """
+    payments = _match_payments(chunk)
+    existing_numbers = set(
+        Receipt.objects.filter(receipt_number__in={_value(row, 'receipt_number') for _, row in chunk})
+        .values_list('receipt_number', flat=True)
+    )
+    amount_field = Receipt._meta.get_field('amount_paid')
+    number_field = Receipt._meta.get_field('receipt_number')
+    description_field = Receipt._meta.get_field('description')
+    date_field = forms.DateField(required=False, input_formats=settings.DATE_INPUT_FORMATS)
+
+    receipts, unnumbered, errors = [], defaultdict(list), []
+    for line, row in chunk:
+        missing = [column for column in REQUIRED_COLUMNS if not _value(row, column)]
+        if missing:
+            errors.append(_row_error(line, row, f'Missing {", ".join(missing)}'))
+            continue
+
+        try:
+            amount = Decimal(_value(row, 'amount'))
+        except InvalidOperation:
+            amount = None
+        if amount is None or not amount.is_finite() or amount <= 0:
+            errors.append(_row_error(line, row, 'Invalid amount'))
+            continue
+        amount, error = _clean(amount_field, amount, None)
+        if error:
+            errors.append(_row_error(line, row, f'Invalid amount: {error}'))
+            continue
+
+        number, error = _clean(number_field, _value(row, 'receipt_number'), None)
+        if error:
+            errors.append(_row_error(line, row, f'Invalid receipt number: {error}'))
+            continue
+        if number and (number in existing_numbers or number in seen_numbers):
+            errors.append(_row_error(line, row, 'Duplicate receipt number'))
+            continue
+        if number.startswith(f"{_value(row, 'academic_year')}/"):
+            # Would clash with the allocated numbers; leave it blank instead
+            errors.append(_row_error(line, row, 'Receipt number uses the automatic numbering format'))
+            continue
+
+        description, error = _clean(description_field, _value(row, 'description'), None)
+        if error:
+            errors.append(_row_error(line, row, f'Invalid description: {error}'))
+            continue
+
+        received_on, error = _clean(date_field, _value(row, 'received_on'))
+        if error:
+            errors.append(_row_error(line, row, f'Invalid date: {error}'))
+            continue
+
+        matches = payments.get(_payment_key(
+            _value(row, 'student_id'), _value(row, 'plan'), _value(row, 'academic_year'),
+        ), [])
+        if not matches:
+            errors.append(_row_error(line, row, 'No matching payment'))
+            continue
+        if len(matches) > 1:
+            errors.append(_row_error(line, row, 'Several matching payments'))
+            continue
+
+        receipt = Receipt(
+            payment_id=matches[0], receipt_number=number, description=description,
+            amount_paid=amount, received_on=received_on,
+        )
+        receipts.append(receipt)
+        if number:
+            seen_numbers.add(number)
+        else:
+            unnumbered[_value(row, 'academic_year')].append(receipt)
+    return receipts, unnumbered, errors
+
+
+def import_receipts(stream, dry_run=False, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Import the receipts of the CSV text ``stream``. With ``dry_run`` nothing
+    is written and the report shows what would be imported. Returns a dict
+    with the ``rows`` read, the receipts ``imported``, the ``payments``
+    updated and the row ``errors``.
+    """
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None:
+        raise ReceiptImportError('The file is empty.')
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    missing = [column for column in REQUIRED_COLUMNS if column not in reader.fieldnames]
+    if missing:
+        raise ReceiptImportError(f'Missing columns: {", ".join(missing)}')
+
+    report = {'rows': 0, 'imported': 0, 'payments': 0, 'errors': [], 'dry_run': dry_run}
+    amounts = defaultdict(Decimal)
+    seen_numbers = set()
+    with transaction.atomic():
+        # Line 1 is the header
+        for chunk in _chunks(enumerate(reader, start=2), chunk_size):
+            receipts, unnumbered, errors = _validate_chunk(chunk, seen_numbers)
+            if not dry_run:
+                for academic_year, numberless in unnumbered.items():
+                    numbers = reserve_receipt_numbers(academic_year, len(numberless))
+                    for receipt, number in zip(numberless, numbers):
+                        receipt.receipt_number = number
+                Receipt.objects.bulk_create(receipts)
+            for receipt in receipts:
+                amounts[receipt.payment_id] += receipt.amount_paid
+            report['rows'] += len(chunk)
+            report['imported'] += len(receipts)
+            report['errors'] += errors
+            if progress:
+                progress(report)
+
+        if not dry_run:
+            for payment_id, amount in amounts.items():
+                apply_paid_amount(payment_id, amount)
+    report['payments'] = len(amounts)
+    return report
@@ -0,0 +1,105 @@
+"""
+Running payment totals.
+
+``Payment.total_paid`` and ``Payment.paid_through`` follow the payment's
+receipts: every receipt change adds its amount to the total under a row
+lock on the payment, then ``months_paid`` is brought in line with the new
+total, writing only the months that changed.
+
+Inside ``deferred_totals()`` the changes are collected instead and applied
+once per payment when the block exits, so saving several receipts at once
+(e.g. the admin inline) recalculates each payment a single time.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+
+_local = threading.local()
+
+
+def months_covered(plan, total_paid, one_time_fee_paid):
+    """
+    Split ``total_paid`` between the one-time and monthly fees of ``plan``.
+    Returns ``(one_time_fee_paid, months)``, where ``months`` is the number
+    of plan months paid for, or None when the months should be left as is.
+    """
+    monthly_fee_paid = total_paid
+    if plan.one_time_fee > 0:
+        if not one_time_fee_paid and total_paid < plan.one_time_fee:
+            return False, None
+        one_time_fee_paid = True
+        monthly_fee_paid -= plan.one_time_fee
+    if plan.monthly_fee <= 0:
+        return one_time_fee_paid, None
+    return one_time_fee_paid, max(int(monthly_fee_paid // plan.monthly_fee), 0)
+
+
+def _sync_months_paid(payment, month_ids):
+    current = set(payment.months_paid.values_list('id', flat=True))
+    if current - month_ids:
+        payment.months_paid.remove(*(current - month_ids))
+    if month_ids - current:
+        payment.months_paid.add(*(month_ids - current))
+
+
+def apply_paid_amount(payment_id, amount):
+    """
+    Add ``amount`` (negative for refunds and deleted receipts) to the
+    payment's running total and update its paid months. Returns the
+    payment, or None if it no longer exists.
+    """
+    from .models import Payment
+
+    with transaction.atomic():
+        payment = (
+            Payment.objects.select_for_update(of=('self',))
+            .select_related('payment_plan')
+            .filter(pk=payment_id)
+            .first()
+        )
+        if payment is None:
+            return None
+
+        payment.total_paid += amount
+        payment.one_time_fee_paid, months = months_covered(
+            payment.payment_plan, payment.total_paid, payment.one_time_fee_paid,
+        )
+        update_fields = ['total_paid', 'one_time_fee_paid']
+        if months is not None:
+            paid = list(payment.payment_plan.months.order_by('order')[:months])
+            payment.paid_through = paid[-1] if paid else None
+            update_fields.append('paid_through')
+            _sync_months_paid(payment, {month.id for month in paid})
+        payment.save(update_fields=update_fields)
+    return payment
+
+
+def record_paid_amount(payment_id, amount):
+    """Apply ``amount`` to the payment now, or on exit of ``deferred_totals``."""
+    amount = Decimal(str(amount))
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending[payment_id] += amount
+    else:
+        apply_paid_amount(payment_id, amount)
+
+
+@contextmanager
+def deferred_totals():
+    """Apply the receipt changes made inside the block once per payment."""
+    if getattr(_local, 'pending', None) is not None:
+        # Nested: the outer block applies everything.
+        yield
+        return
+
+    _local.pending = defaultdict(Decimal)
+    try:
+        yield
+        pending = _local.pending
+    finally:
+        _local.pending = None
+    for payment_id, amount in pending.items():
+        apply_paid_amount(payment_id, amount)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from Payments.imports import IMPORT_CHUNK_SIZE, ReceiptImportError, import_receipts
+
+
+class Command(BaseCommand):
+    help = 'Import receipts from a bank statement CSV (student_id, plan, academic_year, amount, receipt_number, description)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be imported and which rows do not match',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=IMPORT_CHUNK_SIZE,
+            help='Number of rows validated and inserted at a time',
+        )
+
+    def handle(self, *args, **options):
+        def progress(report):
+            self.stdout.write(f'{report["rows"]} rows read, {report["imported"]} receipts...')
+
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+                self.report = import_receipts(
+                    stream, dry_run=options['dry_run'], chunk_size=options['chunk_size'], progress=progress,
+                )
+        except (OSError, UnicodeDecodeError, ReceiptImportError) as e:
+            raise CommandError(str(e))
+
+        for error in self.report['errors']:
+            self.stdout.write(self.style.WARNING(
+                f'Line {error["line"]}: {error["error"]} '
+                f'(student {error["student_id"] or "-"}, receipt {error["receipt_number"] or "-"})'
+            ))
+        verb = 'Would import' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {self.report["imported"]} of {self.report["rows"]} receipts '
+            f'for {self.report["payments"]} payments; {len(self.report["errors"])} rows skipped.'
+        ))
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from Payments.models import PaymentPlan
+from Payments.rollover import ROLLOVER_BATCH_SIZE, RolloverError, current_academic_year, rollover_payments
+
+
+class Command(BaseCommand):
+    help = "Create the new academic year's payment for every active student"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--academic-year',
+            help='Academic year to create, e.g. 2025-2026 (default: the current one)',
+        )
+        parser.add_argument(
+            '--from-year',
+            help='Academic year whose plans are carried over (default: the year before)',
+        )
+        parser.add_argument(
+            '--plan',
+            help='Name of the payment plan to use for every student',
+        )
+        parser.add_argument(
+            '--no-carry-over',
+            action='store_true',
+            help="Use each student's payment plan instead of last year's",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many payments would be created',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ROLLOVER_BATCH_SIZE,
+            help='Number of payments inserted at a time',
+        )
+
+    def handle(self, *args, **options):
+        plan = None
+        if options['plan']:
+            plan = PaymentPlan.objects.filter(name__iexact=options['plan']).first()
+            if plan is None:
+                raise CommandError(f'No payment plan named {options["plan"]!r}.')
+
+        def progress(report):
+            self.stdout.write(f'{report["created"]} payments...')
+
+        try:
+            self.report = rollover_payments(
+                options['academic_year'] or current_academic_year(),
+                plan=plan,
+                carry_over=not options['no_carry_over'],
+                from_year=options['from_year'],
+                dry_run=options['dry_run'],
+                batch_size=options['batch_size'],
+                progress=progress,
+            )
+        except RolloverError as e:
+            raise CommandError(str(e))
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {self.report["created"]} payments for {self.report["academic_year"]} '
+            f'({self.report["students"]} active students; {self.report["existing"]} already had one, '
+            f'{self.report["without_plan"]} have no plan).'
+        ))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_totals(apps, schema_editor):
+    """Set total_paid from the receipts and paid_through from the paid months."""
+    Payment = apps.get_model('Payments', 'Payment')
+    Receipt = apps.get_model('Payments', 'Receipt')
+    Month = apps.get_model('Payments', 'Month')
+
+    receipts = (
+        Receipt.objects.filter(payment=OuterRef('pk'))
+        .order_by()
+        .values('payment')
+        .annotate(total=Sum('amount_paid'))
+        .values('total')
+    )
+    Payment.objects.update(
+        total_paid=Coalesce(Subquery(receipts), Value(0), output_field=DecimalField(max_digits=12, decimal_places=2)),
+    )
+    last_paid = Month.objects.filter(paid=OuterRef('pk')).order_by('-order').values('id')[:1]
+    Payment.objects.update(paid_through=Subquery(last_paid))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Payments', '0006_populate_months'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='paid_through',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Payments.month', verbose_name='Paid Through'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='total_paid',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Total Paid'),
+        ),
+        migrations.RunPython(populate_totals, migrations.RunPython.noop),
+    ]
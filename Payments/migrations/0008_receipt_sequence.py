@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Payments', '0007_payment_running_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('academic_year', models.CharField(max_length=9, unique=True, verbose_name='Academic Year')),
+                ('last_number', models.PositiveIntegerField(default=0, verbose_name='Last Number')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='receipt',
+            name='receipt_number',
+            field=models.CharField(blank=True, max_length=100, unique=True, verbose_name='Receipt Number'),
+        ),
+    ]
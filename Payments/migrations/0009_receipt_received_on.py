@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Payments', '0008_receipt_sequence'),
+    ]
+
+    operations = [
+        # Added without a default first so existing receipts stay undated
+        # instead of all being dated the day of the migration.
+        migrations.AddField(
+            model_name='receipt',
+            name='received_on',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='Received On'),
+        ),
+        migrations.AlterField(
+            model_name='receipt',
+            name='received_on',
+            field=models.DateField(blank=True, db_index=True, default=django.utils.timezone.localdate, null=True, verbose_name='Received On'),
+        ),
+    ]
@@ -1,9 +1,15 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from People.models import Student
+from .ledger import record_paid_amount
+from .numbering import next_receipt_number
 
 class Month(models.Model):
     name = models.CharField(max_length=20, unique=True)
@@ -25,12 +31,53 @@ class PaymentPlan(models.Model):
     def __str__(self):
         return self.name
 
+def _money(expression):
+    return ExpressionWrapper(expression, output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _subquery_count(model, field, outer):
+    counted = (
+        model.objects.filter(**{field: OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+class PaymentQuerySet(models.QuerySet):
+    def with_ledger(self):
+        """
+        Annotate ``plan_months``, ``paid_months``, ``amount_due`` and
+        ``balance``. The counts are correlated subqueries, so the joins
+        don't multiply each other's rows.
+        """
+        return self.select_related('student', 'payment_plan').annotate(
+            plan_months=_subquery_count(PaymentPlan.months.through, 'paymentplan', 'payment_plan'),
+            paid_months=_subquery_count(Payment.months_paid.through, 'payment', 'pk'),
+        ).annotate(
+            amount_due=_money(F('payment_plan__one_time_fee') + F('payment_plan__monthly_fee') * F('plan_months')),
+        ).annotate(
+            balance=_money(F('amount_due') - F('total_paid')),
+        )
+
+    def outstanding(self):
+        """Ledger rows that still owe money. Requires ``with_ledger``."""
+        return self.filter(balance__gt=0)
+
+
 class Payment(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='payments', verbose_name=_("Student"), null=True)
     payment_plan = models.ForeignKey(PaymentPlan, on_delete=models.CASCADE, related_name='payments', verbose_name=_("Payment Plan"))
     one_time_fee_paid = models.BooleanField(default=False)
     months_paid = models.ManyToManyField(Month, blank=True, related_name='paid', verbose_name=_("Paid Months"))
     academic_year = models.CharField(max_length=9, verbose_name=_("Academic Year"), blank=True)
+    # Kept up to date from the receipts by Payments.ledger
+    total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, verbose_name=_("Total Paid"))
+    paid_through = models.ForeignKey(Month, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+', verbose_name=_("Paid Through"))
+
+    objects = PaymentQuerySet.as_manager()
 
     def __str__(self):
         if self.student:
@@ -40,44 +87,69 @@ class Payment(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.academic_year:
-            current_year = timezone.now().year
-            self.academic_year = f"{current_year}-{current_year + 1}"
+            from .rollover import current_academic_year
+            self.academic_year = current_academic_year()
         super().save(*args, **kwargs)
 
 class Receipt(models.Model):
     payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='receipts', verbose_name=_("Payment"))
-    receipt_number = models.CharField(max_length=100, verbose_name=_("Receipt Number"), unique=True)
+    # Left blank, the next number of the payment's academic year is assigned on save
+    receipt_number = models.CharField(max_length=100, verbose_name=_("Receipt Number"), unique=True, blank=True)
     description = models.CharField(max_length=100, blank=True)
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_("Amount Paid"))
+    # Receipts recorded before this field existed have no date
+    received_on = models.DateField(default=timezone.localdate, null=True, blank=True, db_index=True, verbose_name=_("Received On"))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._remember_saved()
+
+    def _remember_saved(self):
+        self._saved_payment_id = self.__dict__.get('payment_id')
+        self._saved_amount = self.__dict__.get('amount_paid')
 
     def __str__(self):
         if self.payment.student:
             return f'{_("Receipt")} {self.receipt_number} {_("for")} {self.payment.student}'
         return f'{_("Receipt")} {self.receipt_number} {_("for")} Unknown Student'
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            if not self.receipt_number:
+                self.receipt_number = next_receipt_number(self.payment.academic_year)
+            super().save(*args, **kwargs)
+
+
+class ReceiptSequence(models.Model):
+    """Last receipt number handed out in an academic year (see Payments.numbering)."""
+    academic_year = models.CharField(max_length=9, unique=True, verbose_name=_("Academic Year"))
+    last_number = models.PositiveIntegerField(default=0, verbose_name=_("Last Number"))
+
+    def __str__(self):
+        return f'{self.academic_year}: {self.last_number}'
+
 
 @receiver(post_save, sender=Receipt)
 def update_months_paid(sender, instance, created, **kwargs):
+    """Apply a new or changed receipt to its payment's running total."""
+    amount = Decimal(str(instance.amount_paid))
     if created:
-        payment = instance.payment
-        total_paid = sum(receipt.amount_paid for receipt in payment.receipts.all())
-        payment_plan = payment.payment_plan
-        
-        # Calculate the amount paid towards monthly fees
-        monthly_fee_paid = total_paid
-        if payment_plan.one_time_fee > 0:
-            if payment.one_time_fee_paid:
-                monthly_fee_paid = total_paid - payment_plan.one_time_fee
-            elif total_paid >= payment_plan.one_time_fee:
-                payment.one_time_fee_paid = True
-                monthly_fee_paid -= payment_plan.one_time_fee
-            else:
-                payment.save()
-                return
-
-        # Calculate the number of months paid
-        months = payment.payment_plan.months.all()
-        if payment_plan.monthly_fee > 0:
-            months_to_pay = int(monthly_fee_paid // payment_plan.monthly_fee)
-            payment.months_paid.set(months[:months_to_pay])
-        payment.save()
+        record_paid_amount(instance.payment_id, amount)
+    else:
+        saved_amount = Decimal(str(instance._saved_amount or 0))
+        if instance.payment_id != instance._saved_payment_id:
+            record_paid_amount(instance._saved_payment_id, -saved_amount)
+            record_paid_amount(instance.payment_id, amount)
+        elif amount != saved_amount:
+            record_paid_amount(instance.payment_id, amount - saved_amount)
+    instance._remember_saved()
+
+
+@receiver(post_delete, sender=Receipt)
+def remove_receipt_amount(sender, instance, origin=None, **kwargs):
+    """Take a deleted receipt off its payment, unless the payment goes too."""
+    origin_model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    if origin is not None and origin_model is not Receipt:
+        # Cascaded from deleting the payment (or its student or plan)
+        return
+    record_paid_amount(instance.payment_id, -Decimal(str(instance.amount_paid)))
@@ -0,0 +1,53 @@
+"""
+Receipt numbers.
+
+Numbers are allocated per academic year from a ``ReceiptSequence`` row
+(``2025-2026/00001``, ``2025-2026/00002``, ...). The row is locked and
+advanced in the caller's transaction, so concurrent desks are handed
+distinct numbers instead of colliding on the unique constraint, and a
+receipt that is rolled back returns its number with it: the sequence stays
+gap-free. Imports reserve a block of numbers with one update.
+"""
+import re
+
+from django.db import transaction
+
+RECEIPT_NUMBER_FORMAT = '{academic_year}/{number:05d}'
+
+
+def format_receipt_number(academic_year, number):
+    return RECEIPT_NUMBER_FORMAT.format(academic_year=academic_year, number=number)
+
+
+def _highest_existing_number(academic_year):
+    """Highest number already used in ``academic_year``'s format, e.g. by an earlier import."""
+    from .models import Receipt
+
+    pattern = re.compile(re.escape(f'{academic_year}/') + r'(\d+)$')
+    numbers = Receipt.objects.filter(receipt_number__startswith=f'{academic_year}/').values_list('receipt_number', flat=True)
+    return max((int(match.group(1)) for match in map(pattern.match, numbers) if match), default=0)
+
+
+def reserve_receipt_numbers(academic_year, count=1):
+    """
+    Reserve the next ``count`` receipt numbers of ``academic_year``. Call it
+    in the transaction that saves the receipts so the numbers are released
+    if it rolls back.
+    """
+    from .models import ReceiptSequence
+
+    if count < 1:
+        return []
+    with transaction.atomic():
+        sequence, _ = ReceiptSequence.objects.select_for_update().get_or_create(
+            academic_year=academic_year,
+            defaults={'last_number': _highest_existing_number(academic_year)},
+        )
+        first = sequence.last_number + 1
+        sequence.last_number += count
+        sequence.save(update_fields=['last_number'])
+    return [format_receipt_number(academic_year, number) for number in range(first, first + count)]
+
+
+def next_receipt_number(academic_year):
+    return reserve_receipt_numbers(academic_year)[0]
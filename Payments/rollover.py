@@ -0,0 +1,132 @@
+"""
+Academic year rollover.
+
+Creates the new academic year's ``Payment`` for every active student in a
+few set-based queries: the students, the payments that already exist for
+the new year and (when carrying plans over) last year's plans are each read
+once, and the missing payments are inserted with ``bulk_create``. Students
+who already have a payment for the new year are skipped, so running it
+twice is harmless. The students are locked for the duration, so two
+rollovers running at once don't both create the same payments; a unique
+constraint isn't possible as a student who changes plan mid-year gets a
+second payment for that year (``Student.save``).
+
+``bulk_create`` sends no signals; the arrears and dashboard caches are
+invalidated here.
+"""
+import re
+
+from django.db import transaction
+from django.utils import timezone
+
+from .arrears import ACADEMIC_YEAR_START_MONTH, invalidate_arrears_cache
+from .dashboard import invalidate_dashboard_cache
+from .models import Payment
+
+ROLLOVER_BATCH_SIZE = 1000
+ACADEMIC_YEAR_RE = re.compile(r'^(\d{4})-(\d{4})$')
+
+
+class RolloverError(ValueError):
+    """The rollover can't run, e.g. because the academic year is malformed."""
+
+
+def current_academic_year(today=None):
+    """The academic year in progress, e.g. ``2025-2026`` from September 2025 to August 2026."""
+    today = today or timezone.localdate()
+    start = today.year if today.month >= ACADEMIC_YEAR_START_MONTH else today.year - 1
+    return f'{start}-{start + 1}'
+
+
+def _start_year(academic_year):
+    match = ACADEMIC_YEAR_RE.match(academic_year or '')
+    if not match or int(match.group(2)) != int(match.group(1)) + 1:
+        raise RolloverError(f'Invalid academic year: {academic_year!r} (expected e.g. 2025-2026)')
+    return int(match.group(1))
+
+
+def previous_academic_year(academic_year):
+    start = _start_year(academic_year)
+    return f'{start - 1}-{start}'
+
+
+def next_academic_year(academic_year):
+    start = _start_year(academic_year) + 1
+    return f'{start}-{start + 1}'
+
+
+def _planned_payments(students, academic_year, from_year, plan, carry_over, report):
+    """Unsaved payments for the students without one in ``academic_year``."""
+    # Lock the students first, so a concurrent rollover waits for this one
+    # and then sees its payments below instead of creating them again.
+    students = list(
+        students.model.objects.filter(pk__in=students.values('pk'), active=True)
+        .select_for_update().order_by('pk').values_list('id', 'payment_plan_id')
+    )
+    existing = set(
+        Payment.objects.filter(academic_year=academic_year, student__isnull=False)
+        .values_list('student_id', flat=True)
+    )
+    previous_plans = {}
+    if plan is None and carry_over:
+        # Latest payment wins when a student had several last year
+        previous_plans = dict(
+            Payment.objects.filter(academic_year=from_year, student__isnull=False)
+            .order_by('id').values_list('student_id', 'payment_plan_id')
+        )
+
+    payments = []
+    for student_id, plan_id in students:
+        report['students'] += 1
+        if student_id in existing:
+            report['existing'] += 1
+            continue
+        if plan is not None:
+            plan_id = plan.pk
+        elif student_id in previous_plans:
+            plan_id = previous_plans[student_id]
+        if plan_id is None:
+            report['without_plan'] += 1
+            continue
+        payments.append(Payment(student_id=student_id, payment_plan_id=plan_id, academic_year=academic_year))
+    return payments
+
+
+def rollover_payments(academic_year, students=None, plan=None, carry_over=True, from_year=None,
+                      dry_run=False, batch_size=ROLLOVER_BATCH_SIZE, progress=None):
+    """
+    Create the ``academic_year`` payments of the active ``students`` (all of
+    them by default). Each payment uses ``plan`` if given, otherwise the
+    student's plan from ``from_year`` (the year before by default) when
+    ``carry_over`` is set, otherwise the student's own payment plan.
+
+    With ``dry_run`` nothing is written. Returns a dict with the active
+    ``students`` considered, the payments ``created``, and the students
+    skipped because they have one already (``existing``) or have no plan
+    (``without_plan``).
+    """
+    from People.models import Student
+
+    if batch_size < 1:
+        raise RolloverError(f'The batch size must be positive, not {batch_size}')
+    from_year = from_year or previous_academic_year(academic_year)
+    if students is None:
+        students = Student.objects.all()
+    report = {
+        'academic_year': academic_year, 'students': 0, 'created': 0,
+        'existing': 0, 'without_plan': 0, 'dry_run': dry_run,
+    }
+
+    with transaction.atomic():
+        payments = _planned_payments(students, academic_year, from_year, plan, carry_over, report)
+        for start in range(0, len(payments), batch_size):
+            batch = payments[start:start + batch_size]
+            if not dry_run:
+                Payment.objects.bulk_create(batch)
+            report['created'] += len(batch)
+            if progress:
+                progress(report)
+        if payments and not dry_run:
+            invalidate_arrears_cache()
+            invalidate_dashboard_cache()
+    return report
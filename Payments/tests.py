@@ -1,5 +1,25 @@
-from django.test import TestCase
-from .models import Month
+import io
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from People.models import Student
+from . import arrears, dashboard, ledger
+from .imports import ReceiptImportError, import_receipts
+from .models import Month, Payment, PaymentPlan, Receipt, ReceiptSequence
+from .numbering import reserve_receipt_numbers
+from .rollover import RolloverError, current_academic_year, rollover_payments
 
 
 class MonthModelTest(TestCase):
@@ -31,3 +51,683 @@ class MonthModelTest(TestCase):
         """Test the string representation of Month."""
         january = Month.objects.get(name='January')
         self.assertEqual(str(january), 'January')
+
+
+class PaymentLedgerTestCase(TestCase):
+    """Test the payment ledger totals and the payment list page."""
+
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        self.plan = PaymentPlan.objects.create(name='Monthly', one_time_fee=50, monthly_fee=30)
+        self.plan.months.set(Month.objects.filter(order__lte=4))
+        self.other_plan = PaymentPlan.objects.create(name='Flat', one_time_fee=100, monthly_fee=0)
+
+        self.student = Student.objects.create(first_name='Anna', last_name='Paid', address='x')
+        self.owing = Student.objects.create(first_name='Bob', last_name='Owing', address='x')
+        self.paid = Payment.objects.create(student=self.student, payment_plan=self.plan, academic_year='2024-2025')
+        self.partial = Payment.objects.create(student=self.owing, payment_plan=self.plan, academic_year='2025-2026')
+        self.flat = Payment.objects.create(student=self.owing, payment_plan=self.other_plan, academic_year='2025-2026')
+
+        Receipt.objects.create(payment=self.paid, receipt_number='R1', amount_paid=50)
+        Receipt.objects.create(payment=self.paid, receipt_number='R2', amount_paid=120)
+        Receipt.objects.create(payment=self.partial, receipt_number='R3', amount_paid=80)
+
+    def test_ledger_totals(self):
+        ledger = {payment.id: payment for payment in Payment.objects.with_ledger()}
+
+        paid = ledger[self.paid.id]
+        self.assertEqual(paid.total_paid, Decimal('170'))
+        self.assertEqual(paid.plan_months, 4)
+        self.assertEqual(paid.paid_months, 4)
+        self.assertEqual(paid.amount_due, Decimal('170'))
+        self.assertEqual(paid.balance, Decimal('0'))
+
+        partial = ledger[self.partial.id]
+        self.assertEqual(partial.total_paid, Decimal('80'))
+        self.assertEqual(partial.paid_months, 1)
+        self.assertEqual(partial.balance, Decimal('90'))
+
+        flat = ledger[self.flat.id]
+        self.assertEqual(flat.total_paid, Decimal('0'))
+        self.assertEqual(flat.plan_months, 0)
+        self.assertEqual(flat.balance, Decimal('100'))
+
+    def test_outstanding(self):
+        ids = set(Payment.objects.with_ledger().outstanding().values_list('id', flat=True))
+        self.assertEqual(ids, {self.partial.id, self.flat.id})
+
+    def test_payment_list_query_count(self):
+        for i in range(10):
+            student = Student.objects.create(first_name=f'S{i}', last_name='Extra', address='x')
+            payment = Payment.objects.create(student=student, payment_plan=self.plan, academic_year='2025-2026')
+            Receipt.objects.create(payment=payment, receipt_number=f'X{i}', amount_paid=30)
+
+        # session, user, count, years, plans and the page itself, whatever the row count
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('payments:payment_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Anna')
+
+    def test_payment_list_filters(self):
+        url = reverse('payments:payment_list')
+
+        response = self.client.get(url, {'academic_year': '2025-2026'})
+        self.assertEqual({p.id for p in response.context['payments']}, {self.partial.id, self.flat.id})
+
+        response = self.client.get(url, {'plan': self.plan.id})
+        self.assertEqual({p.id for p in response.context['payments']}, {self.paid.id, self.partial.id})
+
+        response = self.client.get(url, {'outstanding': '1', 'plan': self.plan.id})
+        self.assertEqual([p.id for p in response.context['payments']], [self.partial.id])
+
+    def test_payment_list_pagination(self):
+        for i in range(30):
+            student = Student.objects.create(first_name=f'P{i}', last_name='Page', address='x')
+            Payment.objects.create(student=student, payment_plan=self.plan, academic_year='2023-2024')
+
+        response = self.client.get(reverse('payments:payment_list'), {'academic_year': '2023-2024', 'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+        self.assertEqual(len(response.context['payments']), 5)
+
+
+class PaymentRunningTotalTestCase(TestCase):
+    """Test the running totals kept from the receipts."""
+
+    def setUp(self):
+        self.plan = PaymentPlan.objects.create(name='Monthly', one_time_fee=50, monthly_fee=30)
+        self.plan.months.set(Month.objects.filter(order__in=[9, 10, 11, 12]))
+        self.student = Student.objects.create(first_name='Anna', last_name='Test', address='x')
+        self.payment = Payment.objects.create(student=self.student, payment_plan=self.plan)
+
+    def _paid_months(self):
+        return list(self.payment.months_paid.order_by('order').values_list('name', flat=True))
+
+    def test_deleting_payment_skips_receipt_totals(self):
+        Receipt.objects.create(payment=self.payment, receipt_number='R1', amount_paid='40')
+        Receipt.objects.create(payment=self.payment, receipt_number='R2', amount_paid='70')
+        with patch('Payments.models.record_paid_amount') as record:
+            self.student.delete()
+        record.assert_not_called()
+        self.assertFalse(Receipt.objects.exists())
+
+        payment = Payment.objects.create(payment_plan=self.plan)
+        receipt = Receipt.objects.create(payment=payment, receipt_number='R3', amount_paid='40')
+        with patch('Payments.models.record_paid_amount') as record:
+            receipt.delete()
+        record.assert_called_once_with(payment.id, Decimal('-40'))
+
+    def test_receipts_update_totals(self):
+        Receipt.objects.create(payment=self.payment, receipt_number='R1', amount_paid='40')
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.total_paid, Decimal('40'))
+        self.assertFalse(self.payment.one_time_fee_paid)
+        self.assertIsNone(self.payment.paid_through)
+
+        Receipt.objects.create(payment=self.payment, receipt_number='R2', amount_paid='70')
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.total_paid, Decimal('110'))
+        self.assertTrue(self.payment.one_time_fee_paid)
+        self.assertEqual(self.payment.paid_through.name, 'October')
+        self.assertEqual(self._paid_months(), ['September', 'October'])
+
+    def test_edited_and_deleted_receipts(self):
+        receipt = Receipt.objects.create(payment=self.payment, receipt_number='R1', amount_paid=140)
+        self.assertEqual(self._paid_months(), ['September', 'October', 'November'])
+
+        receipt.amount_paid = Decimal('80')
+        receipt.save()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.total_paid, Decimal('80'))
+        self.assertEqual(self._paid_months(), ['September'])
+
+        other = Payment.objects.create(student=self.student, payment_plan=self.plan)
+        receipt.payment = other
+        receipt.save()
+        self.payment.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.payment.total_paid, Decimal('0'))
+        self.assertEqual(self._paid_months(), [])
+        self.assertEqual(other.total_paid, Decimal('80'))
+
+        receipt.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.total_paid, Decimal('0'))
+        self.assertIsNone(other.paid_through)
+
+    def test_months_paid_written_as_diff(self):
+        Receipt.objects.create(payment=self.payment, receipt_number='R1', amount_paid=110)
+        through = Payment.months_paid.through
+        kept = through.objects.get(payment=self.payment, month__name='September').id
+
+        Receipt.objects.create(payment=self.payment, receipt_number='R2', amount_paid=30)
+        self.assertEqual(through.objects.get(payment=self.payment, month__name='September').id, kept)
+        self.assertEqual(self._paid_months(), ['September', 'October', 'November'])
+
+    def test_deferred_totals_recalculate_once(self):
+        with patch.object(ledger, 'apply_paid_amount', wraps=ledger.apply_paid_amount) as apply:
+            with ledger.deferred_totals():
+                for i in range(3):
+                    Receipt.objects.create(payment=self.payment, receipt_number=f'R{i}', amount_paid=50)
+                self.assertEqual(apply.call_count, 0)
+        apply.assert_called_once_with(self.payment.id, Decimal('150'))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.total_paid, Decimal('150'))
+        self.assertEqual(self._paid_months(), ['September', 'October', 'November'])
+
+    def test_admin_inline_recalculates_once(self):
+        User.objects.create_superuser(username='payadmin', password='adminpass')
+        self.client.login(username='payadmin', password='adminpass')
+        data = {
+            'student': self.student.id,
+            'payment_plan': self.plan.id,
+            'receipts-TOTAL_FORMS': '2',
+            'receipts-INITIAL_FORMS': '0',
+            'receipts-MIN_NUM_FORMS': '0',
+            'receipts-MAX_NUM_FORMS': '1000',
+            'receipts-0-amount_paid': '50',
+            'receipts-1-amount_paid': '60',
+        }
+        with patch.object(ledger, 'apply_paid_amount', wraps=ledger.apply_paid_amount) as apply:
+            response = self.client.post(reverse('admin:Payments_payment_change', args=[self.payment.id]), data)
+        self.assertEqual(response.status_code, 302)
+        apply.assert_called_once()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.total_paid, Decimal('110'))
+        self.assertEqual(self._paid_months(), ['September', 'October'])
+        self.assertEqual(self.payment.receipts.filter(receipt_number__startswith=f'{self.payment.academic_year}/').count(), 2)
+
+
+class ReceiptImportTestCase(TestCase):
+    """Test importing receipts from bank statement CSVs."""
+
+    HEADER = 'student_id,plan,academic_year,receipt_number,amount,description\n'
+
+    def setUp(self):
+        self.plan = PaymentPlan.objects.create(name='Monthly', one_time_fee=0, monthly_fee=30)
+        self.plan.months.set(Month.objects.filter(order__in=[9, 10, 11, 12]))
+        self.student = Student.objects.create(first_name='Anna', last_name='Test', address='x')
+        self.other = Student.objects.create(first_name='Bob', last_name='Test', address='x')
+        self.payment = Payment.objects.create(student=self.student, payment_plan=self.plan, academic_year='2025-2026')
+        self.other_payment = Payment.objects.create(student=self.other, payment_plan=self.plan, academic_year='2025-2026')
+        Receipt.objects.create(payment=self.payment, receipt_number='OLD-1', amount_paid=30)
+
+    def _csv(self, *lines):
+        return io.StringIO(self.HEADER + ''.join(line + '\n' for line in lines))
+
+    def test_import_matches_and_reports(self):
+        sid, oid = self.student.student_id, self.other.student_id
+        stream = self._csv(
+            f'{sid},monthly,2025-2026,B-1,30,October',
+            f'{sid},Monthly,2025-2026,B-2,30,November',
+            f'{oid},Monthly,2025-2026,B-3,60,',
+            f'{oid},Monthly,2024-2025,B-4,30,',
+            f'{sid},Monthly,2025-2026,OLD-1,30,',
+            f'{sid},Monthly,2025-2026,B-1,30,',
+            f'{sid},Monthly,2025-2026,B-5,abc,',
+            f',Monthly,2025-2026,B-6,30,',
+        )
+        with patch('Payments.imports.apply_paid_amount', wraps=ledger.apply_paid_amount) as apply:
+            report = import_receipts(stream, chunk_size=3)
+
+        self.assertEqual(report['rows'], 8)
+        self.assertEqual(report['imported'], 3)
+        self.assertEqual(report['payments'], 2)
+        self.assertEqual(
+            [(error['line'], error['error']) for error in report['errors']],
+            [
+                (5, 'No matching payment'),
+                (6, 'Duplicate receipt number'),
+                (7, 'Duplicate receipt number'),
+                (8, 'Invalid amount'),
+                (9, 'Missing student_id'),
+            ],
+        )
+        self.assertEqual(apply.call_count, 2)
+
+        self.payment.refresh_from_db()
+        self.other_payment.refresh_from_db()
+        self.assertEqual(self.payment.total_paid, Decimal('90'))
+        self.assertEqual(self.payment.paid_through.name, 'November')
+        self.assertEqual(self.other_payment.total_paid, Decimal('60'))
+        self.assertEqual(self.other_payment.months_paid.count(), 2)
+
+    def test_dry_run_writes_nothing(self):
+        stream = self._csv(f'{self.student.student_id},Monthly,2025-2026,B-1,30,', 'nobody,Monthly,2025-2026,B-2,30,')
+        report = import_receipts(stream, dry_run=True)
+        self.assertEqual(report['imported'], 1)
+        self.assertEqual(len(report['errors']), 1)
+        self.assertFalse(Receipt.objects.filter(receipt_number='B-1').exists())
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.total_paid, Decimal('30'))
+
+    def test_field_limits_and_dates(self):
+        sid = self.student.student_id
+        stream = io.StringIO(
+            'student_id,plan,academic_year,receipt_number,amount,received_on\n'
+            f'{sid},Monthly,2025-2026,{"N" * 101},30,\n'
+            f'{sid},Monthly,2025-2026,B-1,123456789.5,\n'
+            f'{sid},Monthly,2025-2026,B-2,30.555,\n'
+            f'{sid},Monthly,2025-2026,B-3,30,31/02/2025\n'
+            f'{sid},Monthly,2025-2026,B-4,30,15/10/2025\n'
+            f'{sid},Monthly,2025-2026,B-5,30,\n'
+        )
+        report = import_receipts(stream)
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual(
+            [(error['line'], error['error'].split(':')[0]) for error in report['errors']],
+            [(2, 'Invalid receipt number'), (3, 'Invalid amount'), (4, 'Invalid amount'), (5, 'Invalid date')],
+        )
+        self.assertEqual(Receipt.objects.get(receipt_number='B-4').received_on, date(2025, 10, 15))
+        self.assertIsNone(Receipt.objects.get(receipt_number='B-5').received_on)
+
+    def test_missing_columns(self):
+        with self.assertRaises(ReceiptImportError):
+            import_receipts(io.StringIO('student_id,amount\n1,30\n'))
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.HEADER + f'{self.student.student_id},Monthly,2025-2026,B-1,30,\n')
+        self.addCleanup(os.remove, f.name)
+        output = io.StringIO()
+        call_command('import_receipts', f.name, stdout=output)
+        self.assertIn('Imported 1 of 1 receipts for 1 payments', output.getvalue())
+        self.assertTrue(Receipt.objects.filter(receipt_number='B-1').exists())
+
+    def test_upload_view(self):
+        User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        content = (self.HEADER + f'{self.student.student_id},Monthly,2025-2026,B-1,30,\nnobody,Monthly,2025-2026,B-2,30,\n').encode()
+        url = reverse('payments:upload_receipts')
+
+        response = self.client.post(url, {'file': SimpleUploadedFile('bank.csv', content), 'dry_run': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['report']['dry_run'])
+        self.assertContains(response, 'No matching payment')
+        self.assertFalse(Receipt.objects.filter(receipt_number='B-1').exists())
+
+        response = self.client.post(url, {'file': SimpleUploadedFile('bank.csv', content)})
+        self.assertEqual(response.context['report']['imported'], 1)
+        self.assertTrue(Receipt.objects.filter(receipt_number='B-1').exists())
+
+
+class ArrearsTestCase(TestCase):
+    """Test the arrears rows, summary, cache and report views."""
+
+    def setUp(self):
+        cache.delete(arrears.ARREARS_CACHE_KEY)
+        self.plan = PaymentPlan.objects.create(name='Term', one_time_fee=50, monthly_fee=30)
+        self.plan.months.set(Month.objects.filter(order__in=[1, 9, 10]))
+        self.student = Student.objects.create(first_name='Anna', last_name='Owes', address='x')
+        self.payment = Payment.objects.create(student=self.student, payment_plan=self.plan, academic_year='2025-2026')
+        Receipt.objects.create(payment=self.payment, receipt_number='R1', amount_paid=95)
+
+    def test_rows_allocate_payments(self):
+        rows = arrears.arrears_rows()
+        self.assertEqual(
+            [(row['item'], row['due_date'], row['paid'], row['outstanding']) for row in rows],
+            [
+                (arrears.ONE_TIME_FEE, date(2025, 9, 1), Decimal('50'), Decimal('0')),
+                ('September', date(2025, 9, 1), Decimal('30'), Decimal('0')),
+                ('October', date(2025, 10, 1), Decimal('15'), Decimal('15')),
+                ('January', date(2026, 1, 1), Decimal('0'), Decimal('30')),
+            ],
+        )
+
+    def test_plan_crossing_new_year(self):
+        """Test that a September–June plan is paid from September on, not from January"""
+        plan = PaymentPlan.objects.create(name='School year', one_time_fee=0, monthly_fee=50)
+        plan.months.set(Month.objects.exclude(order__in=[7, 8]))
+        payment = Payment.objects.create(student=self.student, payment_plan=plan, academic_year='2026-2027')
+        Receipt.objects.create(payment=payment, receipt_number='R9', amount_paid=100)
+
+        rows = [row for row in arrears.arrears_rows() if row['payment_id'] == payment.pk]
+        self.assertEqual([row['item'] for row in rows[:5]], ['September', 'October', 'November', 'December', 'January'])
+        self.assertEqual([row['paid'] for row in rows[:3]], [Decimal('50'), Decimal('50'), Decimal('0')])
+        entry = arrears.arrears_summary(rows, today=date(2026, 10, 18))[0]
+        self.assertEqual(entry['overdue'], Decimal('0'))
+        self.assertEqual(entry['balance'], Decimal('400'))
+
+    def test_totals_per_year_and_plan(self):
+        other = Student.objects.create(first_name='Ben', last_name='Ahead', address='x')
+        payment = Payment.objects.create(student=other, payment_plan=self.plan, academic_year='2025-2026')
+        Receipt.objects.create(payment=payment, receipt_number='R3', amount_paid=200)
+
+        with self.assertNumQueries(1):
+            totals = arrears.arrears_totals('2025-2026')
+        self.assertEqual(len(totals), 1)
+        self.assertEqual(totals[0]['plan'], 'Term')
+        self.assertEqual(totals[0]['payments'], 2)
+        self.assertEqual(totals[0]['expected'], Decimal('280'))
+        self.assertEqual(totals[0]['paid'], Decimal('295'))
+        # The overpayment doesn't cancel Anna's balance
+        self.assertEqual(totals[0]['balance'], Decimal('45'))
+
+    def test_summary_overdue(self):
+        summary = arrears.arrears_summary(arrears.arrears_rows(), today=date(2025, 9, 15))
+        self.assertEqual(len(summary), 1)
+        entry = summary[0]
+        self.assertEqual(entry['expected'], Decimal('140'))
+        self.assertEqual(entry['paid'], Decimal('95'))
+        self.assertEqual(entry['balance'], Decimal('45'))
+        self.assertEqual(entry['overdue'], Decimal('0'))
+        self.assertEqual(entry['overdue_items'], [])
+
+        entry = arrears.arrears_summary(arrears.arrears_rows(), today=date(2025, 10, 2))[0]
+        self.assertEqual(entry['overdue'], Decimal('15'))
+        self.assertEqual(entry['overdue_items'], ['October'])
+
+        entry = arrears.arrears_summary(arrears.arrears_rows(), today=date(2026, 1, 2))[0]
+        self.assertEqual(entry['overdue'], Decimal('45'))
+
+    def test_cached_until_receipts_change(self):
+        arrears.arrears_rows()
+        with self.assertNumQueries(0):
+            arrears.arrears_rows()
+
+        Receipt.objects.create(payment=self.payment, receipt_number='R2', amount_paid=45)
+        with self.assertNumQueries(2):
+            rows = arrears.arrears_rows()
+        self.assertEqual(sum(row['outstanding'] for row in rows), Decimal('0'))
+
+        self.plan.months.add(Month.objects.get(order=11))
+        self.assertEqual(len(arrears.arrears_rows()), 5)
+
+    def test_report_and_csv(self):
+        User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        response = self.client.get(reverse('payments:arrears_report'), {'overdue': '0', 'academic_year': '2025-2026'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_balance'], Decimal('45'))
+        self.assertContains(response, 'Anna Owes')
+
+        response = self.client.get(reverse('payments:arrears_csv'), {'overdue': '0'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0], 'Student ID,Student,Academic Year,Plan,Item,Due Date,Expected,Paid,Outstanding')
+        self.assertEqual(len(lines), 5)
+        self.assertIn('October,2025-10-01,30.00,15.00,15.00', lines[3])
+
+
+class ReceiptNumberingTestCase(TestCase):
+    """Test the per academic year receipt number allocator."""
+
+    def setUp(self):
+        self.plan = PaymentPlan.objects.create(name='Monthly', monthly_fee=30)
+        self.plan.months.set(Month.objects.filter(order__in=[9, 10]))
+        self.student = Student.objects.create(first_name='Anna', last_name='Test', address='x')
+        self.payment = Payment.objects.create(student=self.student, payment_plan=self.plan, academic_year='2025-2026')
+        self.next_year = Payment.objects.create(student=self.student, payment_plan=self.plan, academic_year='2026-2027')
+
+    def test_numbers_per_academic_year(self):
+        numbers = [Receipt.objects.create(payment=self.payment, amount_paid=10).receipt_number for _ in range(3)]
+        self.assertEqual(numbers, ['2025-2026/00001', '2025-2026/00002', '2025-2026/00003'])
+        self.assertEqual(Receipt.objects.create(payment=self.next_year, amount_paid=10).receipt_number, '2026-2027/00001')
+        # Explicit numbers are kept
+        self.assertEqual(Receipt.objects.create(payment=self.payment, receipt_number='BANK-1', amount_paid=10).receipt_number, 'BANK-1')
+
+    def test_rolled_back_numbers_are_reused(self):
+        Receipt.objects.create(payment=self.payment, amount_paid=10)
+        try:
+            with transaction.atomic():
+                Receipt.objects.create(payment=self.payment, amount_paid=10)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(Receipt.objects.create(payment=self.payment, amount_paid=10).receipt_number, '2025-2026/00002')
+
+    def test_block_reservation_and_existing_numbers(self):
+        Receipt.objects.create(payment=self.payment, receipt_number='2025-2026/00041', amount_paid=10)
+        self.assertEqual(reserve_receipt_numbers('2025-2026', 3), ['2025-2026/00042', '2025-2026/00043', '2025-2026/00044'])
+        self.assertEqual(ReceiptSequence.objects.get(academic_year='2025-2026').last_number, 44)
+        self.assertEqual(reserve_receipt_numbers('2025-2026', 0), [])
+
+    def test_add_receipt_assigns_number(self):
+        User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        for _ in range(2):
+            response = self.client.post(reverse('payments:add_receipt'), {'payment_id': self.payment.id, 'amount_paid': '30'})
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            list(self.payment.receipts.order_by('id').values_list('receipt_number', flat=True)),
+            ['2025-2026/00001', '2025-2026/00002'],
+        )
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.total_paid, Decimal('60'))
+
+    def test_admin_does_not_edit_numbers(self):
+        """Test that the receipt admin numbers new receipts and ignores a posted number"""
+        User.objects.create_superuser(username='payadmin', password='adminpass')
+        self.client.login(username='payadmin', password='adminpass')
+        response = self.client.post(reverse('admin:Payments_receipt_add'), {
+            'payment': self.payment.id, 'receipt_number': '2025-2026/00050',
+            'amount_paid': '30', 'received_on': '2025-09-10', 'description': '',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.payment.receipts.get().receipt_number, '2025-2026/00001')
+        self.assertEqual(ReceiptSequence.objects.get(academic_year='2025-2026').last_number, 1)
+
+    def test_import_reserves_block(self):
+        sid = self.student.student_id
+        stream = io.StringIO(
+            'student_id,plan,academic_year,amount,receipt_number\n'
+            f'{sid},Monthly,2025-2026,30,\n'
+            f'{sid},Monthly,2025-2026,30,BANK-9\n'
+            f'{sid},Monthly,2025-2026,30,\n'
+            f'{sid},Monthly,2025-2026,30,2025-2026/00007\n'
+        )
+        report = import_receipts(stream)
+        self.assertEqual(report['imported'], 3)
+        self.assertEqual(report['errors'][0]['error'], 'Receipt number uses the automatic numbering format')
+        self.assertEqual(
+            sorted(self.payment.receipts.values_list('receipt_number', flat=True)),
+            ['2025-2026/00001', '2025-2026/00002', 'BANK-9'],
+        )
+
+
+class PaymentAdminQueryTestCase(TestCase):
+    """Test that the payment admin pages run a fixed number of queries."""
+
+    def setUp(self):
+        User.objects.create_superuser(username='payadmin', password='adminpass')
+        self.client.login(username='payadmin', password='adminpass')
+        self.plan = PaymentPlan.objects.create(name='Monthly', one_time_fee=20, monthly_fee=30)
+        self.plan.months.set(Month.objects.filter(order__in=[9, 10, 11]))
+        self.count = 0
+
+    def _add_payments(self, number):
+        for _ in range(number):
+            self.count += 1
+            student = Student.objects.create(first_name=f'S{self.count}', last_name='Admin', address='x')
+            payment = Payment.objects.create(student=student, payment_plan=self.plan, academic_year='2025-2026')
+            Receipt.objects.create(payment=payment, amount_paid=50)
+            Receipt.objects.create(payment=payment, amount_paid=30)
+        return payment
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_changelists_are_bounded(self):
+        urls = [reverse('admin:Payments_payment_changelist'), reverse('admin:Payments_receipt_changelist')]
+        self._add_payments(2)
+        before = [self._queries(url)[0] for url in urls]
+        self._add_payments(6)
+        self.assertEqual([self._queries(url)[0] for url in urls], before)
+
+        response = self._queries(urls[0])[1]
+        self.assertContains(response, 'September, October')
+        self.assertContains(response, 'November')
+
+    def test_change_form_inline_is_bounded(self):
+        payment = self._add_payments(1)
+        url = reverse('admin:Payments_payment_change', args=[payment.id])
+        # The first request fills per-process caches (e.g. content types)
+        self._queries(url)
+        before = self._queries(url)[0]
+        for _ in range(4):
+            Receipt.objects.create(payment=payment, amount_paid=5)
+        self.assertEqual(self._queries(url)[0], before)
+
+    def test_paid_months_are_read_only(self):
+        payment = self._add_payments(1)
+        response = self._queries(reverse('admin:Payments_payment_change', args=[payment.id]))[1]
+        self.assertNotIn('months_paid', response.context['adminform'].form.fields)
+        self.assertContains(response, 'September, October')
+
+
+
+class PaymentRolloverTestCase(TestCase):
+    """Test creating the new academic year's payments in bulk."""
+
+    def setUp(self):
+        self.monthly = PaymentPlan.objects.create(name='Monthly', monthly_fee=30)
+        self.yearly = PaymentPlan.objects.create(name='Yearly', one_time_fee=300)
+        # Student.save also creates a payment for the plan in the current academic year
+        self.carried = Student.objects.create(first_name='Carried', last_name='Over', address='x', payment_plan=self.monthly)
+        Payment.objects.create(student=self.carried, payment_plan=self.yearly, academic_year='2030-2031')
+        self.done = Student.objects.create(first_name='Already', last_name='Done', address='x', payment_plan=self.monthly)
+        Payment.objects.create(student=self.done, payment_plan=self.monthly, academic_year='2031-2032')
+        self.new = Student.objects.create(first_name='New', last_name='Student', address='x', payment_plan=self.monthly)
+        self.no_plan = Student.objects.create(first_name='No', last_name='Plan', address='x')
+        Student.objects.create(first_name='Left', last_name='School', address='x', active=False, payment_plan=self.monthly)
+
+    def _plans(self, academic_year='2031-2032'):
+        return dict(
+            Payment.objects.filter(academic_year=academic_year)
+            .values_list('student__first_name', 'payment_plan__name')
+        )
+
+    def test_current_academic_year(self):
+        self.assertEqual(current_academic_year(date(2025, 9, 1)), '2025-2026')
+        self.assertEqual(current_academic_year(date(2026, 8, 31)), '2025-2026')
+
+    def test_rollover_creates_missing_payments(self):
+        # Existing payments, last year's plans, students and one insert, in a savepoint
+        with self.assertNumQueries(6):
+            report = rollover_payments('2031-2032')
+        self.assertEqual(
+            (report['students'], report['created'], report['existing'], report['without_plan']), (4, 2, 1, 1),
+        )
+        self.assertEqual(self._plans(), {'Carried': 'Yearly', 'Already': 'Monthly', 'New': 'Monthly'})
+
+        # Running it again changes nothing
+        self.assertEqual(rollover_payments('2031-2032')['created'], 0)
+        self.assertEqual(Payment.objects.filter(academic_year='2031-2032').count(), 3)
+
+    def test_plan_options(self):
+        rollover_payments('2031-2032', carry_over=False)
+        self.assertEqual(self._plans()['Carried'], 'Monthly')
+
+        rollover_payments('2032-2033', plan=self.yearly)
+        self.assertEqual(set(self._plans('2032-2033').values()), {'Yearly'})
+        self.assertIn('No', self._plans('2032-2033'))
+
+    def test_dry_run_writes_nothing(self):
+        report = rollover_payments('2031-2032', dry_run=True)
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(Payment.objects.filter(academic_year='2031-2032').count(), 1)
+
+    def test_invalid_academic_year(self):
+        with self.assertRaises(RolloverError):
+            rollover_payments('2025')
+
+    def test_command_and_admin_action(self):
+        out = io.StringIO()
+        call_command('rollover_payments', '--academic-year', '2031-2032', '--dry-run', '--batch-size', '1', stdout=out)
+        self.assertIn('Would create 2 payments for 2031-2032', out.getvalue())
+        self.assertIn('1 payments...', out.getvalue())
+
+        User.objects.create_superuser(username='payadmin', password='adminpass')
+        self.client.login(username='payadmin', password='adminpass')
+        with patch('People.admin.current_academic_year', return_value='2031-2032'):
+            response = self.client.post(reverse('admin:People_student_changelist'), {
+                'action': 'create_rollover_payments',
+                '_selected_action': [self.new.pk, self.done.pk],
+            }, follow=True)
+        self.assertContains(response, 'Created 1 payments for 2031-2032')
+        self.assertNotIn('Carried', self._plans())
+
+        with patch('People.admin.current_academic_year', return_value='2031-2032'):
+            response = self.client.post(reverse('admin:People_student_changelist'), {
+                'action': 'create_next_year_payments',
+                '_selected_action': [self.new.pk],
+            }, follow=True)
+        self.assertContains(response, 'Created 1 payments for 2032-2033')
+        self.assertEqual(self._plans('2032-2033'), {'New': 'Monthly'})
+
+    def test_invalid_batch_size(self):
+        with self.assertRaises(RolloverError):
+            rollover_payments('2031-2032', batch_size=0)
+        with self.assertRaisesMessage(CommandError, 'The batch size must be positive'):
+            call_command('rollover_payments', '--academic-year', '2031-2032', '--batch-size', '-1', stdout=io.StringIO())
+        self.assertEqual(Payment.objects.filter(academic_year='2031-2032').count(), 1)
+
+    def test_payment_defaults_to_current_academic_year(self):
+        with patch('Payments.rollover.timezone.localdate', return_value=date(2032, 3, 1)):
+            payment = Payment.objects.create(student=self.new, payment_plan=self.yearly)
+        self.assertEqual(payment.academic_year, '2031-2032')
+
+
+class FinanceDashboardTestCase(TestCase):
+    """Test the cached finance dashboard aggregates."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        User.objects.create_user(username='finance', password='testpass')
+        self.client.login(username='finance', password='testpass')
+        self.monthly = PaymentPlan.objects.create(name='Monthly', one_time_fee=20, monthly_fee=30)
+        self.monthly.months.set(Month.objects.filter(order__in=[9, 10, 11]))
+        self.yearly = PaymentPlan.objects.create(name='Yearly', one_time_fee=200)
+        self.anna = Student.objects.create(first_name='Anna', last_name='Alpha', address='x')
+        self.ben = Student.objects.create(first_name='Ben', last_name='Beta', address='x')
+        self.anna_payment = Payment.objects.create(student=self.anna, payment_plan=self.monthly, academic_year='2030-2031')
+        self.ben_payment = Payment.objects.create(student=self.ben, payment_plan=self.yearly, academic_year='2030-2031')
+        Payment.objects.create(student=self.ben, payment_plan=self.monthly, academic_year='2031-2032')
+        Receipt.objects.create(payment=self.anna_payment, amount_paid=50, received_on=date(2030, 9, 5))
+        Receipt.objects.create(payment=self.anna_payment, amount_paid=30, received_on=date(2030, 10, 2))
+        Receipt.objects.create(payment=self.ben_payment, amount_paid=150, received_on=date(2030, 9, 20))
+
+    def test_aggregates(self):
+        data = dashboard.dashboard_data()
+        self.assertEqual(
+            [(row['month'], row['total'], row['receipts']) for row in data['revenue_by_month']],
+            [(date(2030, 10, 1), Decimal('30'), 1), (date(2030, 9, 1), Decimal('200'), 2)],
+        )
+        self.assertEqual([(row['plan'], row['total']) for row in data['revenue_by_plan']],
+                         [('Yearly', Decimal('150')), ('Monthly', Decimal('80'))])
+        self.assertEqual(
+            [(row['academic_year'], row['payments'], row['expected'], row['collected'], row['outstanding'])
+             for row in data['academic_years']],
+            [('2031-2032', 1, Decimal('110'), Decimal('0'), Decimal('110')),
+             ('2030-2031', 2, Decimal('310'), Decimal('230'), Decimal('80'))],
+        )
+        self.assertEqual((data['expected'], data['collected']), (Decimal('420'), Decimal('230')))
+        self.assertEqual([(row['student__first_name'], row['owed']) for row in data['top_debtors']],
+                         [('Ben', Decimal('160')), ('Anna', Decimal('30'))])
+
+    def test_cached_until_receipts_or_payments_change(self):
+        self.assertEqual(dashboard.dashboard_data()['collected'], Decimal('230'))
+        with self.assertNumQueries(0):
+            dashboard.dashboard_data()
+
+        receipt = Receipt.objects.create(payment=self.anna_payment, amount_paid=30)
+        self.assertEqual(dashboard.dashboard_data()['collected'], Decimal('260'))
+        receipt.delete()
+        self.assertEqual(dashboard.dashboard_data()['collected'], Decimal('230'))
+        self.ben_payment.delete()
+        self.assertEqual(dashboard.dashboard_data()['collected'], Decimal('80'))
+
+    def test_dashboard_page(self):
+        response = self.client.get(reverse('payments:finance_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'October 2030')
+        self.assertContains(response, 'Ben Beta')
+        with self.assertNumQueries(2):  # session and user
+            self.client.get(reverse('payments:finance_dashboard'))
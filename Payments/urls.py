@@ -12,6 +12,10 @@ urlpatterns = [
     path('', views.payment_list, name='payment_list'),
     path('create/', views.add_payment, name='add_payment'),
     path('<int:payment_id>/delete/', views.delete_payment, name='delete_payment'),
+    path('arrears/', views.arrears_report, name='arrears_report'),
+    path('arrears/csv/', views.arrears_csv, name='arrears_csv'),
+    path('dashboard/', views.finance_dashboard, name='finance_dashboard'),
     path('receipts/', views.receipt_list, name='receipt_list'),
     path('receipts/create/', views.add_receipt, name='add_receipt'),
+    path('receipts/import/', views.upload_receipts, name='upload_receipts'),
 ]
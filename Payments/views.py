@@ -1,8 +1,17 @@
+import io
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
 from django.http import JsonResponse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from .arrears import arrears_rows, arrears_summary, arrears_totals, filter_rows
+from .dashboard import dashboard_data
+from .imports import ReceiptImportError, import_receipts
 from .models import PaymentPlan, Payment, Receipt, Month
+from People.exports import stream_csv, streaming_response
 from People.models import Student
 
 @login_required
@@ -34,14 +43,36 @@ def payment_plan_list(request):
     }
     return render(request, 'payment_plans.html', context)
 
+PAYMENT_PAGE_SIZE = 25
+
 @login_required
 def payment_list(request):
-    payments = Payment.objects.all()
-    for payment in payments:
-        payment.total_amount_paid = sum(receipt.amount_paid for receipt in payment.receipts.all())
+    """Payment ledger, filterable by academic year, plan and outstanding balance"""
+    academic_year = request.GET.get('academic_year', '')
+    plan_id = request.GET.get('plan', '')
+    outstanding = request.GET.get('outstanding') == '1'
+
+    payments = Payment.objects.with_ledger().order_by('-academic_year', 'student__last_name', 'student__first_name', 'id')
+    if academic_year:
+        payments = payments.filter(academic_year=academic_year)
+    if plan_id.isdigit():
+        payments = payments.filter(payment_plan_id=plan_id)
+    if outstanding:
+        payments = payments.outstanding()
+
+    page = Paginator(payments, PAYMENT_PAGE_SIZE).get_page(request.GET.get('page'))
+    params = request.GET.copy()
+    params.pop('page', None)
 
     context = {
-        'payments': payments
+        'payments': page.object_list,
+        'page_obj': page,
+        'payment_plans': PaymentPlan.objects.order_by('name'),
+        'academic_years': Payment.objects.order_by('-academic_year').values_list('academic_year', flat=True).distinct(),
+        'selected_year': academic_year,
+        'selected_plan': plan_id,
+        'outstanding': outstanding,
+        'query_string': params.urlencode(),
     }
     return render(request, 'payments.html', context)
 
@@ -114,18 +145,18 @@ def delete_payment(request, payment_id):
 
 @login_required
 def add_receipt(request):
+    """Record a receipt; its number is the next one of the payment's academic year"""
     if request.method == 'POST':
         payment_id = request.POST.get('payment_id')
-        receipt_number = request.POST.get('receipt_number')
-        description = request.POST.get('description')
+        description = request.POST.get('description', '')
         amount_paid = request.POST.get('amount_paid')
         payment = get_object_or_404(Payment, id=payment_id)
-        Receipt.objects.create(
+        receipt = Receipt.objects.create(
             payment=payment,
-            receipt_number=receipt_number,
             description=description,
             amount_paid=amount_paid
         )
+        messages.success(request, _('Receipt %(number)s recorded.') % {'number': receipt.receipt_number})
     return redirect('payments:payment_list')
 
 @login_required
@@ -135,3 +166,78 @@ def receipt_list(request):
         "receipts": receipts
     }
     return render(request, 'receipts.html', context)
+
+@login_required
+def upload_receipts(request):
+    """Import receipts from an uploaded bank statement CSV, or dry-run it"""
+    report = None
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if not upload:
+            messages.error(request, _('Choose a CSV file to import.'))
+        else:
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                report = import_receipts(stream, dry_run=bool(request.POST.get('dry_run')))
+            except (UnicodeDecodeError, ReceiptImportError) as e:
+                messages.error(request, _('Could not import the file: %(error)s') % {'error': e})
+            else:
+                if not report['dry_run']:
+                    messages.success(request, _('Imported %(imported)s receipts for %(payments)s payments.') % report)
+    return render(request, 'receipt_import.html', {'report': report})
+
+def _arrears_filters(request):
+    return request.GET.get('academic_year', ''), request.GET.get('overdue', '1') == '1'
+
+@login_required
+def arrears_report(request):
+    """Expected versus paid amounts per student and academic year"""
+    academic_year, overdue_only = _arrears_filters(request)
+    today = timezone.localdate()
+    summary = [
+        entry for entry in arrears_summary(filter_rows(arrears_rows(), academic_year=academic_year), today)
+        if entry['overdue'] > 0 or not overdue_only
+    ]
+
+    totals = arrears_totals()
+    plan_totals = [total for total in totals if not academic_year or total['academic_year'] == academic_year]
+
+    page = Paginator(summary, PAYMENT_PAGE_SIZE).get_page(request.GET.get('page'))
+    params = request.GET.copy()
+    params.pop('page', None)
+
+    context = {
+        'summary': page.object_list,
+        'page_obj': page,
+        'plan_totals': plan_totals,
+        'total_overdue': sum(entry['overdue'] for entry in summary),
+        'total_balance': sum(total['balance'] for total in plan_totals),
+        'academic_years': sorted({total['academic_year'] for total in totals}, reverse=True),
+        'selected_year': academic_year,
+        'overdue_only': overdue_only,
+        'query_string': params.urlencode(),
+    }
+    return render(request, 'arrears.html', context)
+
+@login_required
+def finance_dashboard(request):
+    """Revenue, collected versus expected amounts and top debtors"""
+    data = dashboard_data()
+    context = dict(data, revenue_by_month=data['revenue_by_month'][:12], outstanding=data['expected'] - data['collected'])
+    return render(request, 'finance_dashboard.html', context)
+
+@login_required
+def arrears_csv(request):
+    """Streamed CSV with one row per fee, filtered like the arrears page"""
+    academic_year, overdue_only = _arrears_filters(request)
+    rows = filter_rows(arrears_rows(), academic_year=academic_year, overdue_only=overdue_only)
+    headers = ['Student ID', 'Student', 'Academic Year', 'Plan', 'Item', 'Due Date', 'Expected', 'Paid', 'Outstanding']
+    lines = stream_csv(headers, (
+        (row['student_code'], row['student'], row['academic_year'], row['plan'], row['item'],
+         row['due_date'], row['expected'], row['paid'], row['outstanding'])
+        for row in rows
+    ))
+
+    response = streaming_response(request, lines, 'text/csv')
+    response['Content-Disposition'] = f'attachment; filename="arrears-{timezone.localdate():%Y-%m-%d}.csv"'
+    return response
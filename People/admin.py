@@ -1,21 +1,57 @@
 from django.contrib import admin
+from Payments.rollover import current_academic_year, next_academic_year, rollover_payments
 from .models import Student, Guardian
+from .pagination import EstimatedCountAdminMixin
+from .search import search
 from django.utils.translation import gettext_lazy as _
 
+class SearchTextAdminMixin:
+    """Route the changelist search box through the indexed search service."""
+    search_fields = ('search_text',)
+
+    def get_search_results(self, request, queryset, search_term):
+        return search(queryset, search_term), False
+
+
 @admin.register(Student)
-class StudentAdmin(admin.ModelAdmin):
+class StudentAdmin(EstimatedCountAdminMixin, SearchTextAdminMixin, admin.ModelAdmin):
     filter_horizontal = ('guardians',)
     list_display = ('student_id', 'first_name', 'last_name', 'active', 'phone_number', 'address', 'grade', 'school', 'date_joined')
-    search_fields = ('student_id', 'first_name', 'last_name', 'phone_number', 'school', 'school_year', 'email')
     autocomplete_fields = ['payment_plan']
     readonly_fields = ('student_id', 'uuid', 'date_joined')
     list_filter = ('active', 'grade', 'date_joined')
+    list_select_related = ('grade',)
 
     def guardian_list(self, obj):
         return ", ".join([str(guardian) for guardian in obj.guardians.all()])
     guardian_list.short_description = _('Guardians')
 
+    def _rollover(self, request, queryset, academic_year, dry_run):
+        report = rollover_payments(academic_year, students=queryset, dry_run=dry_run)
+        if dry_run:
+            message = _("Would create %(created)s payments for %(academic_year)s (%(existing)s students already have one, %(without_plan)s have no plan).")
+        else:
+            message = _("Created %(created)s payments for %(academic_year)s (%(existing)s students already have one, %(without_plan)s have no plan).")
+        self.message_user(request, message % report)
+
+    def preview_payment_rollover(self, request, queryset):
+        self._rollover(request, queryset, current_academic_year(), dry_run=True)
+    preview_payment_rollover.short_description = _("Preview current academic year payments (dry run)")
+
+    def create_rollover_payments(self, request, queryset):
+        self._rollover(request, queryset, current_academic_year(), dry_run=False)
+    create_rollover_payments.short_description = _("Create current academic year payments")
+
+    def preview_next_year_rollover(self, request, queryset):
+        self._rollover(request, queryset, next_academic_year(current_academic_year()), dry_run=True)
+    preview_next_year_rollover.short_description = _("Preview next academic year payments (dry run)")
+
+    def create_next_year_payments(self, request, queryset):
+        self._rollover(request, queryset, next_academic_year(current_academic_year()), dry_run=False)
+    create_next_year_payments.short_description = _("Create next academic year payments")
+
+    actions = [preview_payment_rollover, create_rollover_payments, preview_next_year_rollover, create_next_year_payments]
+
 @admin.register(Guardian)
-class GuardianAdmin(admin.ModelAdmin):
+class GuardianAdmin(EstimatedCountAdminMixin, SearchTextAdminMixin, admin.ModelAdmin):
     list_display = ('first_name', 'last_name', 'phone_number', 'landline_number', 'address', 'profession', 'postal_code', 'email')
-    search_fields = ('first_name', 'last_name', 'phone_number', 'profession', 'postal_code', 'email')
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_indexes(sender, using, **kwargs):
+    from django.db import connections
+    from .models import Student, Guardian
+    from .search import install_search_index
+
+    for model in (Student, Guardian):
+        install_search_index(connections[using], model)
 
 
 class PeopleConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'People'
+
+    def ready(self):
+        post_migrate.connect(ensure_search_indexes, sender=self)
@@ -0,0 +1,253 @@
+"""
+Bulk badge export for printing.
+
+Badges (QR code plus the student's name and grade) are rendered in a process
+pool shared by the requests of the web worker (small exports are rendered in
+the request thread) and streamed to the client as each one finishes, either as a ZIP of PNG
+images or as a PDF of A4 sheets. The PDF writer below is a minimal streaming
+one: it emits each page as soon as it is rendered and writes the page tree
+and cross-reference table at the end, so memory use does not grow with the
+number of students.
+
+Worker functions take and return plain picklable values and never touch the
+database.
+"""
+import os
+import threading
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+
+from .qr import build_qr
+
+# Fewer items than this are rendered in the request thread
+PARALLEL_MIN_ITEMS = 4
+
+BADGE_SIZE = (400, 470)
+QR_SIZE = 340
+
+# A4 at 150 dpi, in pixels and in PDF points.
+PAGE_SIZE_PX = (1240, 1754)
+PAGE_SIZE_PT = (595, 842)
+PAGE_COLUMNS = 3
+PAGE_ROWS = 3
+BADGES_PER_PAGE = PAGE_COLUMNS * PAGE_ROWS
+
+DEFAULT_FONT_PATHS = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    'DejaVuSans.ttf',
+)
+
+
+def _font(size):
+    paths = [getattr(settings, 'BADGE_FONT_PATH', None)] if settings.configured else []
+    for path in [p for p in paths if p] + list(DEFAULT_FONT_PATHS):
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def _centered_text(draw, y, text, font):
+    width = draw.textlength(text, font=font)
+    draw.text(((BADGE_SIZE[0] - width) / 2, y), text, fill='black', font=font)
+
+
+def render_badge_image(badge):
+    """
+    Render one badge. ``badge`` is a tuple
+    ``(uuid, name, grade_name, student_id)`` of plain strings.
+    """
+    student_uuid, name, grade_name, student_id = badge
+    image = Image.new('L', BADGE_SIZE, 255)
+    qr_image = build_qr(student_uuid).make_image(fill_color="black", back_color="white").get_image()
+    image.paste(qr_image.convert('L').resize((QR_SIZE, QR_SIZE), Image.NEAREST), ((BADGE_SIZE[0] - QR_SIZE) // 2, 10))
+
+    draw = ImageDraw.Draw(image)
+    _centered_text(draw, QR_SIZE + 20, name, _font(28))
+    _centered_text(draw, QR_SIZE + 60, ' · '.join(part for part in (grade_name, student_id) if part), _font(20))
+    draw.rectangle([0, 0, BADGE_SIZE[0] - 1, BADGE_SIZE[1] - 1], outline=200)
+    return image
+
+
+def render_badge_png(badge):
+    """Worker: return ``(filename, png_bytes)`` for one badge."""
+    buffer = BytesIO()
+    render_badge_image(badge).save(buffer, format='PNG', optimize=True)
+    name = ''.join(ch if ch.isalnum() else '_' for ch in badge[1]).strip('_')
+    return f'{name}_{badge[3] or badge[0]}.png', buffer.getvalue()
+
+
+def render_badge_page(badges):
+    """Worker: return the Flate-compressed grayscale pixels of one A4 sheet."""
+    page = Image.new('L', PAGE_SIZE_PX, 255)
+    margin_x = (PAGE_SIZE_PX[0] - PAGE_COLUMNS * BADGE_SIZE[0]) // (PAGE_COLUMNS + 1)
+    margin_y = (PAGE_SIZE_PX[1] - PAGE_ROWS * BADGE_SIZE[1]) // (PAGE_ROWS + 1)
+    for index, badge in enumerate(badges):
+        row, column = divmod(index, PAGE_COLUMNS)
+        x = margin_x + column * (BADGE_SIZE[0] + margin_x)
+        y = margin_y + row * (BADGE_SIZE[1] + margin_y)
+        page.paste(render_badge_image(badge), (x, y))
+    return zlib.compress(page.tobytes(), 6)
+
+
+def export_workers():
+    workers = getattr(settings, 'BADGE_EXPORT_WORKERS', None)
+    return workers or min(os.cpu_count() or 1, 4)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _shared_pool():
+    """The process pool of this web worker, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=export_workers())
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _parallel_map(func, items, workers):
+    """
+    Yield ``func(item)`` in order, rendering across the shared process pool.
+    At most ``workers`` items are in flight, so a client that disconnects
+    leaves little work behind.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) < PARALLEL_MIN_ITEMS:
+        for item in items:
+            yield func(item)
+        return
+
+    pool = _shared_pool()
+    pending = deque()
+    items = iter(items)
+    try:
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    except BrokenProcessPool:
+        # A worker died; start a new pool for the next export
+        _discard_pool(pool)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _ChunkWriter:
+    """Write-only file object that hands its contents back in chunks."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_badge_zip(badges, workers=None):
+    """Yield the bytes of a ZIP archive with one PNG per badge."""
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for filename, content in _parallel_map(render_badge_png, badges, workers or export_workers()):
+            archive.writestr(filename, content)
+            yield writer.take()
+    yield writer.take()
+
+
+class _PdfStream:
+    """Tracks object offsets while PDF bytes are yielded."""
+
+    def __init__(self):
+        self.position = 0
+        self.offsets = {}
+        self.next_id = 3  # 1 = catalog, 2 = page tree, written last
+
+    def allocate(self):
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def emit(self, data):
+        self.position += len(data)
+        return data
+
+    def obj(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.position
+        data = f'{object_id} 0 obj\n'.encode() + body
+        if stream is not None:
+            data += b'\nstream\n' + stream + b'\nendstream'
+        return self.emit(data + b'\nendobj\n')
+
+
+def stream_badge_pdf(badges, workers=None):
+    """Yield the bytes of a PDF with BADGES_PER_PAGE badges per A4 page."""
+    pdf = _PdfStream()
+    yield pdf.emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    page_ids = []
+    width_pt, height_pt = PAGE_SIZE_PT
+    pages = _parallel_map(render_badge_page, _chunks(badges, BADGES_PER_PAGE), workers or export_workers())
+    for pixels in pages:
+        image_id, content_id, page_id = pdf.allocate(), pdf.allocate(), pdf.allocate()
+        yield pdf.obj(image_id, (
+            f'<< /Type /XObject /Subtype /Image /Width {PAGE_SIZE_PX[0]} /Height {PAGE_SIZE_PX[1]} '
+            f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(pixels)} >>'
+        ).encode(), pixels)
+        content = f'q {width_pt} 0 0 {height_pt} 0 0 cm /Im0 Do Q'.encode()
+        yield pdf.obj(content_id, f'<< /Length {len(content)} >>'.encode(), content)
+        yield pdf.obj(page_id, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt} {height_pt}] '
+            f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>'
+        ).encode())
+        page_ids.append(page_id)
+
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    yield pdf.obj(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode())
+    yield pdf.obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    xref_offset = pdf.position
+    lines = [f'xref\n0 {pdf.next_id}\n', '0000000000 65535 f \n']
+    lines += [f'{pdf.offsets[object_id]:010d} 00000 n \n' for object_id in range(1, pdf.next_id)]
+    lines.append(f'trailer\n<< /Size {pdf.next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n')
+    yield pdf.emit(''.join(lines).encode())
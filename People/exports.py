@@ -0,0 +1,271 @@
+"""
+Streaming CSV/XLSX exports of students, guardians, payments and receipts.
+
+Each dataset is a ``values_list`` query with its related names joined in
+SQL, read with ``iterator(chunk_size=...)`` (a server-side cursor on
+PostgreSQL) and encoded a block of rows at a time, so memory use does not
+depend on the size of the table. The XLSX writer below is a minimal
+streaming one: a single worksheet of inline strings and numbers written
+through a ZIP stream, without a spreadsheet library. Text cells that
+start like a formula (``=``, ``+``, ``-``, ``@``) get a leading quote so
+they can't inject formulas.
+"""
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from .badges import _ChunkWriter
+from .models import Guardian, Student
+
+EXPORT_CHUNK_SIZE = 2000
+ROWS_PER_BLOCK = 500
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _students():
+    return Student.objects.order_by('last_name', 'first_name', 'id'), [
+        ('Student ID', 'student_id'),
+        ('First Name', 'first_name'),
+        ('Last Name', 'last_name'),
+        ('Active', 'active'),
+        ('Grade', 'grade__name'),
+        ('Payment Plan', 'payment_plan__name'),
+        ('Phone Number', 'phone_number'),
+        ('Email', 'email'),
+        ('Address', 'address'),
+        ('School', 'school'),
+        ('School Year', 'school_year'),
+        ('Birth Date', 'birth_date'),
+        ('Date Joined', 'date_joined'),
+        ('Presences', 'presences'),
+        ('Absences', 'absences'),
+    ]
+
+
+def _guardians():
+    return Guardian.objects.order_by('last_name', 'first_name', 'id'), [
+        ('ID', 'id'),
+        ('First Name', 'first_name'),
+        ('Last Name', 'last_name'),
+        ('Phone Number', 'phone_number'),
+        ('Landline Number', 'landline_number'),
+        ('Email', 'email'),
+        ('Address', 'address'),
+        ('Postal Code', 'postal_code'),
+        ('Profession', 'profession'),
+    ]
+
+
+def _payments():
+    from Payments.models import Payment
+
+    return Payment.objects.order_by('academic_year', 'student__last_name', 'student__first_name', 'id'), [
+        ('ID', 'id'),
+        ('Student ID', 'student__student_id'),
+        ('First Name', 'student__first_name'),
+        ('Last Name', 'student__last_name'),
+        ('Payment Plan', 'payment_plan__name'),
+        ('Academic Year', 'academic_year'),
+        ('One-time Fee Paid', 'one_time_fee_paid'),
+        ('Total Paid', 'total_paid'),
+        ('Paid Through', 'paid_through__name'),
+    ]
+
+
+def _receipts():
+    from Payments.models import Receipt
+
+    return Receipt.objects.order_by('id'), [
+        ('Receipt Number', 'receipt_number'),
+        ('Student ID', 'payment__student__student_id'),
+        ('First Name', 'payment__student__first_name'),
+        ('Last Name', 'payment__student__last_name'),
+        ('Payment Plan', 'payment__payment_plan__name'),
+        ('Academic Year', 'payment__academic_year'),
+        ('Received On', 'received_on'),
+        ('Amount Paid', 'amount_paid'),
+        ('Description', 'description'),
+    ]
+
+
+EXPORT_DATASETS = {
+    'students': _students,
+    'guardians': _guardians,
+    'payments': _payments,
+    'receipts': _receipts,
+}
+
+
+def export_rows(dataset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Return ``(headers, rows)`` for ``dataset``; ``rows`` is a lazy iterator."""
+    queryset, columns = EXPORT_DATASETS[dataset]()
+    headers = [header for header, _ in columns]
+    rows = queryset.values_list(*(field for _, field in columns)).iterator(chunk_size=chunk_size)
+    return headers, rows
+
+
+def _blocks(rows, size):
+    block = []
+    for row in rows:
+        block.append(row)
+        if len(block) == size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+# Text starting with these is run as a formula by spreadsheet programs
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        # Names and notes typed by users are shown as text, not evaluated
+        return "'" + value
+    return str(value)
+
+
+class _Lines:
+    """File-like object that collects written CSV lines."""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, value):
+        self.lines.append(value)
+
+    def take(self):
+        data = ''.join(self.lines)
+        self.lines = []
+        return data
+
+
+def stream_csv(headers, rows):
+    """Yield UTF-8 CSV bytes (with a BOM, for Excel) a block of rows at a time."""
+    buffer = _Lines()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    yield ('\ufeff' + buffer.take()).encode()
+    for block in _blocks(rows, ROWS_PER_BLOCK):
+        writer.writerows([_text(value) for value in row] for row in block)
+        yield buffer.take().encode()
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+# Characters that are not allowed in XML 1.0
+_INVALID_XML = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xlsx_cell(value):
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_INVALID_XML.sub('', _text(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(headers, rows, sheet_name='Export'):
+    """Yield the bytes of a single-sheet XLSX workbook a block of rows at a time."""
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name[:31])))
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row(headers)
+            ).encode())
+            yield writer.take()
+            for block in _blocks(rows, ROWS_PER_BLOCK):
+                sheet.write(''.join(_xlsx_row(row) for row in block).encode())
+                yield writer.take()
+            sheet.write(b'</sheetData></worksheet>')
+    yield writer.take()
+
+
+def stream_export(dataset, fmt='csv', chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the bytes of ``dataset`` exported as ``fmt`` (``csv`` or ``xlsx``)."""
+    headers, rows = export_rows(dataset, chunk_size)
+    if fmt == 'xlsx':
+        return stream_xlsx(headers, rows, sheet_name=dataset.title())
+    return stream_csv(headers, rows)
+
+
+async def aiter_chunks(chunks):
+    """
+    Async wrapper for a blocking byte iterator. Under ASGI, Django would
+    otherwise read a synchronous streaming response into a list first.
+    """
+    chunks = iter(chunks)
+    done = object()
+    while (chunk := await sync_to_async(next)(chunks, done)) is not done:
+        yield chunk
+
+
+def streaming_response(request, chunks, content_type):
+    """
+    ``StreamingHttpResponse`` over the byte iterator ``chunks`` that is also
+    streamed, not buffered, when the request came in through ASGI.
+    """
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+    return StreamingHttpResponse(chunks, content_type=content_type)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from People.exports import EXPORT_CHUNK_SIZE, EXPORT_DATASETS, EXPORT_FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Export students, guardians, payments or receipts as CSV or XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORT_DATASETS))
+        parser.add_argument(
+            '--format',
+            choices=sorted(EXPORT_FORMATS),
+            default='csv',
+            help='File format (default: csv)',
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help='File to write; CSV goes to standard output when omitted',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help='Number of rows fetched from the database at a time',
+        )
+
+    def handle(self, *args, **options):
+        if options['format'] == 'xlsx' and not options['output']:
+            raise CommandError('XLSX exports need --output.')
+
+        chunks = stream_export(options['dataset'], options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f'Exported {options["dataset"]} to {options["output"]}.'))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from People.models import Student
+from People.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Generate missing or stale photo thumbnails for students'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate thumbnails even if they are up to date',
+        )
+
+    def handle(self, *args, **options):
+        force = options.get('force', False)
+        students = Student.objects.exclude(photo='').only('id', 'photo', 'photo_thumbnails')
+
+        generated = 0
+        for student in students.iterator(chunk_size=200):
+            if not force and (student.photo_thumbnails or {}).get('source') == student.photo.name:
+                continue
+            try:
+                generate_thumbnails(student)
+                generated += 1
+            except (OSError, ValueError) as e:
+                self.stdout.write(self.style.WARNING(f'Skipping student {student.id}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Generated thumbnails for {generated} students.'))
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:07
+
+import unicodedata
+
+from django.db import migrations, models
+
+SEARCH_FIELDS = {
+    'student': ('first_name', 'last_name', 'student_id', 'phone_number', 'email', 'school', 'school_year'),
+    'guardian': ('first_name', 'last_name', 'phone_number', 'landline_number', 'email', 'profession', 'postal_code'),
+}
+
+
+# Frozen copies of People.search.normalize_search_text/build_search_text as of
+# this migration.
+def normalize_search_text(value):
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFD', str(value))
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.casefold().split())
+
+
+def build_search_text(*values):
+    return normalize_search_text(' '.join(str(value) for value in values if value))
+
+
+def populate_search_text(apps, schema_editor):
+    """
+    Fill search_text for existing rows. The search indexes are built after
+    every migrate by People.apps.ensure_search_indexes.
+    """
+    for model_name, fields in SEARCH_FIELDS.items():
+        model = apps.get_model('People', model_name)
+        batch = []
+        for obj in model.objects.only('id', *fields).iterator(chunk_size=500):
+            obj.search_text = build_search_text(*(getattr(obj, f) for f in fields))
+            batch.append(obj)
+            if len(batch) >= 500:
+                model.objects.bulk_update(batch, ['search_text'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['search_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('People', '0016_alter_guardian_landline_number_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guardian',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False, verbose_name='Search Text'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False, verbose_name='Search Text'),
+        ),
+        migrations.RunPython(populate_search_text, reverse_code=migrations.RunPython.noop),
+    ]
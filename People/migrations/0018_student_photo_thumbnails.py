@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('People', '0017_search_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='photo_thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Photo Thumbnails'),
+        ),
+    ]
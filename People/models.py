@@ -1,10 +1,19 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.core.validators import RegexValidator
 from django.utils.translation import gettext_lazy as _
+from .search import build_search_text
 import uuid
 import random
 
+def _refresh_search_text(instance, save_kwargs):
+    """Recompute search_text before save, including it in any update_fields."""
+    instance.search_text = build_search_text(*(getattr(instance, f) for f in instance.SEARCH_FIELDS))
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and 'search_text' not in update_fields:
+        save_kwargs['update_fields'] = list(update_fields) + ['search_text']
+
+
 class Student(models.Model):
     """
     Represents a student in the system.
@@ -32,10 +41,51 @@ class Student(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     date_joined = models.DateField(default=timezone.now, verbose_name=_("Date Joined"))
     student_id = models.CharField(max_length=15, unique=True, blank=True, verbose_name=_("Student ID"))
+    search_text = models.TextField(blank=True, editable=False, verbose_name=_("Search Text"))
+    photo_thumbnails = models.JSONField(default=dict, blank=True, editable=False, verbose_name=_("Photo Thumbnails"))
+
+    SEARCH_FIELDS = ('first_name', 'last_name', 'student_id', 'phone_number', 'email', 'school', 'school_year')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Read the raw value so deferred photos are not loaded just for this.
+        photo = self.__dict__.get('photo')
+        self._saved_photo_name = getattr(photo, 'name', photo) or ''
 
     def __str__(self):
         return f'{self.first_name} {self.last_name}'
 
+    def _photo_thumbnails(self, fmt):
+        """Thumbnail paths by size for ``fmt``, if they match the current photo."""
+        thumbnails = self.photo_thumbnails or {}
+        if not self.photo or thumbnails.get('source') != self.photo.name:
+            return {}
+        return thumbnails.get(fmt, {})
+
+    def _photo_srcset(self, fmt):
+        from django.core.files.storage import default_storage
+        return ', '.join(
+            f'{default_storage.url(path)} {size}w'
+            for size, path in sorted(self._photo_thumbnails(fmt).items(), key=lambda item: int(item[0]))
+        )
+
+    @property
+    def photo_src(self):
+        """Small JPEG thumbnail URL, or the original photo until it exists."""
+        from django.core.files.storage import default_storage
+        jpeg = self._photo_thumbnails('jpeg')
+        if jpeg:
+            return default_storage.url(jpeg[min(jpeg, key=int)])
+        return self.photo.url if self.photo else ''
+
+    @property
+    def photo_srcset(self):
+        return self._photo_srcset('jpeg')
+
+    @property
+    def photo_webp_srcset(self):
+        return self._photo_srcset('webp')
+
     def _generate_student_id(self):
         """Generate a unique student ID based on date joined and random numbers."""
         # Format: YYYYMMDD-RRRRR (e.g., 20231215-12345)
@@ -55,8 +105,14 @@ class Student(models.Model):
         # Generate student_id if not set
         if not self.student_id:
             self.student_id = self._generate_student_id()
-        
+        _refresh_search_text(self, kwargs)
+
         super().save(*args, **kwargs)
+        photo_name = self.photo.name if self.photo else ''
+        if photo_name and photo_name != self._saved_photo_name:
+            from .tasks import generate_student_thumbnails
+            transaction.on_commit(lambda: generate_student_thumbnails(self.pk))
+        self._saved_photo_name = photo_name
         if self.payment_plan and not self.payments.filter(payment_plan=self.payment_plan).exists():
             from Payments.models import Payment
             Payment.objects.create(
@@ -67,6 +123,10 @@ class Student(models.Model):
     class Meta:
         verbose_name = _('Student')
         verbose_name_plural = _('Students')
+        indexes = [
+            # Keyset pagination order of the student list (People.pagination)
+            models.Index(fields=['last_name', 'first_name', 'id'], name='student_name_order_idx'),
+        ]
 
 class Guardian(models.Model):
     """
@@ -85,10 +145,17 @@ class Guardian(models.Model):
     postal_code = models.CharField(max_length=5, blank=True, verbose_name=_("Postal Code"))
     profession = models.CharField(max_length=30, verbose_name=_("Profession"), blank=True)
     email = models.EmailField(max_length=30, blank=True, verbose_name=_("Email"))
+    search_text = models.TextField(blank=True, editable=False, verbose_name=_("Search Text"))
+
+    SEARCH_FIELDS = ('first_name', 'last_name', 'phone_number', 'landline_number', 'email', 'profession', 'postal_code')
 
     def __str__(self):
         return f'{self.first_name} {self.last_name}'
 
+    def save(self, *args, **kwargs):
+        _refresh_search_text(self, kwargs)
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = _('Guardian')
         verbose_name_plural = _('Guardians')
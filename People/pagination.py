@@ -0,0 +1,148 @@
+"""
+Keyset (seek) pagination helpers.
+
+Instead of OFFSET/LIMIT, each page is fetched with a WHERE clause that
+continues after the last row of the previous page. The position is carried
+between requests as an opaque cursor, so deep pages cost the same as the
+first one and rows inserted meanwhile do not shift the page boundaries.
+
+``EstimatedCountPaginator`` is for admin changelists of large tables, where
+the ``COUNT(*)`` behind the page links costs more than the page itself.
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+# Tables estimated below this many rows are counted exactly.
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def encode_cursor(values):
+    """Encode a list of ordering values into an opaque URL-safe cursor."""
+    raw = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor. Returns None if it is invalid."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _seek_filter(ordering, values):
+    """
+    Build the "row comes after (values)" predicate for a multi-column ordering.
+
+    For ordering (a, b, id) this expands to:
+        a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND id > vid)
+    with > replaced by < for descending columns.
+    """
+    condition = Q()
+    equal_so_far = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+        equal_so_far &= Q(**{name: value})
+    return condition
+
+
+def _cursor_values(model, ordering, values):
+    """
+    The cursor ``values`` converted by their model fields, or None if the
+    cursor doesn't fit ``ordering`` (e.g. it was edited by hand).
+    """
+    if values is None or len(values) != len(ordering):
+        return None
+    converted = []
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        try:
+            model_field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            converted.append(model_field.to_python(value))
+        except (FieldDoesNotExist, ValidationError, TypeError, ValueError):
+            return None
+    return converted
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=50):
+    """
+    Return one page of ``queryset`` ordered by ``ordering``.
+
+    ``ordering`` is a list of field names (prefix with '-' for descending).
+    The primary key is appended as a tiebreaker so the order is total.
+    Returns a tuple ``(rows, next_cursor)`` where ``next_cursor`` is None on
+    the last page.
+    """
+    ordering = list(ordering)
+    if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+        ordering.append('-id' if ordering and ordering[0].startswith('-') else 'id')
+
+    queryset = queryset.order_by(*ordering)
+    values = _cursor_values(queryset.model, ordering, decode_cursor(cursor))
+    if values is not None:
+        try:
+            queryset = queryset.filter(_seek_filter(ordering, values))
+        except ValueError:
+            # e.g. a null value, which no lookup accepts; start over
+            pass
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+    return rows, next_cursor
+
+
+def estimated_row_count(model, using='default'):
+    """
+    The planner's row estimate for ``model``'s table on PostgreSQL, or None
+    on other databases and for tables that were never analyzed.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts an unfiltered queryset from the table's row estimate once the
+    table is large; filtered querysets and small tables are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class EstimatedCountAdminMixin:
+    """
+    Changelist settings for large tables: estimated page counts and no
+    second ``COUNT(*)`` of the whole table when the list is filtered.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
@@ -0,0 +1,76 @@
+"""
+QR code artifact store for student badges.
+
+A badge QR code encodes only the student's UUID, which never changes, so
+each image is rendered once and kept in the default file storage under
+``qr_codes/<uuid>.<format>``. Later requests read the stored bytes, and
+because the content is a pure function of the UUID the HTTP layer can hand
+out a permanent ETag and long-lived cache headers.
+"""
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+QR_STORAGE_DIR = 'qr_codes'
+
+# Bump when the rendering parameters change so stored files and browser
+# caches are not reused.
+QR_RENDER_VERSION = 1
+
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def qr_storage_path(student_uuid, fmt):
+    return f'{QR_STORAGE_DIR}/v{QR_RENDER_VERSION}/{student_uuid}.{fmt}'
+
+
+def qr_etag(student_uuid, fmt):
+    return f'"qr-{student_uuid}-v{QR_RENDER_VERSION}-{fmt}"'
+
+
+def build_qr(student_uuid):
+    """Return the fitted QRCode object encoding ``student_uuid``."""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(str(student_uuid))
+    qr.make(fit=True)
+    return qr
+
+
+def render_qr_code(student_uuid, fmt='png'):
+    """Render the QR code for ``student_uuid`` and return the image bytes."""
+    qr = build_qr(student_uuid)
+    buffer = BytesIO()
+    if fmt == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def get_qr_code(student_uuid, fmt='png'):
+    """
+    Return the stored QR image bytes for ``student_uuid``, rendering and
+    storing them on first use.
+    """
+    if fmt not in QR_FORMATS:
+        raise ValueError(f'Unsupported QR format: {fmt}')
+
+    path = qr_storage_path(student_uuid, fmt)
+    if default_storage.exists(path):
+        with default_storage.open(path, 'rb') as stored:
+            return stored.read()
+
+    content = render_qr_code(student_uuid, fmt)
+    default_storage.save(path, ContentFile(content))
+    return content
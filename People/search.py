@@ -0,0 +1,175 @@
+"""
+Accent- and case-insensitive search for students and guardians.
+
+Every searchable model keeps a ``search_text`` column holding its searchable
+fields run through ``normalize_search_text``. Queries are normalized the same
+way, so "παπαδοπουλος" finds "Παπαδόπουλος". The column is indexed per
+database backend, installed after every migrate (see ``People.apps``):
+
+- SQLite: an external-content FTS5 table named ``<db_table>_fts`` using the
+  trigram tokenizer, kept in sync by triggers.
+- PostgreSQL: a ``pg_trgm`` GIN index, which serves the substring
+  (``LIKE '%word%'``) lookups used for every query word.
+- Anything else falls back to unindexed substring lookups.
+
+On every backend a row matches when each query word occurs anywhere in its
+search text, so "4567" finds the phone number "6912345678". Trigram indexes
+can't serve words shorter than three characters; those are matched with a
+plain substring lookup.
+
+``search_text`` is recomputed in the models' ``save()``. Queryset
+``update()`` and ``bulk_update()`` bypass it, so code that changes a
+searchable field that way must call ``refresh_search_text`` on the rows
+afterwards.
+"""
+import unicodedata
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+TYPEAHEAD_LIMIT = 20
+# FTS5 got the trigram tokenizer in SQLite 3.34
+FTS_TRIGRAM_SQLITE_VERSION = (3, 34, 0)
+TRIGRAM_LENGTH = 3
+
+# Cache of FTS table availability per database name.
+_fts_tables = {}
+
+
+def normalize_search_text(value):
+    """Strip accents and case-fold ``value`` for indexing or matching."""
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFD', str(value))
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.casefold().split())
+
+
+def build_search_text(*values):
+    """Join and normalize the searchable field values of a row."""
+    return normalize_search_text(' '.join(str(value) for value in values if value))
+
+
+def refresh_search_text(queryset, batch_size=500):
+    """
+    Recompute ``search_text`` for the rows of ``queryset``, after a queryset
+    ``update()`` of their searchable fields. Returns the number of rows.
+    """
+    fields = queryset.model.SEARCH_FIELDS
+    count = 0
+    rows = []
+    for row in queryset.only('pk', *fields).iterator(chunk_size=batch_size):
+        row.search_text = build_search_text(*(getattr(row, field) for field in fields))
+        rows.append(row)
+        if len(rows) == batch_size:
+            count += len(rows)
+            queryset.model.objects.bulk_update(rows, ['search_text'])
+            rows = []
+    if rows:
+        count += len(rows)
+        queryset.model.objects.bulk_update(rows, ['search_text'])
+    return count
+
+
+def fts_table_name(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def install_search_index(connection, model):
+    """
+    Create the search index for ``model`` if it is missing. Safe to run
+    repeatedly; the ``post_migrate`` hook in ``People.apps`` calls it after
+    every ``migrate``, because SQLite table rebuilds drop the sync triggers.
+    """
+    table = model._meta.db_table
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {quote(table + "_search_trgm")} '
+                f'ON {quote(table)} USING gin (search_text gin_trgm_ops)'
+            )
+            return
+
+        if connection.vendor != 'sqlite':
+            return
+        if connection.Database.sqlite_version_info < FTS_TRIGRAM_SQLITE_VERSION:
+            return
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+
+        fts = fts_table_name(model)
+        triggers = {
+            f'{fts}_ai': (
+                f'AFTER INSERT ON {quote(table)} BEGIN '
+                f'INSERT INTO {quote(fts)}(rowid, search_text) VALUES (new.id, new.search_text); END'
+            ),
+            f'{fts}_ad': (
+                f'AFTER DELETE ON {quote(table)} BEGIN '
+                f"INSERT INTO {quote(fts)}({quote(fts)}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END"
+            ),
+            f'{fts}_au': (
+                f'AFTER UPDATE OF search_text ON {quote(table)} BEGIN '
+                f"INSERT INTO {quote(fts)}({quote(fts)}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+                f'INSERT INTO {quote(fts)}(rowid, search_text) VALUES (new.id, new.search_text); END'
+            ),
+        }
+        cursor.execute("SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s", [f'{fts}%'])
+        existing = dict(cursor.fetchall())
+        if fts in existing and 'trigram' not in existing[fts]:
+            # Built by an earlier version with word-prefix matching
+            cursor.execute(f'DROP TABLE {quote(fts)}')
+            del existing[fts]
+        if fts in existing and existing.keys() >= triggers.keys():
+            return
+
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {quote(fts)} USING fts5('
+            f"search_text, content='{table}', content_rowid='id', tokenize='trigram')"
+        )
+        for name, body in triggers.items():
+            cursor.execute(f'DROP TRIGGER IF EXISTS {quote(name)}')
+            cursor.execute(f'CREATE TRIGGER {quote(name)} {body}')
+        cursor.execute(f"INSERT INTO {quote(fts)}({quote(fts)}) VALUES ('rebuild')")
+    _fts_tables.pop((connection.settings_dict['NAME'], table), None)
+
+
+def _has_fts_table(connection, model):
+    key = (connection.settings_dict['NAME'], model._meta.db_table)
+    if key not in _fts_tables:
+        with connection.cursor() as cursor:
+            tables = connection.introspection.table_names(cursor)
+        _fts_tables[key] = fts_table_name(model) in tables
+    return _fts_tables[key]
+
+
+def search(queryset, query):
+    """
+    Filter ``queryset`` to rows whose search text matches every word of
+    ``query``. An empty query returns the queryset unchanged.
+    """
+    words = normalize_search_text(query).split()
+    if not words:
+        return queryset
+
+    model = queryset.model
+    connection = connections[queryset.db]
+    indexed = [word for word in words if len(word) >= TRIGRAM_LENGTH]
+    if indexed and connection.vendor == 'sqlite' and _has_fts_table(connection, model):
+        table = connection.ops.quote_name(fts_table_name(model))
+        match = ' '.join('"%s"' % word.replace('"', '""') for word in indexed)
+        queryset = queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [match])
+        )
+        words = [word for word in words if len(word) < TRIGRAM_LENGTH]
+
+    for word in words:
+        queryset = queryset.filter(search_text__contains=word)
+    return queryset
+
+
+def typeahead(queryset, query, limit=TYPEAHEAD_LIMIT):
+    """Return the first ``limit`` matches ordered by name."""
+    return list(search(queryset, query).order_by('last_name', 'first_name')[:limit])
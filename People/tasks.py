@@ -0,0 +1,26 @@
+"""
+Background tasks for the People app, run by django-background-tasks.
+"""
+from background_task import background
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@background(schedule=0)
+def generate_student_thumbnails(student_id):
+    """
+    Background task to render the WebP/JPEG thumbnails of a newly
+    uploaded student photo.
+    """
+    from .models import Student
+    from .thumbnails import generate_thumbnails
+
+    student = Student.objects.filter(pk=student_id).first()
+    if student is None:
+        return
+    try:
+        generate_thumbnails(student)
+        logger.info(f'Generated photo thumbnails for student {student_id}')
+    except Exception as e:
+        logger.error(f'Error generating thumbnails for student {student_id}: {e}')
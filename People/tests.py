@@ -1,11 +1,30 @@
-from django.test import TestCase, Client
+from django.test import AsyncClient, TestCase, Client, override_settings
 from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from background_task.models import Task
+from PIL import Image
 from .models import Student, Guardian
+from . import badges
+from .exports import stream_export
+from .pagination import ESTIMATED_COUNT_THRESHOLD, EstimatedCountPaginator, encode_cursor, estimated_row_count
+from .search import normalize_search_text, refresh_search_text, search
+from .thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_SIZES, generate_thumbnails
 from Class_related.models import Grade, Attendance
-from Payments.models import PaymentPlan, Payment, Month
+from Payments.models import PaymentPlan, Payment, Month, Receipt
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from io import BytesIO, StringIO
+from unittest.mock import patch
+import asyncio
+import csv
 import json
-
+import os
+import tempfile
+import uuid
+import zipfile
 
 class StudentUpdateTestCase(TestCase):
     """Test student update functionality including grade and payment plan changes"""
@@ -162,6 +181,7 @@ class PaymentPlanAssignmentTestCase(TestCase):
         self.assertEqual(self.student.payment_plan, other_plan)
 
 
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
 class QRCodeGenerationTestCase(TestCase):
     """Test QR code generation for students"""
     
@@ -241,3 +261,504 @@ class AttendanceStatsTestCase(TestCase):
         self.assertEqual(grade_data['absent_count'], 1)
         self.assertEqual(len(grade_data['attendances']), 2)
 
+
+
+class StudentListPaginationTestCase(TestCase):
+    """Test keyset pagination, sorting and filtering of the student list"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        self.grade = Grade.objects.create(name='Grade 1', reset_time='10:00:00')
+        for i in range(7):
+            Student.objects.create(
+                first_name=f'First{i}',
+                last_name=f'Last{i}',
+                address='1 Test St',
+                grade=self.grade if i % 2 == 0 else None,
+                active=i != 6,
+                school_year='2024' if i < 3 else '2025'
+            )
+
+    def _collect(self, params):
+        """Follow next_cursor through every page of the JSON endpoint"""
+        names = []
+        cursor = ''
+        while True:
+            response = self.client.get(
+                reverse('people:student_list_api'),
+                dict(params, cursor=cursor)
+            )
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+            names.extend(row['last_name'] for row in data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                return names
+
+    def test_pages_cover_all_students_in_order(self):
+        """Test that walking the cursors returns every student exactly once"""
+        names = self._collect({'page_size': 3})
+        self.assertEqual(names, [f'Last{i}' for i in range(7)])
+
+    def test_descending_sort(self):
+        """Test that descending name sort pages in reverse order"""
+        names = self._collect({'page_size': 2, 'sort': '-name'})
+        self.assertEqual(names, [f'Last{i}' for i in reversed(range(7))])
+
+    def test_filters(self):
+        """Test grade, active and school year filters"""
+        self.assertEqual(self._collect({'grade': self.grade.id}), ['Last0', 'Last2', 'Last4', 'Last6'])
+        self.assertEqual(self._collect({'grade': 'none'}), ['Last1', 'Last3', 'Last5'])
+        self.assertEqual(self._collect({'active': '0'}), ['Last6'])
+        self.assertEqual(self._collect({'school_year': '2024'}), ['Last0', 'Last1', 'Last2'])
+
+    def test_search(self):
+        """Test that the search parameter filters students"""
+        self.assertEqual(self._collect({'search': 'Last3'}), ['Last3'])
+
+    def test_list_page_renders_first_page(self):
+        """Test that the HTML page renders only the first page and a cursor"""
+        response = self.client.get(reverse('people:student_list'), {'page_size': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['students']), 5)
+        self.assertTrue(response.context['next_cursor'])
+
+    def test_invalid_cursor_starts_from_beginning(self):
+        """Test that a malformed cursor is ignored"""
+        response = self.client.get(reverse('people:student_list_api'), {'cursor': '!!bad!!'})
+        data = json.loads(response.content)
+        self.assertEqual(data['results'][0]['last_name'], 'Last0')
+
+    def test_tampered_cursor_starts_from_beginning(self):
+        """Test that a cursor of the right length but with wrongly typed values is ignored"""
+        for sort, values in [('joined', ['not-a-date', 1]), ('joined', [{'a': 1}, 1]),
+                             ('name', ['Last1', 'First1', 'x']), ('name', [None, None, 1])]:
+            response = self.client.get(reverse('people:student_list_api'), {'sort': sort, 'cursor': encode_cursor(values)})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(json.loads(response.content)['results']), 7)
+
+
+class PeopleSearchTestCase(TestCase):
+    """Test the normalized, indexed search for students and guardians"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_superuser(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        self.student = Student.objects.create(
+            first_name='Γιώργος',
+            last_name='Παπαδόπουλος',
+            address='Αθήνα',
+            phone_number='6944123456'
+        )
+        self.other = Student.objects.create(first_name='Maria', last_name='Nikou', address='Pireas')
+        self.guardian = Guardian.objects.create(
+            first_name='Ελένη',
+            last_name='Κωνσταντίνου',
+            phone_number='2101234567',
+            address='Αθήνα',
+            profession='Γιατρός'
+        )
+
+    def test_search_text_is_normalized(self):
+        """Test that search_text is maintained on save without accents or case"""
+        self.assertIn(normalize_search_text('ΠΑΠΑΔΟΠΟΥΛΟΣ'), self.student.search_text)
+        self.student.last_name = 'Ιωάννου'
+        self.student.save()
+        self.student.refresh_from_db()
+        self.assertIn('ιωαννου', self.student.search_text)
+
+    def test_refresh_after_queryset_update(self):
+        """Test that refresh_search_text catches up after update() bypassed save()"""
+        Student.objects.filter(pk=self.student.pk).update(last_name='Ιωάννου')
+        self.assertFalse(search(Student.objects.all(), 'ιωαννου').exists())
+        self.assertEqual(refresh_search_text(Student.objects.filter(pk=self.student.pk)), 1)
+        self.assertEqual(list(search(Student.objects.all(), 'ιωαννου')), [self.student])
+
+    def test_student_list_matches_without_accents(self):
+        """Test that unaccented, upper-case queries match accented names"""
+        response = self.client.get(reverse('people:student_list'), {'search': 'ΠΑΠΑΔΟΠ'})
+        self.assertEqual(list(response.context['students']), [self.student])
+
+    def test_every_word_must_match(self):
+        """Test that multi-word queries narrow the results"""
+        response = self.client.get(reverse('people:student_list'), {'search': 'γιωργος nikou'})
+        self.assertEqual(list(response.context['students']), [])
+
+    def test_words_match_anywhere(self):
+        """Test substring matching, the same on every database"""
+        for query, expected in (('4123', [self.student]), ('ikou', [self.other]), ('ni', [self.other]), ('δοπ γι', [self.student])):
+            response = self.client.get(reverse('people:student_list'), {'search': query})
+            self.assertEqual(list(response.context['students']), expected, query)
+
+    def test_guardian_list_search(self):
+        """Test guardian search by unaccented profession"""
+        response = self.client.get(reverse('people:guardian_list'), {'search': 'γιατρος'})
+        self.assertEqual(list(response.context['guardians']), [self.guardian])
+
+    def test_index_follows_updates_and_deletes(self):
+        """Test that renamed and deleted rows stop matching"""
+        self.other.last_name = 'Georgiou'
+        self.other.save()
+        response = self.client.get(reverse('people:people_search'), {'q': 'nikou'})
+        self.assertEqual(json.loads(response.content)['results'], [])
+        self.student.delete()
+        response = self.client.get(reverse('people:people_search'), {'q': 'παπαδ'})
+        self.assertEqual(json.loads(response.content)['results'], [])
+
+    def test_typeahead_is_limited(self):
+        """Test that typeahead returns at most 20 results"""
+        for i in range(25):
+            Student.objects.create(first_name=f'Nikos{i}', last_name='Test', address='x')
+        response = self.client.get(reverse('people:people_search'), {'q': 'nikos'})
+        self.assertEqual(len(json.loads(response.content)['results']), 20)
+
+    def test_typeahead_guardians(self):
+        """Test typeahead over guardians"""
+        response = self.client.get(reverse('people:people_search'), {'q': 'κωνσ', 'kind': 'guardians'})
+        results = json.loads(response.content)['results']
+        self.assertEqual([r['id'] for r in results], [self.guardian.id])
+
+    def test_admin_search(self):
+        """Test that the admin changelist uses the search service"""
+        response = self.client.get(reverse('admin:People_student_changelist'), {'q': 'papadopoulos παπαδοπουλος'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('admin:People_student_changelist'), {'q': 'παπαδοπουλος'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.student])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class QRCodeImageTestCase(TestCase):
+    """Test stored QR code images and their HTTP caching headers"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        self.student = Student.objects.create(first_name='Test', last_name='Student', address='x')
+
+    def _url(self, fmt):
+        return reverse('people:student_qr_image', args=[self.student.uuid, fmt])
+
+    def test_png_and_svg_variants(self):
+        """Test that both image formats are served with cache headers"""
+        png = self.client.get(self._url('png'))
+        self.assertEqual(png['Content-Type'], 'image/png')
+        self.assertTrue(png.content.startswith(b'\x89PNG'))
+        self.assertIn('max-age=31536000', png['Cache-Control'])
+        self.assertIn('immutable', png['Cache-Control'])
+        self.assertTrue(png['ETag'])
+
+        svg = self.client.get(self._url('svg'))
+        self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', svg.content)
+        self.assertNotEqual(png['ETag'], svg['ETag'])
+
+    def test_rendered_once(self):
+        """Test that the image is rendered on first use and then read from storage"""
+        self.client.get(self._url('png'))
+        with patch('People.qr.render_qr_code') as render:
+            response = self.client.get(self._url('png'))
+        render.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified(self):
+        """Test that a matching If-None-Match gets a 304"""
+        etag = self.client.get(self._url('png'))['ETag']
+        response = self.client.get(self._url('png'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_student_or_format(self):
+        """Test 404s for unknown students and formats"""
+        self.assertEqual(self.client.get(reverse('people:student_qr_image', args=[uuid.uuid4(), 'png'])).status_code, 404)
+        self.assertEqual(self.client.get(self._url('gif')).status_code, 404)
+
+    def test_print_page_uses_image_urls(self):
+        """Test that the print page embeds plain image tags"""
+        response = self.client.get(reverse('people:generate_all_qr_codes'))
+        self.assertContains(response, self._url('svg'))
+
+
+@override_settings(BADGE_EXPORT_WORKERS=2)
+class BadgeExportTestCase(TestCase):
+    """Test the streamed PDF and ZIP badge exports"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        self.grade = Grade.objects.create(name='Robotics A', reset_time='10:00:00')
+        for i in range(11):
+            Student.objects.create(
+                first_name=f'Μαθητής{i}', last_name='Test', address='x',
+                grade=self.grade if i < 4 else None
+            )
+        Student.objects.create(first_name='Inactive', last_name='Test', address='x', active=False)
+
+    def test_pdf_export(self):
+        """Test that the PDF is well formed with one page per nine badges"""
+        response = self.client.get(reverse('people:export_badges'))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        pdf = b''.join(response.streaming_content)
+        self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+        self.assertTrue(pdf.rstrip().endswith(b'%%EOF'))
+        self.assertIn(b'/Count 2', pdf)
+
+        # Every cross-reference entry must point at its object
+        xref_offset = int(pdf.rsplit(b'startxref', 1)[1].split()[0])
+        self.assertTrue(pdf[xref_offset:].startswith(b'xref'))
+        entries = pdf[xref_offset:].split(b'\n')[3:]
+        for object_id, entry in enumerate(entries, start=1):
+            if not entry.endswith(b' n '):
+                break
+            offset = int(entry.split()[0])
+            self.assertTrue(pdf[offset:].startswith(f'{object_id} 0 obj'.encode()))
+
+    def test_zip_export_for_grade(self):
+        """Test that the ZIP export contains one image per active student in the grade"""
+        response = self.client.get(reverse('people:export_badges'), {'format': 'zip', 'grade': self.grade.id})
+        self.assertIn('badges-robotics-a.zip', response['Content-Disposition'])
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        names = archive.namelist()
+        self.assertEqual(len(names), 4)
+        self.assertTrue(archive.read(names[0]).startswith(b'\x89PNG'))
+
+    async def test_streamed_under_asgi(self):
+        """Test that ASGI serves the badges as an async stream instead of buffering them"""
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(reverse('people:export_badges'), {'format': 'zip'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(zipfile.ZipFile(BytesIO(content)).namelist()), 11)
+
+    def test_invalid_grade(self):
+        """Test that a non-numeric grade is a 404, not a server error"""
+        response = self.client.get(reverse('people:export_badges'), {'grade': 'abc'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_process_pool_is_reused(self):
+        """Test that exports share one process pool per web worker"""
+        self.assertEqual(list(badges._parallel_map(abs, [-1, -2, -3, -4, -5], 2)), [1, 2, 3, 4, 5])
+        pool = badges._shared_pool()
+        self.assertEqual(list(badges._parallel_map(abs, [-6, -7, -8, -9], 2)), [6, 7, 8, 9])
+        self.assertIs(badges._shared_pool(), pool)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class StudentPhotoThumbnailTestCase(TestCase):
+    """Test the background photo thumbnail pipeline"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+    def _photo(self):
+        image = Image.new('RGB', (800, 600), 'red')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees
+        exif[0x010F] = 'PhoneMaker'
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_queues_background_task(self):
+        """Test that a new photo schedules thumbnail generation once"""
+        with self.captureOnCommitCallbacks(execute=True):
+            student = Student.objects.create(first_name='A', last_name='B', address='x', photo=self._photo())
+        self.assertEqual(Task.objects.filter(task_name='People.tasks.generate_student_thumbnails').count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            student.first_name = 'C'
+            student.save()
+        self.assertEqual(Task.objects.filter(task_name='People.tasks.generate_student_thumbnails').count(), 1)
+
+    def test_generate_thumbnails(self):
+        """Test that thumbnails are written in every size and format without EXIF"""
+        student = Student.objects.create(first_name='A', last_name='B', address='x', photo=self._photo())
+        self.assertEqual(student.photo_src, student.photo.url)
+
+        generate_thumbnails(student)
+        student.refresh_from_db()
+        self.assertEqual(student.photo_thumbnails['source'], student.photo.name)
+        for fmt in THUMBNAIL_FORMATS:
+            self.assertEqual(set(student.photo_thumbnails[fmt]), {str(size) for size in THUMBNAIL_SIZES})
+
+        with default_storage.open(student.photo_thumbnails['jpeg']['64']) as thumb:
+            image = Image.open(thumb)
+            self.assertEqual(image.size, (64, 64))
+            self.assertEqual(len(image.getexif()), 0)
+        self.assertIn('-64.jpg', student.photo_src)
+        self.assertIn('320w', student.photo_webp_srcset)
+
+    def test_replaced_photo_ignores_stale_thumbnails(self):
+        """Test that thumbnails of a previous photo are not used"""
+        student = Student.objects.create(first_name='A', last_name='B', address='x', photo=self._photo())
+        generate_thumbnails(student)
+        student.refresh_from_db()
+        student.photo = self._photo()
+        student.save()
+        self.assertEqual(student.photo_srcset, '')
+        self.assertEqual(student.photo_src, student.photo.url)
+
+    def test_same_photo_names_do_not_share_thumbnails(self):
+        """Test that students whose photos have the same file name keep their own thumbnails"""
+        first = Student.objects.create(first_name='A', last_name='B', address='x', photo=self._photo())
+        # The same file name in another folder
+        other_name = default_storage.save(f'images/other/{os.path.basename(first.photo.name)}', self._photo())
+        second = Student.objects.create(first_name='C', last_name='D', address='x', photo=other_name)
+        generate_thumbnails(first)
+        generate_thumbnails(second)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertNotEqual(first.photo_thumbnails['jpeg']['64'], second.photo_thumbnails['jpeg']['64'])
+        self.assertIn(str(first.uuid), first.photo_thumbnails['jpeg']['64'])
+        self.assertTrue(default_storage.exists(first.photo_thumbnails['jpeg']['64']))
+
+    def test_student_list_uses_srcset(self):
+        """Test that the student list renders a lazy responsive image"""
+        student = Student.objects.create(first_name='A', last_name='B', address='x', photo=self._photo())
+        generate_thumbnails(student)
+        response = self.client.get(reverse('people:student_list'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'loading="lazy"')
+
+
+class DataExportTestCase(TestCase):
+    """Test the streaming CSV/XLSX exports"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+        self.grade = Grade.objects.create(name='Robotics A', reset_time='10:00:00')
+        self.plan = PaymentPlan.objects.create(name='Monthly', monthly_fee=30)
+        self.plan.months.set(Month.objects.filter(order__in=[9, 10]))
+        self.students = [
+            Student.objects.create(first_name=f'Μαρία{i}', last_name='Test', address='x', grade=self.grade, payment_plan=self.plan)
+            for i in range(12)
+        ]
+        Guardian.objects.create(first_name='Nikos', last_name='Guard', phone_number='6900000000', address='x')
+        payment = self.students[0].payments.get()
+        Receipt.objects.create(payment=payment, receipt_number='R-1', amount_paid=30, description='Sept <fee> & more')
+
+    def _csv_rows(self, response):
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.reader(StringIO(content)))
+
+    def test_student_csv_joins_related_names(self):
+        with self.assertNumQueries(3):  # session, user and the export itself
+            response = self.client.get(reverse('people:export_data', args=['students']))
+            rows = self._csv_rows(response)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('students-', response['Content-Disposition'])
+        self.assertEqual(rows[0][:5], ['Student ID', 'First Name', 'Last Name', 'Active', 'Grade'])
+        self.assertEqual(len(rows), 13)
+        self.assertEqual(rows[1][3:6], ['Yes', 'Robotics A', 'Monthly'])
+
+    def test_payment_and_receipt_csv(self):
+        rows = self._csv_rows(self.client.get(reverse('people:export_data', args=['receipts'])))
+        self.assertEqual(rows[1], ['R-1', self.students[0].student_id, 'Μαρία0', 'Test', 'Monthly', self.students[0].payments.get().academic_year, Receipt.objects.get(receipt_number='R-1').received_on.isoformat(), '30.00', 'Sept <fee> & more'])
+
+        rows = self._csv_rows(self.client.get(reverse('people:export_data', args=['payments'])))
+        self.assertEqual(len(rows), 13)
+        paid = next(row for row in rows if row[1] == self.students[0].student_id)
+        self.assertEqual(paid[7:], ['30.00', 'September'])
+
+    def test_xlsx_export(self):
+        response = self.client.get(reverse('people:export_data', args=['receipts']), {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertIn('[Content_Types].xml', archive.namelist())
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('Sept &lt;fee&gt; &amp; more', sheet)
+        self.assertIn('<c><v>30.00</v></c>', sheet)
+        self.assertEqual(sheet.count('<row>'), 2)
+
+    def test_formulas_are_exported_as_text(self):
+        Guardian.objects.create(first_name='=HYPERLINK("http://x")', last_name='@SUM(A1)', address='-2+3', phone_number='1')
+        Receipt.objects.create(payment=self.students[0].payments.get(), receipt_number='R-2', amount_paid=-5, description='+1')
+        rows = self._csv_rows(self.client.get(reverse('people:export_data', args=['guardians'])))
+        guardian = next(row for row in rows if row[2] == "'@SUM(A1)")
+        self.assertEqual(guardian[1], '\'=HYPERLINK("http://x")')
+        self.assertEqual(guardian[6], "'-2+3")
+
+        rows = self._csv_rows(self.client.get(reverse('people:export_data', args=['receipts'])))
+        # Numbers stay numbers
+        self.assertEqual(rows[2][7:], ['-5.00', "'+1"])
+
+    def test_unknown_dataset_or_format(self):
+        self.assertEqual(self.client.get(reverse('people:export_data', args=['users'])).status_code, 404)
+        response = self.client.get(reverse('people:export_data', args=['students']), {'format': 'pdf'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_rows_streamed_in_blocks(self):
+        with patch('People.exports.ROWS_PER_BLOCK', 5):
+            chunks = list(stream_export('students', chunk_size=4))
+        self.assertEqual(len(chunks), 1 + 3)  # header, then 5 + 5 + 2 rows
+
+    def test_async_iteration(self):
+        from .exports import aiter_chunks
+
+        async def collect():
+            return [chunk async for chunk in aiter_chunks(iter([b'a', b'b']))]
+
+        self.assertEqual(asyncio.run(collect()), [b'a', b'b'])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_data', 'guardians', stdout=out)
+        self.assertIn('Nikos', out.getvalue())
+
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as f:
+            path = f.name
+        self.addCleanup(os.remove, path)
+        call_command('export_data', 'students', format='xlsx', output=path, stderr=StringIO())
+        with zipfile.ZipFile(path) as archive:
+            self.assertIn('Μαρία0', archive.read('xl/worksheets/sheet1.xml').decode())
+
+
+class AdminChangelistTestCase(TestCase):
+    """Test the people changelists and the estimated count paginator"""
+
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_superuser(username='peopleadmin', password='adminpass')
+        self.client.login(username='peopleadmin', password='adminpass')
+        self.grade = Grade.objects.create(name='Grade 1', reset_time='10:00:00')
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_are_bounded(self):
+        urls = [reverse('admin:People_student_changelist'), reverse('admin:People_guardian_changelist')]
+        for i in range(2):
+            Student.objects.create(first_name=f'A{i}', last_name='Test', address='x', grade=self.grade)
+            Guardian.objects.create(first_name=f'G{i}', last_name='Test', phone_number='6900000000', address='x')
+        before = [self._queries(url) for url in urls]
+        for i in range(8):
+            Student.objects.create(first_name=f'B{i}', last_name='Test', address='x', grade=self.grade)
+            Guardian.objects.create(first_name=f'H{i}', last_name='Test', phone_number='6900000000', address='x')
+        self.assertEqual([self._queries(url) for url in urls], before)
+
+    def test_estimated_count(self):
+        Student.objects.create(first_name='A', last_name='Test', address='x', grade=self.grade)
+        with patch('People.pagination.estimated_row_count', return_value=ESTIMATED_COUNT_THRESHOLD + 5):
+            self.assertEqual(EstimatedCountPaginator(Student.objects.all(), 10).count, ESTIMATED_COUNT_THRESHOLD + 5)
+            # Filtered lists are counted exactly
+            self.assertEqual(EstimatedCountPaginator(Student.objects.filter(first_name='A'), 10).count, 1)
+        with patch('People.pagination.estimated_row_count', return_value=50):
+            self.assertEqual(EstimatedCountPaginator(Student.objects.all(), 10).count, 1)
+        # Only PostgreSQL keeps an estimate
+        self.assertIsNone(estimated_row_count(Student))
+
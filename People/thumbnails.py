@@ -0,0 +1,73 @@
+"""
+Student photo thumbnails.
+
+Uploaded photos are often full-size phone pictures, while the lists show them
+at 40-150px. After an upload a background task (``People.tasks``) renders
+square WebP and JPEG thumbnails in THUMBNAIL_SIZES, applying the EXIF
+orientation and then dropping all EXIF data. The generated paths are stored
+on ``Student.photo_thumbnails`` together with the photo they were made from,
+so a replaced photo never shows stale thumbnails.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+THUMBNAIL_SIZES = (64, 128, 320)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+THUMBNAIL_DIR = 'images/thumbs'
+
+
+def thumbnail_path(student, photo_name, size, fmt):
+    """
+    Thumbnails live in a folder per student, so photos with the same file
+    name (``photo.jpg``, ``photo.png``, ...) of different students never
+    share a thumbnail.
+    """
+    stem = os.path.splitext(os.path.basename(photo_name))[0]
+    ext = 'jpg' if fmt == 'jpeg' else fmt
+    return f'{THUMBNAIL_DIR}/{student.uuid}/{stem}-{size}.{ext}'
+
+
+def render_thumbnails(photo_file):
+    """
+    Yield ``(size, fmt, bytes)`` for every thumbnail of ``photo_file``.
+    The output carries no EXIF metadata.
+    """
+    with Image.open(photo_file) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+
+    for size in THUMBNAIL_SIZES:
+        thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        for fmt, (pil_format, options) in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            thumb.save(buffer, format=pil_format, **options)
+            yield size, fmt, buffer.getvalue()
+
+
+def generate_thumbnails(student):
+    """
+    Render and store thumbnails for ``student.photo`` and record them on the
+    student. Returns the stored mapping, or an empty dict without a photo.
+    """
+    if not student.photo:
+        return {}
+
+    photo_name = student.photo.name
+    paths = {fmt: {} for fmt in THUMBNAIL_FORMATS}
+    with student.photo.open('rb') as photo_file:
+        for size, fmt, content in render_thumbnails(photo_file):
+            path = thumbnail_path(student, photo_name, size, fmt)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            paths[fmt][str(size)] = default_storage.save(path, ContentFile(content))
+
+    thumbnails = {'source': photo_name, **paths}
+    # Only record the thumbnails if the photo was not replaced meanwhile.
+    type(student).objects.filter(pk=student.pk, photo=photo_name).update(photo_thumbnails=thumbnails)
+    return thumbnails
@@ -9,14 +9,20 @@ urlpatterns = [
     path('logout/', views.logout, name='logout'),
     path('scanner/', views.barcode_scanner, name='barcode_scanner'),
     path('check-attendance/', views.check_attendance, name='check_attendance'),
+    path('check-attendance/batch/', views.check_attendance_batch, name='check_attendance_batch'),
     path('students/', views.student_list, name='student_list'),
+    path('students/api/', views.student_list_api, name='student_list_api'),
     path('students/<int:student_id>/', views.student_detail, name='student_detail'),
     path('students/create/', views.create_student, name='create_student'),
     path('students/<int:student_id>/edit/', views.edit_student, name='edit_student'),
     path('students/<int:student_id>/update/', views.update_student, name='update_student'),
     path('students/<int:student_id>/delete/', views.delete_student, name='delete_student'),
     path('students/<int:student_id>/qr-code/', views.student_qr_code, name='student_qr_code'),
+    path('students/<uuid:student_uuid>/qr.<str:fmt>', views.student_qr_image, name='student_qr_image'),
     path('qr-codes/', views.generate_all_qr_codes, name='generate_all_qr_codes'),
+    path('qr-codes/export/', views.export_badges, name='export_badges'),
+    path('export/<str:dataset>/', views.export_data, name='export_data'),
+    path('search/', views.people_search, name='people_search'),
     path('guardians/', views.guardian_list, name='guardian_list'),
     path('guardians/create/', views.create_guardian, name='create_guardian'),
     path('guardians/<int:guardian_id>/edit/', views.edit_guardian, name='edit_guardian'),
@@ -1,16 +1,25 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, Http404
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST, condition
+from django.utils.cache import patch_cache_control
+from django.urls import reverse
+from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Q
 from datetime import datetime
 from .models import Student, Guardian
-from Class_related.models import Grade, Attendance
+from .pagination import keyset_page
+from .search import search, typeahead
+from .qr import QR_FORMATS, get_qr_code, qr_etag
+from .badges import stream_badge_pdf, stream_badge_zip
+from .exports import EXPORT_DATASETS, EXPORT_FORMATS, stream_export, streaming_response
+from Class_related.models import Grade
+from Class_related import checkin
 from Payments.models import PaymentPlan
-import qrcode
-from io import BytesIO
 import base64
+import json
 
 
 def login(request):
@@ -55,25 +64,71 @@ def logout(request):
     auth_logout(request)
     return redirect('people:login')
 
+STUDENT_PAGE_SIZE = 50
+STUDENT_MAX_PAGE_SIZE = 200
+
+# Sort options exposed to the student table, mapped to keyset orderings.
+STUDENT_SORT_OPTIONS = {
+    'name': ['last_name', 'first_name'],
+    '-name': ['-last_name', '-first_name'],
+    'joined': ['date_joined'],
+    '-joined': ['-date_joined'],
+    'student_id': ['student_id'],
+    '-student_id': ['-student_id'],
+}
+
+
+def _filter_students(params):
+    """
+    Apply the search and filter query parameters shared by the student
+    list page and its JSON endpoint.
+    """
+    students = Student.objects.select_related('grade')
+
+    students = search(students, params.get('search', ''))
+
+    grade_id = params.get('grade', '')
+    if grade_id == 'none':
+        students = students.filter(grade__isnull=True)
+    elif grade_id.isdigit():
+        students = students.filter(grade_id=grade_id)
+
+    active = params.get('active', '')
+    if active in ('1', '0'):
+        students = students.filter(active=active == '1')
+
+    school_year = params.get('school_year', '')
+    if school_year:
+        students = students.filter(school_year=school_year)
+
+    return students
+
+
+def _student_page(params):
+    """Return (students, next_cursor, sort) for the requested page."""
+    sort = params.get('sort', 'name')
+    if sort not in STUDENT_SORT_OPTIONS:
+        sort = 'name'
+    try:
+        page_size = min(int(params.get('page_size', STUDENT_PAGE_SIZE)), STUDENT_MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = STUDENT_PAGE_SIZE
+    page_size = max(page_size, 1)
+
+    students, next_cursor = keyset_page(
+        _filter_students(params),
+        STUDENT_SORT_OPTIONS[sort],
+        cursor=params.get('cursor'),
+        page_size=page_size,
+    )
+    return students, next_cursor, sort
+
+
 @login_required
 def student_list(request):
     """
     Display a list of students and handle the creation of new students.
     """
-    search_query = request.GET.get('search', '')
-    if search_query:
-        students = Student.objects.filter(
-            models.Q(first_name__icontains=search_query) |
-            models.Q(last_name__icontains=search_query) |
-            models.Q(phone_number__icontains=search_query)
-        )
-    else:
-        students = Student.objects.all()
-
-    grades = Grade.objects.all()
-    payment_plans = PaymentPlan.objects.all()
-    guardians = Guardian.objects.all()
-
     if request.method == "POST":
         form_data = request.POST
         first_name = form_data.get('first_name')
@@ -114,14 +169,53 @@ def student_list(request):
         student.guardians.set(selected_guardians)
         return redirect('people:student_list')
 
+    students, next_cursor, sort = _student_page(request.GET)
+    query_params = request.GET.copy()
+    query_params.pop('cursor', None)
+
     context = {
         'students': students,
-        'grades': grades,
-        'payment_plans': payment_plans,
-        'guardians': guardians
+        'next_cursor': next_cursor,
+        'sort': sort,
+        'query_string': query_params.urlencode(),
+        'school_years': Student.objects.exclude(school_year='').order_by('school_year')
+                                       .values_list('school_year', flat=True).distinct(),
+        'grades': Grade.objects.only('id', 'name'),
+        'payment_plans': PaymentPlan.objects.only('id', 'name'),
+        'guardians': Guardian.objects.only('id', 'first_name', 'last_name').order_by('last_name', 'first_name'),
     }
     return render(request, 'students.html', context)
 
+
+@login_required
+def student_list_api(request):
+    """
+    Return one keyset page of the student table as JSON, for infinite scroll.
+    """
+    students, next_cursor, sort = _student_page(request.GET)
+    rows = [
+        {
+            'id': student.id,
+            'student_id': student.student_id,
+            'first_name': student.first_name,
+            'last_name': student.last_name,
+            'active': student.active,
+            'grade': {'id': student.grade.id, 'name': student.grade.name} if student.grade else None,
+            'school': student.school,
+            'school_year': student.school_year,
+            'phone_number': student.phone_number,
+            'email': student.email,
+            'photo': student.photo.url if student.photo else None,
+        }
+        for student in students
+    ]
+    return JsonResponse({
+        'results': rows,
+        'html': render_to_string('student_rows.html', {'students': students}, request=request),
+        'next_cursor': next_cursor,
+        'sort': sort,
+    })
+
 @login_required
 def create_student(request):
     # This view is merged into student_list, but can be separated if needed
@@ -229,19 +323,8 @@ def guardian_list(request):
     """
     Display a list of guardians and handle the creation of new guardians.
     """
-    search_query = request.GET.get('search', '')
-    if search_query:
-        guardians = Guardian.objects.filter(
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(phone_number__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(profession__icontains=search_query)
-        )
-    else:
-        guardians = Guardian.objects.all()
-    
-    students = Student.objects.all()
+    guardians = search(Guardian.objects.all(), request.GET.get('search', ''))
+    students = Student.objects.only('id', 'first_name', 'last_name')
 
     if request.method == "POST":
         form_data = request.POST
@@ -275,6 +358,29 @@ def guardian_list(request):
     }
     return render(request, 'guardians.html', context)
 
+@login_required
+def people_search(request):
+    """
+    Typeahead endpoint: return the first matches for ``q`` among students
+    (default) or guardians (``kind=guardians``).
+    """
+    query = request.GET.get('q', '')
+    if request.GET.get('kind') == 'guardians':
+        queryset = Guardian.objects.only('id', 'first_name', 'last_name', 'phone_number')
+    else:
+        queryset = Student.objects.only('id', 'first_name', 'last_name', 'phone_number', 'student_id')
+
+    results = [
+        {
+            'id': obj.id,
+            'name': f'{obj.first_name} {obj.last_name}',
+            'phone_number': obj.phone_number,
+            'student_id': getattr(obj, 'student_id', None),
+        }
+        for obj in typeahead(queryset, query)
+    ] if query.strip() else []
+    return JsonResponse({'results': results})
+
 @login_required
 def create_guardian(request):
     # This view is merged into guardian_list, but can be separated if needed
@@ -335,6 +441,13 @@ def barcode_scanner(request):
     """
     return render(request, 'scanner.html')
 
+CHECK_IN_MESSAGES = {
+    checkin.MARKED_PRESENT: _('Attendance marked as present.'),
+    checkin.ALREADY_PRESENT: _('Student is already marked as present.'),
+    checkin.NO_OPEN_SHEET: _('No open attendance sheet for this student.'),
+    checkin.UNKNOWN_STUDENT: _('No match found.'),
+}
+
 def index(request):
     """
     Display the main index page with counts of students, grades, and payment plans.
@@ -353,55 +466,121 @@ def index(request):
 @login_required
 def check_attendance(request):
     """
-    Check student attendance based on a provided text input.
+    Mark the scanned student present on their open attendance sheet.
     """
     if request.method == "POST":
-        input_text = request.POST.get('text_input', '')
-        try:
-            student = Student.objects.get(uuid=input_text)
-            attendance, created = Attendance.objects.get_or_create(student=student)
-            attendance.present = True
-            attendance.save()
-            return JsonResponse({'match': True, 'message': _('Attendance marked as present.')})
-        except Student.DoesNotExist:
-            return JsonResponse({'match': False, 'message': _('No match found.')})
+        result = checkin.check_in(request.POST.get('text_input', ''))
+        data = result.as_dict()
+        data['message'] = CHECK_IN_MESSAGES[result.status]
+        return JsonResponse(data)
     return JsonResponse({'error': _('Invalid request method.')})
 
+@login_required
+@require_POST
+def check_attendance_batch(request):
+    """
+    Apply a JSON batch of queued scans: {"events": [{"uuid", "scanned_at", "device_id"}, ...]}.
+    """
+    try:
+        events = json.loads(request.body).get('events')
+    except (ValueError, AttributeError):
+        events = None
+    if not isinstance(events, list) or not all(isinstance(event, dict) for event in events):
+        return JsonResponse({'error': _('Expected a JSON object with an "events" list.')}, status=400)
+    if len(events) > checkin.MAX_BATCH_SIZE:
+        return JsonResponse({'error': _('Too many events in one batch.')}, status=400)
+
+    results = checkin.check_in_batch(events)
+    for result in results:
+        result['message'] = CHECK_IN_MESSAGES[result['status']]
+    return JsonResponse({'results': results})
+
 @login_required
 def student_qr_code(request, student_id):
     """
-    Generate and return QR code for a student.
+    Return the QR code for a student as a data URI plus its image URLs.
     """
     student = get_object_or_404(Student, id=student_id)
-    
-    # Create QR code with student's UUID
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(str(student.uuid))
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64 for embedding in HTML
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    
+    img_str = base64.b64encode(get_qr_code(student.uuid, 'png')).decode()
+
     return JsonResponse({
         'qr_code': f'data:image/png;base64,{img_str}',
+        'qr_code_url': reverse('people:student_qr_image', args=[student.uuid, 'png']),
+        'qr_code_svg_url': reverse('people:student_qr_image', args=[student.uuid, 'svg']),
         'student_name': f'{student.first_name} {student.last_name}',
         'student_id': student.id,
         'uuid': str(student.uuid)
     })
 
+QR_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+@login_required
+@condition(etag_func=lambda request, student_uuid, fmt: qr_etag(student_uuid, fmt))
+def student_qr_image(request, student_uuid, fmt):
+    """
+    Serve a student's stored QR code image. The image depends only on the
+    UUID, so it is sent with a permanent ETag and a one-year max-age.
+    """
+    if fmt not in QR_FORMATS:
+        raise Http404
+    get_object_or_404(Student.objects.only('id'), uuid=student_uuid)
+
+    response = HttpResponse(get_qr_code(student_uuid, fmt), content_type=QR_FORMATS[fmt])
+    patch_cache_control(response, private=True, max_age=QR_CACHE_MAX_AGE, immutable=True)
+    return response
+
 @login_required
 def generate_all_qr_codes(request):
     """
     View to display QR codes for all students.
     """
+    students = Student.objects.filter(active=True).select_related('grade').order_by('last_name', 'first_name')
+    grades = Grade.objects.only('id', 'name')
+    return render(request, 'qr_codes.html', {'students': students, 'grades': grades})
+
+@login_required
+def export_badges(request):
+    """
+    Stream printable badges for all active students, or one grade, as a
+    PDF of A4 sheets (default) or a ZIP of PNG images (``format=zip``).
+    """
     students = Student.objects.filter(active=True).order_by('last_name', 'first_name')
-    return render(request, 'qr_codes.html', {'students': students})
+    grade_id = request.GET.get('grade', '')
+    if grade_id:
+        if not grade_id.isdigit():
+            raise Http404
+        grade = get_object_or_404(Grade, id=grade_id)
+        students = students.filter(grade=grade)
+        filename = f'badges-{slugify(grade.name) or grade.id}'
+    else:
+        filename = 'badges'
+
+    badges = [
+        (str(student_uuid), f'{first_name} {last_name}', grade_name or '', student_id)
+        for student_uuid, first_name, last_name, grade_name, student_id in students.values_list(
+            'uuid', 'first_name', 'last_name', 'grade__name', 'student_id'
+        )
+    ]
+
+    if request.GET.get('format') == 'zip':
+        response = streaming_response(request, stream_badge_zip(badges), 'application/zip')
+        filename += '.zip'
+    else:
+        response = streaming_response(request, stream_badge_pdf(badges), 'application/pdf')
+        filename += '.pdf'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@login_required
+def export_data(request, dataset):
+    """
+    Stream a CSV (default) or XLSX (``format=xlsx``) export of students,
+    guardians, payments or receipts.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if dataset not in EXPORT_DATASETS or fmt not in EXPORT_FORMATS:
+        raise Http404
+
+    response = streaming_response(request, stream_export(dataset, fmt), EXPORT_FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}-{datetime.now():%Y-%m-%d}.{fmt}"'
+    return response
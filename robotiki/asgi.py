@@ -2,6 +2,9 @@
 ASGI config for robotiki project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The live attendance stream (``Class_related.views.attendance_stream``) needs
+the site to be served through this module, e.g.
+``gunicorn robotiki.asgi:application -k uvicorn.workers.UvicornWorker``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -139,6 +139,34 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Bulk badge export (People.badges): number of rendering processes
+# (0 = one per CPU, up to 4) and an optional TrueType font for names.
+BADGE_EXPORT_WORKERS = int(os.getenv('BADGE_EXPORT_WORKERS', '0'))
+BADGE_FONT_PATH = os.getenv('BADGE_FONT_PATH')
+
+# Attendance trigger API (Class_related.jobs): threads running queued jobs
+# in each web process. ATTENDANCE_JOBS_EAGER runs jobs on commit instead.
+ATTENDANCE_JOB_WORKERS = int(os.getenv('ATTENDANCE_JOB_WORKERS', '2'))
+ATTENDANCE_JOBS_EAGER = os.getenv('ATTENDANCE_JOBS_EAGER', 'False') == 'True'
+# Seconds after which a queued or running job counts as abandoned
+ATTENDANCE_JOB_TIMEOUT = int(os.getenv('ATTENDANCE_JOB_TIMEOUT', '1800'))
+
+# Cache (arrears, finance dashboard, scanner check-ins). The default
+# local-memory cache is per process, so invalidating it on save only reaches
+# the process that saved. Set CACHE_TABLE (and run createcachetable) to share
+# a database cache between the web processes and the worker.
+if os.getenv('CACHE_TABLE'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.getenv('CACHE_TABLE'),
+        }
+    }
+
+# Live attendance board (Class_related.live). Use
+# 'Class_related.live.PostgresBroker' when running several processes.
+ATTENDANCE_LIVE_BROKER = os.getenv('ATTENDANCE_LIVE_BROKER', 'Class_related.live.InProcessBroker')
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -16,6 +16,7 @@ urlpatterns = [
     # Direct API endpoints for external access (e.g., GitHub Actions)
     path('api/trigger-attendance-generation/', class_views.trigger_attendance_generation, name='api_trigger_attendance_generation'),
     path('api/trigger-attendance-autosave/', class_views.trigger_attendance_autosave, name='api_trigger_attendance_autosave'),
+    path('api/attendance-jobs/<uuid:job_id>/', class_views.attendance_job_status, name='api_attendance_job_status'),
     path('', index, name='index'),
 ]
 
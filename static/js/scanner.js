@@ -13,49 +13,140 @@ function getCookie(name) {
     return cookieValue;
 }
 
+const SCAN_QUEUE_STORAGE_KEY = 'scanQueue';
+const REJECTED_SCANS_STORAGE_KEY = 'scanQueueRejected';
+const SCANNER_DEVICE_ID_KEY = 'scannerDeviceId';
+const SCAN_FLUSH_INTERVAL_MS = 1000;
+const SCAN_BATCH_SIZE = 100;
+// The camera decodes the same code many times per second; ignore repeats.
+const DUPLICATE_SCAN_WINDOW_MS = 3000;
 
+function getScannerDeviceId() {
+    let deviceId = localStorage.getItem(SCANNER_DEVICE_ID_KEY);
+    if (!deviceId) {
+        deviceId = 'scanner-' + Math.random().toString(36).slice(2, 10);
+        localStorage.setItem(SCANNER_DEVICE_ID_KEY, deviceId);
+    }
+    return deviceId;
+}
+
+// Client errors that may succeed later; any other 4xx will fail again.
+const RETRYABLE_STATUSES = [408, 429];
+
+class ScanBatchError extends Error {
+    constructor(message, status, sessionExpired) {
+        super(message);
+        this.status = status;
+        this.sessionExpired = Boolean(sessionExpired);
+    }
+}
 
-function startScanner() {
-    const qrCodeSuccessCallback = (decodedText, decodedResult) => {
-        console.log(`QR Code detected: ${decodedText}`);
-        
-        const csrftoken = getCookie('csrftoken');
-        console.log('CSRF Token:', csrftoken); 
+/*
+ * Queue of decoded scans, kept in localStorage and posted to the batch
+ * endpoint every second or as soon as the browser comes back online.
+ * Scans are only removed from the queue once the server has answered, so
+ * nothing is lost while the classroom Wi-Fi is down. Network errors and
+ * server errors (5xx) are retried; a batch the server rejects (other 4xx,
+ * e.g. malformed events) is moved aside to localStorage so it doesn't
+ * block the scans behind it, and reported through onError.
+ * An expired session isn't a 4xx: login_required redirects to the HTML
+ * login page, which fetch follows. The queue then stops uploading, keeps
+ * its scans for after the next login and reports through onSessionExpired.
+ */
+class ScanQueue {
+    constructor(url, onResults, onChange, onError, onSessionExpired) {
+        this.url = url;
+        this.onResults = onResults || function() {};
+        this.onChange = onChange || function() {};
+        this.onError = onError || function() {};
+        this.onSessionExpired = onSessionExpired || function() {};
+        this.paused = false;
+        this.deviceId = getScannerDeviceId();
+        this.events = JSON.parse(localStorage.getItem(SCAN_QUEUE_STORAGE_KEY) || '[]');
+        this.lastSeen = {};
+        this.flushing = false;
 
-        fetch('/people/check-attendance/', {
+        setInterval(() => this.flush(), SCAN_FLUSH_INTERVAL_MS);
+        window.addEventListener('online', () => this.flush());
+        this.onChange(this.events.length);
+    }
+
+    add(uuid) {
+        const now = Date.now();
+        if (this.lastSeen[uuid] && now - this.lastSeen[uuid] < DUPLICATE_SCAN_WINDOW_MS) {
+            return false;
+        }
+        this.lastSeen[uuid] = now;
+        this.events.push({
+            uuid: uuid,
+            scanned_at: new Date(now).toISOString(),
+            device_id: this.deviceId
+        });
+        this.save();
+        return true;
+    }
+
+    save() {
+        localStorage.setItem(SCAN_QUEUE_STORAGE_KEY, JSON.stringify(this.events));
+        this.onChange(this.events.length);
+    }
+
+    reject(batch, error) {
+        const rejected = JSON.parse(localStorage.getItem(REJECTED_SCANS_STORAGE_KEY) || '[]');
+        localStorage.setItem(REJECTED_SCANS_STORAGE_KEY, JSON.stringify(rejected.concat(batch)));
+        this.events.splice(0, batch.length);
+        this.save();
+        this.onError(error.message, batch);
+    }
+
+    flush() {
+        if (this.paused || this.flushing || this.events.length === 0 || !navigator.onLine) {
+            return;
+        }
+        const batch = this.events.slice(0, SCAN_BATCH_SIZE);
+        this.flushing = true;
+
+        fetch(this.url, {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'X-CSRFToken': csrftoken, 
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCookie('csrftoken')
             },
             credentials: 'same-origin',
-            body: new URLSearchParams({
-                'text_input': decodedText
-            })
+            body: JSON.stringify({events: batch})
+        })
+        .then(response => {
+            const isJson = (response.headers.get('Content-Type') || '').includes('application/json');
+            if (response.redirected || (response.ok && !isJson)) {
+                throw new ScanBatchError('Your session has expired', response.status, true);
+            }
+            if (response.ok) {
+                return response.json();
+            }
+            return response.json()
+                .catch(() => ({}))
+                .then(data => {
+                    throw new ScanBatchError(data.error || `Batch rejected with status ${response.status}`, response.status);
+                });
         })
-        .then(response => response.json())
         .then(data => {
-            if (data.match) {
-                alert(data.message);
+            this.events.splice(0, batch.length);
+            this.save();
+            this.onResults(data.results);
+        })
+        .catch(error => {
+            const status = error.status || 0;
+            if (error.sessionExpired) {
+                this.paused = true;
+                this.onSessionExpired(error.message, this.events.length);
+            } else if (status >= 400 && status < 500 && !RETRYABLE_STATUSES.includes(status)) {
+                this.reject(batch, error);
             } else {
-                alert('No match found.');
+                console.error('Scan upload failed, will retry:', error);
             }
         })
-        .catch(error => console.error('Error:', error));
-    };
-
-    const html5QrCode = new Html5Qrcode("reader");
-
-    html5QrCode.start(
-        { facingMode: "environment" }, 
-        {
-            fps: 10, 
-            qrbox: { width: 120, height: 120 }
-        },
-        qrCodeSuccessCallback
-    ).catch(err => {
-        console.error(`Unable to start scanning, error: ${err}`);
-    });
+        .finally(() => {
+            this.flushing = false;
+        });
+    }
 }
-
-window.addEventListener('load', startScanner);